@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Integrated Gradients varyantlarının CPU karşılaştırması (süre + tepe RSS).
+    Her varyant ayrı bir süreçte çalışır; tepe RSS o sürecin ru_maxrss değeridir.
+EN: CPU comparison of Integrated Gradients variants (wall clock + peak RSS).
+    Each variant runs in a fresh process; peak RSS is that process's ru_maxrss.
+
+Örnek / Example:
+    python bench_ig.py --model unet++ --img_size 256 --batch_size 2 --chunks 1 10 50 --out_json runs/bench_ig.json
+"""
+from __future__ import annotations
+import argparse, json, time
+from pathlib import Path
+from benchmark import peak_rss_mb, run_in_process
+
+def _run_variant(cfg: dict, q) -> None:
+    import torch
+    from models import build_model
+    from xai import integrated_gradients_map, layer_integrated_gradients_map
+    torch.set_num_threads(cfg["threads"]); torch.manual_seed(0)
+    model = build_model(cfg["model"], num_classes=2, encoder_weights=None).eval()
+    x = torch.rand(cfg["batch_size"], 3, cfg["img_size"], cfg["img_size"])
+    rss0 = peak_rss_mb()
+    times = []
+    for _ in range(cfg["repeats"]):
+        t0 = time.perf_counter()
+        if cfg["variant"] == "layer":
+            layer_integrated_gradients_map(model, x, 1, steps=cfg["steps"], layer=cfg["layer"],
+                                           chunk_steps=cfg["chunk"], as_float=True)
+        else:
+            integrated_gradients_map(model, x, 1, steps=cfg["steps"], chunk_steps=cfg["chunk"], as_float=True)
+        times.append(time.perf_counter() - t0)
+    q.put({"variant": cfg["name"], "seconds": min(times), "seconds_all": times,
+           "rss_before_mb": rss0, "peak_rss_mb": peak_rss_mb()})
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", type=str, default="unet++", choices=["unet++","deeplabv3+","pspnet"])
+    ap.add_argument("--img_size", type=int, default=256)
+    ap.add_argument("--batch_size", type=int, default=2)
+    ap.add_argument("--steps", type=int, default=50)
+    ap.add_argument("--chunks", type=int, nargs="+", default=[1, 10, 50],
+                    help="TR: Geçiş başına adım sayıları (1 = mevcut davranış, her zaman referans olarak çalışır) | "
+                         "EN: Steps per pass (1 = current behaviour, always run as the speedup reference)")
+    ap.add_argument("--layer", type=str, default="encoder.layer1")
+    ap.add_argument("--repeats", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--case_timeout", type=float, default=3600,
+                    help="TR: Varyant başına süre sınırı (sn) | EN: Per-variant time limit in seconds (0 = none)")
+    ap.add_argument("--out_json", type=str, default=None)
+    args = ap.parse_args()
+
+    base = dict(model=args.model, img_size=args.img_size, batch_size=args.batch_size, steps=args.steps,
+                layer=args.layer, repeats=args.repeats, threads=args.threads)
+    chunks = [1] + [c for c in dict.fromkeys(args.chunks) if c != 1]   # chunk 1 (current behaviour) is the reference
+    variants = [dict(base, name=f"ig_chunk{c}", variant="ig", chunk=c) for c in chunks]
+    variants.append(dict(base, name=f"layer_ig_chunk{max(chunks)}", variant="layer", chunk=max(chunks)))
+
+    rows = []
+    for cfg in variants:
+        row = dict({"variant": cfg["name"]}, **run_in_process(_run_variant, cfg, args.case_timeout or None))
+        rows.append(row)
+        if "error" in row:
+            print(f"{row['variant']:>20s} | FAILED: {row['error']}"); continue
+        print(f"{row['variant']:>20s} | {row['seconds']:8.2f} s | peak RSS {row['peak_rss_mb']:8.1f} MB "
+              f"(+{row['peak_rss_mb']-row['rss_before_mb']:.1f} MB)")
+
+    ref = next(r for r in rows if r["variant"] == "ig_chunk1").get("seconds")
+    for r in rows:
+        if ref is not None and "error" not in r: r["speedup_vs_current"] = ref / max(r["seconds"], 1e-9)
+    if args.out_json:
+        Path(args.out_json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out_json).write_text(json.dumps({"config": base, "results": rows}, indent=2))
+        print("Saved:", args.out_json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Sıcak yollar için kıyaslama paketi (gerçek veri veya önceden eğitilmiş ağırlık gerektirmez).
+    - Sentetik SPOT6/7 ve MAXAR_İzmir benzeri karolar + bina maskeleri geçici klasöre yazılır.
+    - Ölçülenler: SegDataset yükleme (çözümleme / önbellek), model başına bir train.py adımı,
+      her xai_dispatch yöntemi, compute_all_metrics içindeki her metrik.
+    - Her durum ayrı bir süreçte çalışır; rapor: verim, gecikme yüzdelikleri (p50/p90/p99), tepe bellek (JSON).
+    - --baseline ile önceki bir rapora karşı karşılaştırılır; tolerans aşılırsa çıkış kodu 1.
+EN: Benchmark suite for the hot paths (needs no real data or pretrained weights).
+    - Synthetic SPOT6/7- and MAXAR_İzmir-like tiles + building masks are written to a temp dir.
+    - Timed: SegDataset loading (decode / cache), one train.py step per model, every xai_dispatch
+      method, every metric in compute_all_metrics.
+    - Each case runs in its own process; report: throughput, latency percentiles (p50/p90/p99), peak memory (JSON).
+    - With --baseline the run is compared against an earlier report; exit code 1 beyond the tolerance.
+
+Örnek / Example:
+    python benchmark.py --out_json runs/bench.json
+    python benchmark.py --img_size 256 --baseline runs/bench.json --tolerance 0.15 --out_json runs/bench_new.json
+"""
+from __future__ import annotations
+import argparse, json, queue, resource, sys, tempfile, time
+import multiprocessing as mp
+from typing import Optional
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+
+MODELS = ["unet++", "deeplabv3+", "pspnet"]
+XAI_METHODS = ["saliency", "ig", "layer_ig", "gradshap"]
+# TR: Sentetik veri profilleri | EN: Synthetic data profiles (buildings per tile, size range in px at 512, blur)
+PROFILES = {
+    "spot67":      dict(buildings=(4, 12),  size=(10, 40), blur=5),   # 1.5 m (≈0.5 m pansharpened): small, sparse
+    "maxar_izmir": dict(buildings=(15, 40), size=(15, 70), blur=1),   # 0.3 m: dense, sharp urban blocks
+}
+
+def peak_rss_mb() -> float:
+    """TR: Sürecin tepe RSS'i (MB) | EN: Peak RSS of this process (MB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0   # Linux: KiB
+
+def run_in_process(target, cfg: dict, timeout: Optional[float]=None) -> dict:
+    """
+    TR: target(cfg, q)'yu yeni (spawn) bir süreçte çalıştırır ve kuyruğa koyduğu satırı döndürür
+        (tepe RSS yalnız o duruma ait olur). Süreç satır koymadan ölürse (OOM-kill, segfault) veya
+        timeout saniyeyi aşarsa {"error": ...} döner; çalıştırma askıda kalmaz. bench_ig.py de kullanır.
+    EN: Runs target(cfg, q) in a fresh (spawned) process and returns the row it puts on the queue
+        (so peak RSS belongs to that case alone). If the process dies without a row (OOM kill,
+        segfault) or exceeds timeout seconds, returns {"error": ...} instead of hanging. Also used by bench_ig.py.
+    """
+    ctx = mp.get_context("spawn")
+    q = ctx.Queue()
+    p = ctx.Process(target=target, args=(cfg, q)); p.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            row = q.get(timeout=1.0); break
+        except queue.Empty:
+            if not p.is_alive():
+                try:                                  # the row may have landed just before exit
+                    row = q.get(timeout=1.0); break
+                except queue.Empty:
+                    p.join()
+                    code = p.exitcode
+                    why = f"killed by signal {-code}" if code is not None and code < 0 else f"exit code {code}"
+                    return {"error": f"process died without a result ({why})"}
+            if deadline is not None and time.monotonic() > deadline:
+                p.kill(); p.join()
+                return {"error": f"timed out after {timeout:.0f} s"}
+    p.join()
+    return row
+
+# ------------------------ Synthetic data ------------------------ #
+def synth_dataset(root: Path, name: str, n: int, size: int, seed: int=0) -> Path:
+    """
+    TR: {root}/{name}/images|masks/*.png altına sentetik karo + maske yazar.
+    EN: Writes synthetic tiles + masks under {root}/{name}/images|masks/*.png.
+    """
+    import cv2
+    prof = PROFILES[name]; rng = np.random.default_rng(seed)
+    d = Path(root)/name; (d/"images").mkdir(parents=True, exist_ok=True); (d/"masks").mkdir(exist_ok=True)
+    scale = size / 512
+    for i in range(n):
+        ground = rng.integers(60, 140, size=3)
+        img = (ground + rng.normal(0, 18, (size, size, 3))).clip(0, 255).astype(np.uint8)
+        if prof["blur"] > 1: img = cv2.GaussianBlur(img, (prof["blur"], prof["blur"]), 0)
+        msk = np.zeros((size, size), np.uint8)
+        for _ in range(int(rng.integers(*prof["buildings"]))):
+            w, h = (rng.integers(*prof["size"], size=2) * scale).astype(int) + 2
+            cx, cy = rng.integers(0, size, size=2)
+            box = cv2.boxPoints(((float(cx), float(cy)), (float(w), float(h)), float(rng.uniform(0, 90)))).astype(np.int32)
+            cv2.fillPoly(msk, [box], 1)
+            cv2.fillPoly(img, [box], tuple(int(v) for v in rng.integers(150, 240, size=3)))
+        cv2.imwrite(str(d/"images"/f"{name}_{i:04d}.png"), cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+        cv2.imwrite(str(d/"masks"/f"{name}_{i:04d}.png"), msk)
+    return d
+
+# ------------------------ Cases (child process) ------------------------ #
+def _timeit(fn, iters: int, warmup: int, sync=None) -> List[float]:
+    for _ in range(warmup): fn()
+    if sync: sync()
+    out = []
+    for _ in range(iters):
+        t0 = time.perf_counter(); fn()
+        if sync: sync()
+        out.append(time.perf_counter() - t0)
+    return out
+
+def _case_dataset(cfg: dict):
+    from dataset import SegDataset
+    ds = SegDataset(cfg["data"], size=cfg["img_size"], cache_dir=cfg.get("cache_dir"))
+    idx = iter(range(10**9))
+    def step(): ds[next(idx) % len(ds)]
+    return _timeit(step, cfg["iters"] * 4, cfg["warmup"]), 1
+
+def _case_train(cfg: dict):
+    import torch
+    from models import build_model
+    from train import CEDiceLoss
+    dev = cfg["device"]; b, s = cfg["batch_size"], cfg["img_size"]
+    model = build_model(cfg["model"], num_classes=2, encoder_weights=None).to(dev).train()
+    opt = torch.optim.AdamW(model.parameters(), lr=1e-3); crit = CEDiceLoss()
+    x = torch.rand(b, 3, s, s, device=dev); y = (torch.rand(b, s, s, device=dev) > 0.8).long()
+    def step():
+        loss = crit(model(x), y); loss.backward(); opt.step(); opt.zero_grad(set_to_none=True)
+    return _timeit(step, cfg["iters"], cfg["warmup"], _sync(dev)), b
+
+def _case_xai(cfg: dict):
+    import torch
+    from models import build_model
+    from xai import xai_dispatch
+    dev = cfg["device"]; b, s = cfg["batch_size"], cfg["img_size"]
+    model = build_model(cfg["model"], num_classes=2, encoder_weights=None).to(dev).eval()
+    x = torch.rand(b, 3, s, s, device=dev)
+    kw = {"ig": dict(steps=cfg["ig_steps"], chunk_steps=None), "layer_ig": dict(steps=cfg["ig_steps"]),
+          "gradshap": dict(nsamples=cfg["gs_samples"], seed=0)}.get(cfg["method"], {})
+    def step(): xai_dispatch(cfg["method"], model, x, target_class=1, as_float=True, **kw)
+    return _timeit(step, cfg["iters"], cfg["warmup"], _sync(dev)), b
+
+def _case_metric(cfg: dict):
+    import torch
+    from models import build_model
+    from xai import xai_dispatch
+    from xai_metrics import compute_all_metrics
+    dev = cfg["device"]; b, s = cfg["batch_size"], cfg["img_size"]
+    model = build_model(cfg["model"], num_classes=2, encoder_weights=None).to(dev).eval()
+    x = torch.rand(b, 3, s, s, device=dev); y = (torch.rand(b, 1, s, s, device=dev) > 0.8).long()
+    a = xai_dispatch("saliency", model, x, target_class=1)
+    def step(): compute_all_metrics(model, x, y, a, target_class=1, metrics=[cfg["metric"]],
+                                    method="saliency")
+    return _timeit(step, cfg["iters"], min(cfg["warmup"], 1), _sync(dev)), b
+
+def _sync(device: str):
+    import torch
+    return torch.cuda.synchronize if str(device).startswith("cuda") else None
+
+CASES = {"dataset": _case_dataset, "train_step": _case_train, "xai": _case_xai, "metric": _case_metric}
+
+def _run_case(cfg: dict, q) -> None:
+    import torch
+    torch.set_num_threads(cfg["threads"]); torch.manual_seed(0)
+    try:
+        times, items = CASES[cfg["kind"]](cfg)
+    except Exception as e:  # keep the suite going; the case is reported as failed
+        q.put({"case": cfg["name"], "error": f"{type(e).__name__}: {e}"}); return
+    t = np.asarray(times) * 1000.0
+    row = {"case": cfg["name"], "iters": len(times), "items_per_iter": items,
+           "mean_ms": float(t.mean()), "p50_ms": float(np.percentile(t, 50)),
+           "p90_ms": float(np.percentile(t, 90)), "p99_ms": float(np.percentile(t, 99)),
+           "throughput": items * len(times) / max(1e-9, float(t.sum()) / 1000.0),
+           "peak_rss_mb": peak_rss_mb()}
+    if torch.cuda.is_available() and str(cfg["device"]).startswith("cuda"):
+        row["cuda_peak_mb"] = torch.cuda.max_memory_allocated() / 2**20
+    q.put(row)
+
+# ------------------------ Baseline comparison ------------------------ #
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], tolerance: float, mem_tolerance: float) -> List[dict]:
+    """
+    TR: Ortak durumlarda p50 gecikme, verim ve tepe RSS'i karşılaştırır; tolerans dışındakileri döndürür.
+    EN: Compares p50 latency, throughput and peak RSS on shared cases; returns those beyond tolerance.
+    """
+    bad = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if not base or "error" in cur or "error" in base: continue
+        checks = [("p50_ms", cur["p50_ms"] / max(base["p50_ms"], 1e-9) - 1, tolerance),
+                  ("throughput", base["throughput"] / max(cur["throughput"], 1e-9) - 1, tolerance),
+                  ("peak_rss_mb", cur["peak_rss_mb"] / max(base["peak_rss_mb"], 1e-9) - 1, mem_tolerance)]
+        for field, worse, tol in checks:
+            if worse > tol:
+                bad.append({"case": name, "field": field, "baseline": base[field], "current": cur[field],
+                            "change": worse})
+    return bad
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--datasets", type=str, nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    ap.add_argument("--n_tiles", type=int, default=32)
+    ap.add_argument("--img_size", type=int, default=512)
+    ap.add_argument("--models", type=str, nargs="+", default=MODELS, choices=MODELS)
+    ap.add_argument("--xai_methods", type=str, nargs="+", default=XAI_METHODS, choices=XAI_METHODS)
+    ap.add_argument("--xai_model", type=str, default="unet++", choices=MODELS,
+                    help="TR: XAI ve metrik durumları için model | EN: Model for the XAI and metric cases")
+    ap.add_argument("--metrics", type=str, default="all", help="TR: Metrik adları/presetler | EN: Metric names/presets")
+    ap.add_argument("--skip", type=str, nargs="*", default=[], choices=list(CASES),
+                    help="TR: Atlanacak durum türleri | EN: Case kinds to skip")
+    ap.add_argument("--batch_size", type=int, default=2)
+    ap.add_argument("--iters", type=int, default=5)
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--ig_steps", type=int, default=16)
+    ap.add_argument("--gs_samples", type=int, default=8)
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--device", type=str, default="cpu")
+    ap.add_argument("--baseline", type=str, default=None, help="TR: Önceki rapor (JSON) | EN: Earlier report (JSON)")
+    ap.add_argument("--tolerance", type=float, default=0.15,
+                    help="TR: İzin verilen göreli yavaşlama | EN: Allowed relative slowdown")
+    ap.add_argument("--mem_tolerance", type=float, default=0.10,
+                    help="TR: İzin verilen göreli bellek artışı | EN: Allowed relative memory growth")
+    ap.add_argument("--case_timeout", type=float, default=3600,
+                    help="TR: Durum başına süre sınırı (sn) | EN: Per-case time limit in seconds (0 = none)")
+    ap.add_argument("--out_json", type=str, default=None)
+    args = ap.parse_args()
+
+    base = dict(img_size=args.img_size, batch_size=args.batch_size, iters=args.iters, warmup=args.warmup,
+                ig_steps=args.ig_steps, gs_samples=args.gs_samples, threads=args.threads, device=args.device)
+    rows: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory(prefix="bfxai_bench_") as tmp:
+        cases = []
+        if "dataset" not in args.skip:
+            for name in args.datasets:
+                data = synth_dataset(Path(tmp), name, args.n_tiles, args.img_size)
+                cases.append(dict(base, kind="dataset", name=f"dataset/{name}/decode", data=str(data)))
+                cases.append(dict(base, kind="dataset", name=f"dataset/{name}/cached", data=str(data),
+                                  cache_dir=str(Path(tmp)/"cache")))
+        if "train_step" not in args.skip:
+            cases += [dict(base, kind="train_step", name=f"train_step/{m}", model=m) for m in args.models]
+        if "xai" not in args.skip:
+            cases += [dict(base, kind="xai", name=f"xai/{x}", model=args.xai_model, method=x) for x in args.xai_methods]
+        if "metric" not in args.skip:
+            from xai_metrics import resolve_metrics
+            cases += [dict(base, kind="metric", name=f"metric/{n}", model=args.xai_model, metric=n)
+                      for n in resolve_metrics(args.metrics)]
+        for cfg in cases:
+            row = dict({"case": cfg["name"]}, **run_in_process(_run_case, cfg, args.case_timeout or None))
+            rows[row["case"]] = row
+            if "error" in row:
+                print(f"{row['case']:>32s} | FAILED: {row['error']}")
+            else:
+                print(f"{row['case']:>32s} | p50 {row['p50_ms']:9.1f} ms | p90 {row['p90_ms']:9.1f} ms | "
+                      f"p99 {row['p99_ms']:9.1f} ms | {row['throughput']:8.2f} items/s | peak RSS {row['peak_rss_mb']:8.1f} MB")
+
+    report = {"config": dict(base, datasets=args.datasets, n_tiles=args.n_tiles, models=args.models,
+                             xai_model=args.xai_model, python=sys.version.split()[0]),
+              "results": rows}
+    regressions = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("config", {}).get("img_size") != args.img_size:
+            print("Warning: baseline was recorded with a different --img_size")
+        regressions = compare(rows, baseline.get("results", {}), args.tolerance, args.mem_tolerance)
+        report["baseline"] = {"path": args.baseline, "tolerance": args.tolerance,
+                              "mem_tolerance": args.mem_tolerance, "regressions": regressions}
+        for r in regressions:
+            print(f"REGRESSION {r['case']} {r['field']}: {r['baseline']:.2f} -> {r['current']:.2f} ({100*r['change']:+.1f}%)")
+    if args.out_json:
+        Path(args.out_json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out_json).write_text(json.dumps(report, indent=2))
+        print("Saved:", args.out_json)
+    if regressions:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
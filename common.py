@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """
-TR: Ortak yardımcılar (kayıt, seed, yol işlemleri)
-EN: Common utilities (logging, seeding, path helpers)
+TR: Ortak yardımcılar (kayıt, seed, yol işlemleri, karışıklık matrisi metrikleri)
+EN: Common utilities (logging, seeding, path helpers, confusion-matrix metrics)
 """
 from __future__ import annotations
 import os, random, logging
@@ -9,10 +9,17 @@ from pathlib import Path
 from typing import Iterable, Tuple, List
 import numpy as np
 import torch
+import instrument as _inst
 
-def setup_logging(level=logging.INFO) -> None:
-    """TR: Basit logging ayarı | EN: Simple logging config"""
+def setup_logging(level=logging.INFO, instrument: bool=False, trace: str | Path | None=None,
+                  trace_kind: str="chrome") -> None:
+    """
+    TR: Basit logging ayarı; instrument=True span/sayaç toplamayı açar (özet: instrument.finish()).
+    EN: Simple logging config; instrument=True turns on span/counter collection (summary: instrument.finish()).
+    """
     logging.basicConfig(format="%(asctime)s | %(levelname)s | %(message)s", level=level)
+    if instrument or trace:
+        _inst.enable(trace, trace_kind)
 
 def ensure_dir(p: str | Path) -> Path:
     """TR: Klasörü oluştur (varsa dokunma) | EN: Create directory if missing"""
@@ -22,13 +29,44 @@ def set_seed(seed: int = 42) -> None:
     """TR: Tekrarlanabilirlik için seed | EN: Seed for reproducibility"""
     random.seed(seed); np.random.seed(seed); torch.manual_seed(seed); torch.cuda.manual_seed_all(seed)
 
+def get_rng_state() -> dict:
+    """TR: set_seed'in kapsadığı tüm RNG durumları | EN: All RNG states covered by set_seed"""
+    state = {"python": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()}
+    if torch.cuda.is_available(): state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+def set_rng_state(state: dict) -> None:
+    """TR: get_rng_state çıktısını geri yükler | EN: Restores a get_rng_state snapshot"""
+    random.setstate(state["python"]); np.random.set_state(state["numpy"]); torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available() and len(state["cuda"]) == torch.cuda.device_count():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+def save_checkpoint(path: str | Path, state: dict) -> Path:
+    """
+    TR: Eğitim durumunu atomik yazar (geçici dosya + os.replace; yarıda kesilirse eski dosya kalır).
+    EN: Writes the training state atomically (temp file + os.replace; an interrupted write keeps the old file).
+    """
+    path = Path(path); path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    torch.save(state, tmp)
+    os.replace(tmp, path)
+    return path
+
+def load_checkpoint(path: str | Path, map_location="cpu") -> dict:
+    """TR: save_checkpoint ile yazılan durumu okur | EN: Reads a state written by save_checkpoint"""
+    return torch.load(path, map_location=map_location, weights_only=False)
+
 def to_device(batch, device: str):
     """TR: Batch'i cihaza taşı | EN: Move batch to device"""
     if isinstance(batch, (list, tuple)):
         return [to_device(x, device) for x in batch]
     if isinstance(batch, dict):
         return {k: to_device(v, device) for k, v in batch.items()}
-    return batch.to(device) if hasattr(batch, "to") else batch
+    if not hasattr(batch, "to"): return batch
+    if _inst.enabled() and getattr(batch, "device", None) is not None \
+            and batch.device.type == "cpu" and torch.device(device).type != "cpu":
+        _inst.count("bytes_to_device", _inst.tensor_bytes(batch))
+    return batch.to(device)
 
 def dice_coefficient(pred: torch.Tensor, target: torch.Tensor, eps: float=1e-7) -> torch.Tensor:
     """
@@ -46,6 +84,54 @@ def one_hot(mask: torch.Tensor, num_classes: int) -> torch.Tensor:
     oh = torch.zeros(b, num_classes, h, w, device=mask.device, dtype=torch.float32)
     return oh.scatter_(1, mask.long(), 1.0) if mask.shape[1] != num_classes else mask
 
+def binary_metrics_from_conf(tp, fp, tn, fn, eps: float=1e-7):
+    """
+    TR: Recall, Precision, Accuracy, Dice ve IoU hesapla.
+    EN: Compute Recall, Precision, Accuracy, Dice and IoU.
+    """
+    recall = tp / (tp + fn + eps)
+    precision = tp / (tp + fp + eps)
+    accuracy = (tp + tn) / (tp + tn + fp + fn + eps)
+    dice = (2*tp) / (2*tp + fp + fn + eps)
+    iou = tp / (tp + fp + fn + eps)
+    return dict(recall=recall, precision=precision, accuracy=accuracy, dice=dice, iou=iou)
+
+class ConfusionMeter:
+    """
+    TR: Cihaz üzerinde C×C karışıklık matrisi (satır=hedef, sütun=tahmin). Her batch tek bir
+        bincount ile güncellenir; host'a epoch başına bir kez okunur. Tüm val metrikleri buradan.
+    EN: On-device C×C confusion matrix (row=target, col=prediction). Each batch is a single
+        bincount; read back to the host once per epoch. Every val metric derives from it.
+    """
+    def __init__(self, num_classes: int, device: str | torch.device = "cpu"):
+        self.num_classes = num_classes
+        # one extra bin collects ignored pixels so no boolean indexing (host sync) is needed
+        self.mat = torch.zeros(num_classes * num_classes + 1, dtype=torch.long, device=device)
+
+    def reset(self) -> None:
+        self.mat.zero_()
+
+    @torch.no_grad()
+    def update(self, pred: torch.Tensor, target: torch.Tensor) -> None:
+        # pred/target: [B,1,H,W] or [B,H,W] class ids; out-of-range targets (e.g. 255) are ignored
+        c = self.num_classes
+        p = pred.reshape(-1).long(); t = target.reshape(-1).long()
+        idx = torch.where((t >= 0) & (t < c), t * c + p, torch.full_like(t, c * c))
+        # bincount as index_add_: torch.bincount needs input.max() on the host, index_add_ does not
+        self.mat.index_add_(0, idx, torch.ones_like(idx))
+
+    def compute(self, fg_class: int = 1, eps: float = 1e-7) -> dict:
+        """TR: mIoU + ön-plan metrikleri (tek host senkronu) | EN: mIoU + foreground metrics (single host sync)"""
+        m = self.mat[:-1].view(self.num_classes, self.num_classes).cpu().double()
+        tp_c = m.diag()
+        union_c = m.sum(0) + m.sum(1) - tp_c
+        miou = ((tp_c + eps) / (union_c + eps)).mean().item()
+        tp = m[fg_class, fg_class].item()
+        fn = m[fg_class].sum().item() - tp
+        fp = m[:, fg_class].sum().item() - tp
+        tn = m.sum().item() - tp - fn - fp
+        return dict(miou=miou, **binary_metrics_from_conf(tp, fp, tn, fn, eps))
+
 def save_gray_png(path: Path, arr: np.ndarray) -> None:
     """TR: Gri PNG kaydet | EN: Save grayscale PNG"""
     import cv2
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Asenkron, önceden yüklemeli veri hattı (make_dataset(..., as_uint8=True) ile).
+    - İşçiler yalnız uint8 tensör gönderir; float dönüşümü, ölçekleme ve artırma ana süreçte,
+      hedef cihazda tüm batch üzerinde yapılır.
+    - Artırma: örnek başına rastgele yatay/dikey çevirme + transpoz (birlikte 8 dihedral dönüşüm,
+      yani tüm 90° döndürmeler); torch.where ile vektörize, görüntü ve maskeye aynı dönüşüm.
+    - Aşama süreleri: girdi bekleme (loader), cihaza kopya + artırma, hesaplama.
+EN: Asynchronous prefetching data pipeline (use with make_dataset(..., as_uint8=True)).
+    - Workers only ship uint8 tensors; float conversion, scaling and augmentation happen in the
+      main process, on the target device, over the whole batch.
+    - Augmentation: per-sample random horizontal/vertical flip + transpose (together the 8 dihedral
+      transforms, i.e. every 90° rotation); vectorized with torch.where, same transform on image and mask.
+    - Stage timing: input wait (loader), host-to-device copy + augmentation, compute.
+"""
+from __future__ import annotations
+import time
+from typing import Dict, Iterator, Optional, Sequence
+import torch
+from torch.utils.data import DataLoader, Dataset
+import instrument
+
+def make_loader(ds: Dataset, batch_size: int, *, shuffle: bool=False, workers: int=4, prefetch: int=2,
+                persistent: bool=True, pin_memory: bool=True, drop_last: bool=False) -> DataLoader:
+    """
+    TR: İşçi sayısı, önceden yükleme derinliği (işçi başına batch) ve kalıcı işçiler ayarlanabilir DataLoader.
+    EN: DataLoader with configurable worker count, prefetch depth (batches per worker) and persistent workers.
+    """
+    kw = dict(num_workers=workers, pin_memory=pin_memory, drop_last=drop_last)
+    if workers > 0:
+        kw.update(prefetch_factor=max(1, prefetch), persistent_workers=persistent)
+    return DataLoader(ds, batch_size=batch_size, shuffle=shuffle, **kw)
+
+class BatchPipeline:
+    """
+    TR: uint8 batch -> cihaz, float [0,1] (opsiyonel mean/std), opsiyonel dihedral artırma.
+        Float batch'ler de kabul edilir (zaten ölçeklenmiş sayılır).
+    EN: uint8 batch -> device, float [0,1] (optional mean/std), optional dihedral augmentation.
+        Float batches are accepted too (assumed already scaled).
+    """
+    def __init__(self, device: str | torch.device, augment: bool=False, channels_last: bool=False,
+                 mean: Optional[Sequence[float]]=None, std: Optional[Sequence[float]]=None,
+                 seed: Optional[int]=None):
+        self.device = torch.device(device)
+        self.augment = augment
+        self.mem_fmt = torch.channels_last if channels_last else torch.contiguous_format
+        self.mean = torch.tensor(mean, device=self.device).view(1, -1, 1, 1) if mean is not None else None
+        self.std = torch.tensor(std, device=self.device).view(1, -1, 1, 1) if std is not None else None
+        self.gen = torch.Generator()
+        if seed is not None: self.gen.manual_seed(seed)
+
+    def _dihedral(self, x: torch.Tensor, y: torch.Tensor):
+        """TR: Örnek başına rastgele çevirme/transpoz | EN: Per-sample random flips/transpose"""
+        flags = torch.rand(x.size(0), 3, generator=self.gen) < 0.5         # drawn on CPU: no device sync
+        flags = flags.to(x.device, non_blocking=True).view(-1, 3, 1, 1, 1)
+        def sel(f, a, b): return torch.where(f, a, b)
+        x = sel(flags[:, 0], x.flip(-1), x); y = sel(flags[:, 0], y.flip(-1), y)
+        x = sel(flags[:, 1], x.flip(-2), x); y = sel(flags[:, 1], y.flip(-2), y)
+        if x.size(-1) == x.size(-2):                                       # transpose needs square tiles
+            x = sel(flags[:, 2], x.transpose(-1, -2), x); y = sel(flags[:, 2], y.transpose(-1, -2), y)
+        return x, y
+
+    def __call__(self, batch: Dict) -> Dict:
+        if instrument.enabled() and self.device.type != "cpu":
+            instrument.count("bytes_to_device", sum(instrument.tensor_bytes(batch[k]) for k in ("image", "mask")))
+        x = batch["image"].to(self.device, non_blocking=True)
+        y = batch["mask"].to(self.device, non_blocking=True)
+        x = x.float().div_(255.0) if x.dtype == torch.uint8 else x.float()
+        if self.mean is not None: x = (x - self.mean) / self.std
+        if self.augment: x, y = self._dihedral(x, y)
+        return dict(batch, image=x.contiguous(memory_format=self.mem_fmt), mask=y.long())
+
+class StageTimer:
+    """
+    TR: Aşama süreleri (saniye). sync=True ise CUDA'da sınırlarda senkronize edilir (kesin ama biraz yavaş).
+    EN: Stage timings (seconds). With sync=True, CUDA is synchronized at boundaries (exact but slightly slower).
+    """
+    STAGES = ("input_wait", "h2d_aug", "compute")
+
+    def __init__(self, device: str | torch.device="cpu", sync: bool=False):
+        self.sync = sync and torch.device(device).type == "cuda"
+        self.reset()
+
+    def reset(self) -> None:
+        self.seconds = {k: 0.0 for k in self.STAGES}; self.batches = self.images = 0
+
+    def _sync(self) -> None:
+        if self.sync: torch.cuda.synchronize()
+
+    def summary(self) -> dict:
+        total = sum(self.seconds.values()) or 1e-9
+        return {"batches": self.batches, "images": self.images,
+                "seconds": dict(self.seconds),
+                "fraction": {k: v / total for k, v in self.seconds.items()},
+                "bound": "input" if self.seconds["input_wait"] + self.seconds["h2d_aug"] > self.seconds["compute"]
+                         else "compute"}
+
+    def __str__(self) -> str:
+        f = self.summary()["fraction"]
+        return " | ".join(f"{k} {100 * f[k]:.0f}%" for k in self.STAGES)
+
+def timed_batches(loader: DataLoader, pipeline: BatchPipeline, timer: Optional[StageTimer]=None) -> Iterator[Dict]:
+    """
+    TR: loader -> pipeline; beklemeyi, hazırlığı ve (sonraki isteğe kadar geçen) hesaplama süresini ölçer.
+    EN: loader -> pipeline; times the wait, the preparation and the compute (time until the next request).
+    """
+    timer = timer or StageTimer()
+    it = iter(loader)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            with instrument.span("input.wait"):
+                batch = next(it)
+        except StopIteration:
+            return
+        t1 = time.perf_counter()
+        with instrument.span("input.h2d_aug"):
+            batch = pipeline(batch); timer._sync()
+        t2 = time.perf_counter()
+        yield batch
+        timer._sync(); t3 = time.perf_counter()
+        instrument.step()
+        s = timer.seconds
+        s["input_wait"] += t1 - t0; s["h2d_aug"] += t2 - t1; s["compute"] += t3 - t2
+        timer.batches += 1; timer.images += int(batch["image"].size(0))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Tüm değerlendirme ızgarasını (model x XAI yöntemi x veri seti) çok süreçli, parçalı çalıştırır.
+    - Test stem'leri parçalara (shard) bölünür; parçalar bir süreç havuzunda çalışır.
+    - Her süreç modeli build_model ile bir kez yükler ve torch iş parçacığı sayısını sabitler.
+    - Parça sonuçları .jsonl olarak yazılır (devam ettirilebilir), sonra hücre başına
+      eval_xai_metrics.py ile aynı "metrics_mean" JSON biçiminde birleştirilir.
+EN: Runs the full evaluation grid (model x XAI method x dataset) sharded over processes.
+    - Test stems are split into shards that run on a process pool.
+    - Each worker loads every model once via build_model and pins its torch thread count.
+    - Shard results are written as .jsonl (resumable) and merged per cell into the same
+      "metrics_mean" JSON format as eval_xai_metrics.py.
+
+Örnek / Example:
+    python eval_grid.py --root spot67=data/SPOT67 --root maxar_izmir=data/MAXAR_Izmir --list_dir lists \\
+        --weights_tpl "runs/{dataset}/best_{tag}_{dataset}.pth" --workers 8 --out_dir runs/xai_grid
+"""
+from __future__ import annotations
+import argparse, itertools, json, logging, os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+import torch
+from torch.utils.data import DataLoader, Subset
+from common import setup_logging, ensure_dir
+from dataset import make_dataset
+from models import load_model
+from result_sink import ResultSink, summarize
+from xai_metrics import MetricEngine, PRESETS, resolve_metrics
+from mprt import IncrementalMPRT, curves_from_summary
+
+MODELS = ["unet++", "deeplabv3+", "pspnet"]
+METHODS = ["saliency", "ig", "gradshap"]
+
+def model_tag(model: str) -> str:
+    """TR: train.py ile aynı dosya etiketi | EN: Same file tag as train.py"""
+    return model.replace("+", "plus")
+
+def cell_name(dataset: str, model: str, method: str) -> str:
+    return f"{dataset}_{model_tag(model)}_{method}"
+
+def _layout_path(out_dir: str | Path, cell: str) -> Path:
+    """TR: Hücrenin MPRT kaskad tanımı | EN: The cell's MPRT cascade description (stage names + meta)"""
+    return Path(out_dir)/"shards"/f"{cell}.mprt.json"
+
+# ------------------------ Worker side ------------------------ #
+_CFG = None
+_MODELS: Dict[Tuple[str, str], torch.nn.Module] = {}
+
+def _init_worker(cfg: dict) -> None:
+    """TR: Süreç başına: yapılandırma + iş parçacığı sabitleme | EN: Per process: config + thread pinning"""
+    global _CFG
+    _CFG = SimpleNamespace(**cfg)
+    torch.set_num_threads(_CFG.threads)
+    torch.set_num_interop_threads(1)
+    setup_logging()
+
+def _get_model(model: str, dataset: str) -> torch.nn.Module:
+    key = (model, dataset)
+    if key not in _MODELS:  # loaded once per worker
+        w = _CFG.weights_tpl.format(model=model, tag=model_tag(model), dataset=dataset)
+        _MODELS[key] = load_model(model, w, _CFG.num_classes, _CFG.encoder, _CFG.device)
+    return _MODELS[key]
+
+def _run_shard(dataset: str, model: str, method: str, shard: int, stems: List[str]) -> Tuple[str, int, int]:
+    from eval_xai_metrics import evaluate_loader, xai_kwargs
+    c = _CFG
+    key = {"method": method, "model": model, "dataset": dataset, "class": c.xai_class}
+    sink = ResultSink(Path(c.out_dir)/"shards"/f"{cell_name(dataset, model, method)}_{shard:04d}.jsonl", key, c.min_fg)
+    todo = [s for s in stems if s not in sink.done]
+    if todo:
+        ds = make_dataset(dataset, c.roots[dataset], c.split, c.img_size, c.list_dir, c.cache_dir)
+        idx = {ip.stem: i for i, (ip, _) in enumerate(ds.items)}
+        loader = DataLoader(Subset(ds, [idx[s] for s in todo]), batch_size=c.batch_size, shuffle=False, num_workers=0)
+        net = _get_model(model, dataset)
+        kw = xai_kwargs(SimpleNamespace(xai_method=method, xai_norm=c.xai_norm, float_maps=c.float_maps,
+                                        ig_steps=c.ig_steps, ig_chunk=c.ig_chunk, ig_layer=c.ig_layer,
+                                        gs_samples=c.gs_samples, gs_chunk=c.gs_chunk, gs_stdev=c.gs_stdev,
+                                        gs_seed=c.gs_seed, gs_baseline_path=c.gs_baselines.get(dataset)))
+        names, mprt = resolve_metrics(c.metrics), None
+        if "MPRT" in names and c.mprt == "incremental":
+            names.remove("MPRT")
+            mprt = IncrementalMPRT(net, method, kw, c.xai_class, depth=c.mprt_depth, seed=c.mprt_seed,
+                                   cache_path=Path(c.out_dir)/"mprt"/f"{model_tag(model)}_d{c.mprt_depth}_s{c.mprt_seed}.pt")
+            # per-sample stage curves go into the shard rows; the layout (same for every shard) once per cell
+            path = _layout_path(c.out_dir, cell_name(dataset, model, method))
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(mprt.layout(), indent=2)); os.replace(tmp, path)
+        engine = MetricEngine(net, metrics=names, method=method, xai_kw=kw)
+        evaluate_loader(net, loader, method=method, target_class=c.xai_class, xai_kw=kw,
+                        engine=engine, device=c.device, sink=sink, min_fg=c.min_fg, mprt=mprt)
+    return cell_name(dataset, model, method), shard, len(todo)
+
+# ------------------------ Driver side ------------------------ #
+def _shards(stems: List[str], size: int) -> List[List[str]]:
+    return [stems[i:i+size] for i in range(0, len(stems), size)]
+
+def merge_cell(out_dir: Path, dataset: str, model: str, method: str, xai_class: int) -> dict:
+    """
+    TR: Bir hücrenin parça dosyalarını eval_xai_metrics.py biçiminde birleştirir (artımlı MPRT'de
+        aşama eğrileri "mprt_layers" dahil).
+    EN: Merges one cell's shard files into the eval_xai_metrics.py format (including the per-stage
+        curves "mprt_layers" with incremental MPRT).
+    """
+    key = {"method": method, "model": model, "dataset": dataset, "class": xai_class}
+    files = sorted((out_dir/"shards").glob(f"{cell_name(dataset, model, method)}_*.jsonl"))
+    out = dict(key, **summarize(files, key))
+    stage_curves = {k: out.pop(k) for k in ("mprt_stages_n", "mprt_stages_mean") if k in out}
+    layout = _layout_path(out_dir, cell_name(dataset, model, method))
+    if stage_curves and layout.exists():             # per-stage randomisation curves over every shard
+        out["mprt_layers"] = curves_from_summary(json.loads(layout.read_text()), stage_curves)
+    (out_dir/f"{cell_name(dataset, model, method)}.json").write_text(json.dumps(out, indent=2))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", action="append", required=True, metavar="DATASET=PATH",
+                    help="TR: Veri seti kökü (tekrarlanabilir) | EN: Dataset root (repeatable), e.g. spot67=data/SPOT67")
+    ap.add_argument("--list_dir", type=str, default=None)
+    ap.add_argument("--split", type=str, default="test", choices=["val","test"])
+    ap.add_argument("--img_size", type=int, default=512)
+    ap.add_argument("--cache_dir", type=str, default=None)
+    ap.add_argument("--models", type=str, nargs="+", default=MODELS, choices=MODELS)
+    ap.add_argument("--methods", type=str, nargs="+", default=METHODS, choices=METHODS + ["layer_ig"])
+    ap.add_argument("--weights_tpl", type=str, required=True,
+                    help="TR: Ağırlık yolu şablonu | EN: Weights path template ({model}, {tag}, {dataset})")
+    ap.add_argument("--encoder", type=str, default="resnet34")
+    ap.add_argument("--num_classes", type=int, default=2)
+    ap.add_argument("--xai_class", type=int, default=1)
+    ap.add_argument("--xai_norm", type=str, default="minmax", choices=["minmax","percentile"])
+    ap.add_argument("--float_maps", action="store_true")
+    ap.add_argument("--ig_steps", type=int, default=50)
+    ap.add_argument("--ig_chunk", type=int, default=1)
+    ap.add_argument("--ig_layer", type=str, default="encoder.layer1")
+    ap.add_argument("--gs_samples", type=int, default=20)
+    ap.add_argument("--gs_chunk", type=int, default=0)
+    ap.add_argument("--gs_stdev", type=float, default=0.09)
+    ap.add_argument("--gs_seed", type=int, default=0)
+    ap.add_argument("--gs_baseline", type=str, default="batch", choices=["batch","dataset"])
+    ap.add_argument("--gs_groups", type=int, default=4)
+    ap.add_argument("--gs_baseline_dir", type=str, default=None)
+    ap.add_argument("--metrics", type=str, default="all", help=f"presets: {', '.join(PRESETS)}")
+    ap.add_argument("--min_fg", type=float, default=0.0,
+                    help="TR: Ön-plan kapısı eşiği | EN: Foreground gate threshold (0 = off)")
+    ap.add_argument("--mprt", type=str, default="incremental", choices=["incremental","quantus"])
+    ap.add_argument("--mprt_depth", type=int, default=2)
+    ap.add_argument("--mprt_seed", type=int, default=42)
+    ap.add_argument("--batch_size", type=int, default=2)
+    ap.add_argument("--shard_size", type=int, default=16, help="TR: Parça başına stem | EN: Stems per shard")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    ap.add_argument("--threads_per_worker", type=int, default=0,
+                    help="TR: 0 = çekirdek / süreç | EN: 0 = cores / workers")
+    ap.add_argument("--device", type=str, default="cpu")
+    ap.add_argument("--out_dir", type=str, required=True)
+    args = ap.parse_args()
+
+    setup_logging()
+    out_dir = ensure_dir(args.out_dir); ensure_dir(out_dir/"shards")
+    roots = dict(r.split("=", 1) for r in args.root)
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+
+    # Expand the grid; stems are listed once per dataset (this also builds the decode cache up front).
+    tasks = []
+    for dataset in roots:
+        ds = make_dataset(dataset, roots[dataset], args.split, args.img_size, args.list_dir, args.cache_dir)
+        stems = [ip.stem for ip, _ in ds.items]
+        for model, method in itertools.product(args.models, args.methods):
+            tasks += [(dataset, model, method, i, sh) for i, sh in enumerate(_shards(stems, args.shard_size))]
+    # group by model so each worker tends to reuse the models it has already loaded
+    tasks.sort(key=lambda t: (t[0], t[1], t[3], t[2]))
+    logging.info("Grid: %d datasets x %d models x %d methods -> %d shards on %d workers x %d threads",
+                 len(roots), len(args.models), len(args.methods), len(tasks), args.workers, threads)
+
+    # GradientShap dataset baselines are built once here, not per worker
+    gs_baselines = {}
+    if "gradshap" in args.methods:
+        from eval_xai_metrics import gs_baseline_path
+        ns = SimpleNamespace(**vars(args), xai_method="gradshap")
+        gs_baselines = {d: p for d in roots if (p := gs_baseline_path(ns, d, roots[d]))}
+    cfg = dict(vars(args), roots=roots, threads=threads, gs_baselines=gs_baselines)
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=get_context("spawn"),
+                             initializer=_init_worker, initargs=(cfg,)) as pool:
+        futs = [pool.submit(_run_shard, *t) for t in tasks]
+        for n, f in enumerate(as_completed(futs), 1):
+            cell, shard, done = f.result()
+            logging.info("[%d/%d] %s shard %d: %d new stems", n, len(futs), cell, shard, done)
+
+    summary = [merge_cell(out_dir, d, m, x, args.xai_class)
+               for d in roots for m in args.models for x in args.methods]
+    (out_dir/"grid_summary.json").write_text(json.dumps(summary, indent=2))
+    print("Saved:", out_dir)
+
+if __name__ == "__main__":
+    main()
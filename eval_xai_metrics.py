@@ -2,18 +2,197 @@
 """
 TR: Test kümesi üzerinde XAI haritaları ve 10 metrik hesabı (SPOT6/7, MAXAR_İzmir).
 EN: Compute XAI maps & all 10 metrics over a test set (SPOT6/7, MAXAR_İzmir).
+
+Çoklu model / Multi-model (veri bir kez okunur / data is read once, + pairwise attribution agreement):
+    python eval_xai_metrics.py --dataset spot67 --root data/SPOT67 --xai_method ig \
+        --model unet++ deeplabv3+ pspnet --weights runs/spot67/best_unetplusplus_spot67.pth \
+        runs/spot67/best_deeplabv3plus_spot67.pth runs/spot67/best_pspnet_spot67.pth --out_json runs/xai_cmp.json
 """
 from __future__ import annotations
-import argparse, json
+import argparse, itertools, json, logging, time
 from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
 import numpy as np
 import torch
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Subset
 from common import setup_logging, ensure_dir, to_device
+import instrument
 from dataset import make_dataset
-from models import build_model
-from xai import xai_dispatch
-from xai_metrics import compute_all_metrics
+from models import load_model, foreground_fraction
+from result_sink import ResultSink, batch_rows, summarize
+from xai import ensure_dataset_baselines
+from xai_cache import AttributionCache, cached_xai_dispatch, file_digest
+from xai_metrics import (compute_all_metrics, MetricEngine, PRESETS, resolve_metrics,
+                         spearman_per_sample, topk_iou_per_sample)
+from mprt import IncrementalMPRT, curves_from_summary
+from eval_grid import model_tag
+
+def xai_kwargs(args) -> dict:
+    """TR: CLI'dan yönteme özgü XAI argümanları | EN: Method-specific XAI kwargs from the CLI"""
+    kw = dict(normalize=args.xai_norm, as_float=args.float_maps)
+    if args.xai_method in ("ig", "layer_ig"):
+        kw.update(steps=args.ig_steps, chunk_steps=args.ig_chunk or None)
+    if args.xai_method == "layer_ig":
+        kw.update(layer=args.ig_layer)
+    if args.xai_method == "gradshap":
+        kw.update(stdevs=args.gs_stdev, nsamples=args.gs_samples, chunk_samples=args.gs_chunk or None,
+                  seed=args.gs_seed, baselines=getattr(args, "gs_baseline_path", None))
+    return kw
+
+def gs_baseline_path(args, dataset: str, root: str) -> Optional[str]:
+    """
+    TR: --gs_baseline dataset: eğitim kümesinin ortalama karoları bir kez hesaplanıp .pt olarak saklanır.
+    EN: --gs_baseline dataset: mean tiles of the train split are computed once and stored as .pt.
+    """
+    if args.xai_method != "gradshap" or args.gs_baseline != "dataset": return None
+    path = Path(args.gs_baseline_dir or args.cache_dir or "runs")/f"gs_baseline_{dataset}_{args.img_size}_g{args.gs_groups}.pt"
+    if not path.exists():
+        ds = make_dataset(dataset, root, "train", args.img_size, args.list_dir, args.cache_dir)
+        ensure_dataset_baselines(path, ds, args.gs_groups)
+        logging.info("GradientShap baselines: %s", path)
+    return str(path)
+
+def pending_subset(ds, done: set):
+    """TR: Kaydı olmayan örnekler (çözümlemeden önce filtrelenir) | EN: Samples not yet recorded (filtered before decoding)"""
+    if not done: return ds
+    return Subset(ds, [i for i, (ip, _) in enumerate(ds.items) if ip.stem not in done])
+
+def evaluate_batch(model, x: torch.Tensor, y: torch.Tensor, stems: List[str], *, method: str, target_class: int,
+                   xai_kw: dict, engine: MetricEngine, cache: Optional[AttributionCache]=None, w_hash: str="",
+                   sink: Optional[ResultSink]=None, min_fg: float=0.0, skipped: Optional[List[dict]]=None,
+                   mprt: Optional[IncrementalMPRT]=None):
+    """
+    TR: Tek batch için kapı + XAI + metrikler; sink verilirse örnek satırları yazılır.
+    EN: Gate + XAI + metrics for one batch; with a sink, per-sample rows are appended.
+    Returns: (kept indices, attributions [K,1,H,W] or None, {metric: [K]}, {metric: profile})
+    """
+    keep = list(range(len(stems)))
+    if min_fg > 0:                                        # cheap foreground gate (one forward)
+        with torch.no_grad():
+            frac = foreground_fraction(model(x), target_class).tolist()
+        keep = [i for i, f in enumerate(frac) if f >= min_fg]
+        gated = [{"stem": stems[i], "skipped": True, "fg_fraction": frac[i], "min_fg": min_fg}
+                 for i in range(len(stems)) if frac[i] < min_fg]
+        if skipped is not None: skipped.extend(gated)
+        if sink is not None: sink.write(gated)
+        if not keep: return keep, None, {}, {}
+        x, y, stems = x[keep], y[keep], [stems[i] for i in keep]
+    t0 = time.perf_counter()
+    a = cached_xai_dispatch(cache, w_hash, stems, method, model, x,
+                            target_class=target_class, **xai_kw)  # [B,1,H,W]
+    xai_sec = time.perf_counter() - t0
+    scores, prof = compute_all_metrics(model, x, y, a, target_class=target_class,
+                                       engine=engine, return_profile=True, per_sample=True)
+    if mprt is not None:
+        scores["MPRT"], prof["MPRT"] = mprt.score(x, a)
+    if sink is not None:
+        rows = batch_rows(stems, scores, prof, xai_sec)
+        if mprt is not None:                              # per-stage curves, merged by summarize()
+            for row, c in zip(rows, mprt.last): row["mprt_stages"] = c.tolist()
+        sink.write(rows)
+    return keep, a, scores, prof
+
+def _accumulate(scores_all: Dict[str, List[float]], profile: Dict[str, Dict[str, float]],
+                scores: Dict[str, np.ndarray], prof: Dict[str, Dict[str, float]]) -> None:
+    for k, v in scores.items():
+        scores_all.setdefault(k, []).extend(float(s) for s in v)
+        acc = profile.setdefault(k, {})
+        for f, val in prof[k].items(): acc[f] = acc.get(f, 0.0) + float(val)
+
+def evaluate_loader(model, loader, *, method: str, target_class: int, xai_kw: dict, engine: MetricEngine,
+                    device: str, cache: Optional[AttributionCache]=None, w_hash: str="",
+                    sink: Optional[ResultSink]=None, min_fg: float=0.0, skipped: Optional[List[dict]]=None,
+                    mprt: Optional[IncrementalMPRT]=None) -> Tuple[Dict[str, List[float]], Dict[str, Dict[str, float]]]:
+    """
+    TR: Loader üzerinde XAI + metrikler; sink verilirse her batch sonrası örnek satırları yazılır.
+        min_fg > 0: tahmini hedef sınıf oranı bunun altındaki örneklerde XAI ve metrikler atlanır
+        (skipped listesine ve sink'e {"stem", "skipped": true, "fg_fraction", "min_fg"} olarak kaydedilir).
+    EN: XAI + metrics over a loader; with a sink, per-sample rows are appended after every batch.
+        min_fg > 0: samples whose predicted target-class fraction is below it skip XAI and metrics
+        (recorded in `skipped` and in the sink as {"stem", "skipped": true, "fg_fraction", "min_fg"}).
+        mprt: IncrementalMPRT replacing Quantus MPRT (the engine should then exclude "MPRT").
+    Returns: ({metric: per-sample scores}, {metric: summed profile})
+    """
+    scores_all: Dict[str, List[float]] = {}
+    profile: Dict[str, Dict[str, float]] = {}
+    for batch in loader:
+        batch = to_device(batch, device)
+        x, y, stems = batch["image"], batch["mask"], list(batch["stem"])  # x: [B,3,H,W]; y: [B,1,H,W]
+        _, _, scores, prof = evaluate_batch(model, x, y, stems, method=method, target_class=target_class,
+                                            xai_kw=xai_kw, engine=engine, cache=cache, w_hash=w_hash,
+                                            sink=sink, min_fg=min_fg, skipped=skipped, mprt=mprt)
+        _accumulate(scores_all, profile, scores, prof)
+        instrument.step()
+    return scores_all, profile
+
+# ------------------------ Multi-model mode ------------------------ #
+class ModelRun(NamedTuple):
+    name: str                          # report key (model name, suffixed if repeated)
+    model: torch.nn.Module
+    engine: MetricEngine
+    w_hash: str = ""
+    sink: Optional[ResultSink] = None
+    mprt: Optional[IncrementalMPRT] = None
+
+def evaluate_models(runs: Sequence[ModelRun], loader, *, method: str, target_class: int, xai_kw: dict,
+                    device: str, cache: Optional[AttributionCache]=None, min_fg: float=0.0,
+                    topk: float=0.05) -> Tuple[dict, dict]:
+    """
+    TR: Veri kümesi bir kez okunur; her batch'te tüm modeller için XAI + metrikler hesaplanır ve
+        model çiftleri arasında atıf uyumu (Spearman sıra korelasyonu, en yüksek %k piksel IoU'su)
+        ölçülür. Uyum, iki modelin de kapıdan geçirdiği örnekler üzerinden hesaplanır.
+    EN: The dataset is read once; per batch, XAI + metrics are computed for every model and
+        pairwise attribution agreement (Spearman rank correlation, top-k% pixel IoU) is measured.
+        Agreement uses the samples both models kept through the gate.
+        Stems already recorded in a model's sink are skipped for that model only (resume).
+    Returns: ({name: {"scores", "profile", "skipped"}}, {"a vs b": {"spearman": [...], "topk_iou": [...]}})
+    """
+    per_model = {r.name: {"scores": {}, "profile": {}, "skipped": []} for r in runs}
+    pairs = {f"{a.name} vs {b.name}": {"spearman": [], "topk_iou": []} for a, b in itertools.combinations(runs, 2)}
+    for batch in loader:
+        batch = to_device(batch, device)
+        x, y, stems = batch["image"], batch["mask"], list(batch["stem"])
+        atts: Dict[str, Tuple[List[int], Optional[torch.Tensor]]] = {}
+        for r in runs:
+            res = per_model[r.name]
+            todo = [i for i, s in enumerate(stems) if r.sink is None or s not in r.sink.done]
+            if not todo:
+                atts[r.name] = ([], None); continue
+            sub = todo if len(todo) < len(stems) else slice(None)
+            keep, a, scores, prof = evaluate_batch(r.model, x[sub], y[sub], [stems[i] for i in todo],
+                                                   method=method, target_class=target_class,
+                                                   xai_kw=xai_kw, engine=r.engine, cache=cache, w_hash=r.w_hash,
+                                                   sink=r.sink, min_fg=min_fg, skipped=res["skipped"], mprt=r.mprt)
+            _accumulate(res["scores"], res["profile"], scores, prof)
+            atts[r.name] = ([todo[k] for k in keep], a)                 # keep indices relative to the batch
+        for a_run, b_run in itertools.combinations(runs, 2):
+            (ka, aa), (kb, ab) = atts[a_run.name], atts[b_run.name]
+            common = sorted(set(ka) & set(kb))
+            if not common: continue
+            pa = {i: j for j, i in enumerate(ka)}; pb = {i: j for j, i in enumerate(kb)}
+            ma = aa[[pa[i] for i in common]].float(); mb = ab[[pb[i] for i in common]].float()
+            acc = pairs[f"{a_run.name} vs {b_run.name}"]
+            acc["spearman"].extend(spearman_per_sample(ma, mb).tolist())
+            acc["topk_iou"].extend(topk_iou_per_sample(ma, mb, topk).tolist())
+        instrument.step()
+    return per_model, pairs
+
+def summarize_agreement(pairs: dict, topk: float) -> dict:
+    """TR: Çift başına ortalama/std | EN: Per-pair mean/std"""
+    out = {}
+    for pair, vals in pairs.items():
+        row = {"n": len(vals["spearman"]), "topk_frac": topk}
+        for k, v in vals.items():
+            arr = np.asarray(v, dtype=np.float64)
+            row[f"{k}_mean"] = float(arr.mean()) if arr.size else float("nan")
+            row[f"{k}_std"] = float(arr.std()) if arr.size else float("nan")
+        out[pair] = row
+    return out
+
+def log_profile(profile: Dict[str, Dict[str, float]]) -> None:
+    for k in sorted(profile, key=lambda k: -profile[k]["seconds"]):
+        logging.info("%-22s %9.1f s | %7d model calls | %8d samples", k, profile[k]["seconds"],
+                     profile[k]["model_calls"], profile[k]["model_samples"])
 
 def main():
     ap = argparse.ArgumentParser()
@@ -22,41 +201,160 @@ def main():
     ap.add_argument("--list_dir", type=str, default=None)
     ap.add_argument("--split", type=str, default="test", choices=["val","test"])
     ap.add_argument("--img_size", type=int, default=512)
-    ap.add_argument("--model", type=str, required=True, choices=["unet++","deeplabv3+","pspnet"])
+    ap.add_argument("--cache_dir", type=str, default=None,
+                    help="TR: Çözülmüş uint8 önbellek klasörü | EN: Decode-once uint8 cache directory")
+    ap.add_argument("--model", type=str, nargs="+", required=True, choices=["unet++","deeplabv3+","pspnet"],
+                    help="TR: Birden çok model: veri bir kez okunur, çiftler arası atıf uyumu raporlanır | "
+                         "EN: Several models: data is read once and pairwise attribution agreement is reported")
     ap.add_argument("--encoder", type=str, default="resnet34")
     ap.add_argument("--num_classes", type=int, default=2)
-    ap.add_argument("--weights", type=str, required=True)
-    ap.add_argument("--xai_method", type=str, required=True, choices=["saliency","ig","gradshap"])
+    ap.add_argument("--weights", type=str, nargs="+", required=True, help="TR: Model başına bir | EN: One per --model")
+    ap.add_argument("--agreement_topk", type=float, default=0.05,
+                    help="TR: Top-k IoU için piksel oranı | EN: Pixel fraction for the top-k IoU agreement")
+    ap.add_argument("--xai_method", type=str, required=True, choices=["saliency","ig","layer_ig","gradshap"])
     ap.add_argument("--xai_class", type=int, default=1)
+    ap.add_argument("--xai_norm", type=str, default="minmax", choices=["minmax","percentile","batch"],
+                    help="TR: Örnek bazlı normalizasyon | EN: Per-sample attribution normalization")
+    ap.add_argument("--float_maps", action="store_true",
+                    help="TR: uint8 yerine float32 haritalar | EN: Keep float32 maps instead of uint8")
+    ap.add_argument("--ig_steps", type=int, default=50)
+    ap.add_argument("--ig_chunk", type=int, default=1,
+                    help="TR: Geçiş başına IG adımı (0=hepsi) | EN: IG steps per pass (0=all at once)")
+    ap.add_argument("--ig_layer", type=str, default="encoder.layer1",
+                    help="TR: layer_ig için katman | EN: Layer for layer_ig")
+    ap.add_argument("--gs_samples", type=int, default=20)
+    ap.add_argument("--gs_chunk", type=int, default=0,
+                    help="TR: Geçiş başına GradientShap örneği (0=hepsi) | EN: GradientShap samples per pass (0=all at once)")
+    ap.add_argument("--gs_stdev", type=float, default=0.09)
+    ap.add_argument("--gs_seed", type=int, default=0)
+    ap.add_argument("--gs_baseline", type=str, default="batch", choices=["batch","dataset"],
+                    help="TR: batch = siyah + batch ortalaması; dataset = önbellekli eğitim kümesi ortalama karoları | "
+                         "EN: batch = black + batch mean; dataset = cached mean tiles of the train split")
+    ap.add_argument("--gs_groups", type=int, default=4, help="TR: Ortalama karo sayısı | EN: Number of mean tiles")
+    ap.add_argument("--gs_baseline_dir", type=str, default=None)
+    ap.add_argument("--xai_cache_dir", type=str, default=None,
+                    help="TR: Kalıcı atıf önbelleği | EN: Persistent attribution cache directory")
+    ap.add_argument("--xai_cache_gb", type=float, default=10.0)
+    ap.add_argument("--metrics", type=str, default="all",
+                    help=f"TR: Metrik adları/presetler (virgüllü) | EN: Metric names/presets, comma-separated "
+                         f"(presets: {', '.join(PRESETS)})")
+    ap.add_argument("--metric_workers", type=int, default=0,
+                    help="TR: Eşzamanlı metrik sayısı (0=sıralı) | EN: Concurrent metrics (0=sequential)")
+    ap.add_argument("--metric_backend", type=str, default="thread", choices=["thread","process"])
+    ap.add_argument("--no_adapter", action="store_true",
+                    help="TR: Ham [B,C,H,W] modeli Quantus'a ver (eski davranış) | "
+                         "EN: Pass the raw [B,C,H,W] model to Quantus (legacy behaviour)")
+    ap.add_argument("--coalesce_batch", type=int, default=64,
+                    help="TR: Birleştirilmiş model çağrısı başına en çok örnek | "
+                         "EN: Max samples per coalesced model call (thread backend, metric_workers>1)")
+    ap.add_argument("--mprt", type=str, default="incremental", choices=["incremental","quantus"],
+                    help="TR: MPRT uygulaması | EN: MPRT implementation (incremental = one random cascade per run)")
+    ap.add_argument("--mprt_depth", type=int, default=2,
+                    help="TR: Aşama gruplama derinliği (0 = her katman) | EN: Stage grouping depth (0 = every layer)")
+    ap.add_argument("--mprt_order", type=str, default="top_down", choices=["top_down","bottom_up"])
+    ap.add_argument("--mprt_seed", type=int, default=42)
+    ap.add_argument("--mprt_cache", type=str, default=None,
+                    help="TR: Rastgele kaskad dosyası (.pt) | EN: Random cascade file (.pt), reused across runs")
     ap.add_argument("--batch_size", type=int, default=2)
     ap.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
     ap.add_argument("--out_json", type=str, required=True)
+    ap.add_argument("--min_fg", type=float, default=0.0,
+                    help="TR: Tahmini ön-plan oranı bunun altındaysa XAI/metrik atlanır | "
+                         "EN: Skip XAI/metrics when the predicted foreground fraction is below this")
+    ap.add_argument("--stream_jsonl", type=str, default=None,
+                    help="TR: Örnek başına satırları artımlı yaz, kayıtlıları atla | "
+                         "EN: Append per-sample rows incrementally and skip recorded stems on restart")
+    ap.add_argument("--loader_workers", type=int, default=4,
+                    help="TR: 0 = çözümleme ana süreçte (profilde görünür) | EN: 0 = decode in the main process (visible to --profile)")
+    ap.add_argument("--profile", action="store_true",
+                    help="TR: Span/sayaç enstrümantasyonu | EN: Span/counter instrumentation (summary logged + JSON)")
+    ap.add_argument("--trace", type=str, default=None,
+                    help="TR: İz dosyası (.json) | EN: Trace file (.json, open in chrome://tracing or Perfetto)")
+    ap.add_argument("--trace_kind", type=str, default="chrome", choices=["chrome","torch"],
+                    help="TR: chrome = kendi span'lerimiz, torch = torch.profiler | EN: chrome = our spans, torch = torch.profiler")
     args = ap.parse_args()
 
-    setup_logging()
-    ds = make_dataset(args.dataset, args.root, args.split, args.img_size, args.list_dir)
-    loader = DataLoader(ds, batch_size=args.batch_size, shuffle=False, num_workers=4, pin_memory=True)
-
-    model = build_model(args.model, num_classes=args.num_classes, encoder_name=args.encoder)
-    sd = torch.load(args.weights, map_location="cpu")
-    model.load_state_dict(sd, strict=True)
-    model.eval().to(args.device)
+    setup_logging(instrument=args.profile, trace=args.trace, trace_kind=args.trace_kind)
+    if len(args.weights) != len(args.model):
+        ap.error("--weights needs one path per --model")
+    run_names = [m if args.model.count(m) == 1 else f"{m}#{i}" for i, m in enumerate(args.model)]
+    keys = {n: {"method": args.xai_method, "model": n, "dataset": args.dataset, "class": args.xai_class}
+            for n in run_names}
+    sinks = {n: ResultSink(args.stream_jsonl, keys[n], args.min_fg) for n in run_names} if args.stream_jsonl else {}
+    ds = make_dataset(args.dataset, args.root, args.split, args.img_size, args.list_dir, args.cache_dir)
+    done = set.intersection(*(s.done for s in sinks.values())) if sinks else set()  # per model: evaluate_models
+    if done:
+        logging.info("Resuming: %d stems already recorded in %s", len(done), args.stream_jsonl)
+        ds = pending_subset(ds, done)
+    loader = DataLoader(ds, batch_size=args.batch_size, shuffle=False, num_workers=args.loader_workers, pin_memory=True)
 
-    all_scores = []
-    for batch in loader:
-        batch = to_device(batch, args.device)
-        x, y = batch["image"], batch["mask"]  # x: [B,3,H,W]; y: [B,1,H,W]
-        a = xai_dispatch(args.xai_method, model, x, target_class=args.xai_class).float()  # [B,1,H,W]
-        scores = compute_all_metrics(model, x, y, a, target_class=args.xai_class)
-        all_scores.append(scores)
+    args.gs_baseline_path = gs_baseline_path(args, args.dataset, args.root)
+    xai_kw = xai_kwargs(args)
+    cache = AttributionCache(args.xai_cache_dir, int(args.xai_cache_gb * 2**30)) if args.xai_cache_dir else None
+    runs: List[ModelRun] = []
+    try:
+        for n, m, w in zip(run_names, args.model, args.weights):
+            model = load_model(m, w, args.num_classes, args.encoder, args.device)
+            names = resolve_metrics(args.metrics)
+            mprt = None
+            if "MPRT" in names and args.mprt == "incremental":
+                names.remove("MPRT")
+                cache_path = args.mprt_cache
+                if cache_path and len(set(args.model)) > 1:   # one random cascade file per architecture
+                    cache_path = Path(cache_path).with_name(f"{Path(cache_path).stem}_{model_tag(m)}.pt")
+                mprt = IncrementalMPRT(model, args.xai_method, xai_kw, args.xai_class, depth=args.mprt_depth,
+                                       order=args.mprt_order, seed=args.mprt_seed, cache_path=cache_path)
+            engine = MetricEngine(model, workers=args.metric_workers, backend=args.metric_backend, metrics=names,
+                                  adapter=not args.no_adapter, coalesce_batch=args.coalesce_batch,
+                                  method=args.xai_method, xai_kw=xai_kw)
+            runs.append(ModelRun(n, model, engine, file_digest(w) if cache else "", sinks.get(n), mprt))
+        for r in runs: instrument.watch_model(r.model, "model")  # after engines: hooks must not be pickled
+        if len(runs) == 1:
+            r = runs[0]; skipped: List[dict] = []
+            scores, profile = evaluate_loader(r.model, loader, method=args.xai_method, target_class=args.xai_class,
+                                              xai_kw=xai_kw, engine=r.engine, device=args.device,
+                                              cache=cache, w_hash=r.w_hash, sink=r.sink,
+                                              min_fg=args.min_fg, skipped=skipped, mprt=r.mprt)
+            per_model, pairs = {r.name: {"scores": scores, "profile": profile, "skipped": skipped}}, {}
+        else:
+            per_model, pairs = evaluate_models(runs, loader, method=args.xai_method, target_class=args.xai_class,
+                                               xai_kw=xai_kw, device=args.device, cache=cache,
+                                               min_fg=args.min_fg, topk=args.agreement_topk)
+    finally:
+        for r in runs: r.engine.close()
 
-    keys = list(all_scores[0].keys())
-    means = {k: float(np.mean([d[k] for d in all_scores])) for k in keys}
+    if cache: logging.info("Attribution cache: %d hits, %d misses", cache.hits, cache.misses)
+    reports = {}
+    for r in runs:
+        res = per_model[r.name]
+        logging.info("== %s ==", r.name); log_profile(res["profile"])
+        out = dict(keys[r.name])
+        if r.sink is not None:
+            out.update(summarize(r.sink.path, keys[r.name]))  # means/std/percentiles over every recorded stem
+        else:
+            out["metrics_mean"] = {k: float(np.mean(v)) for k, v in res["scores"].items()}
+            out["skipped"] = [row["stem"] for row in res["skipped"]]
+        out["metrics_profile"] = res["profile"]
+        stage_curves = {k: out.pop(k) for k in ("mprt_stages_n", "mprt_stages_mean") if k in out}
+        if r.mprt is not None:                             # every recorded stem when the sink has them
+            out["mprt_layers"] = curves_from_summary(r.mprt.layout(), stage_curves) or r.mprt.curves()
+        if args.min_fg > 0:
+            out["min_fg"] = args.min_fg
+            logging.info("Foreground gate: %d samples skipped (min_fg=%.4f)", len(out["skipped"]), args.min_fg)
+        reports[r.name] = out
+    if len(runs) == 1:
+        out = reports[runs[0].name]
+    else:
+        out = {"method": args.xai_method, "dataset": args.dataset, "class": args.xai_class,
+               "models": reports, "agreement": summarize_agreement(pairs, args.agreement_topk)}
+        for pair, row in out["agreement"].items():
+            logging.info("Agreement %s: spearman %.4f | top-%g%% IoU %.4f (n=%d)", pair, row["spearman_mean"],
+                         100 * args.agreement_topk, row["topk_iou_mean"], row["n"])
 
+    if instrument.enabled():
+        out["instrument"] = instrument.finish()
     Path(args.out_json).parent.mkdir(parents=True, exist_ok=True)
-    Path(args.out_json).write_text(json.dumps({"method": args.xai_method, "model": args.model,
-                                               "dataset": args.dataset, "class": args.xai_class,
-                                               "metrics_mean": means}, indent=2))
+    Path(args.out_json).write_text(json.dumps(out, indent=2))
     print("Saved:", args.out_json)
 
 if __name__ == "__main__":
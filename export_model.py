@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Eğitilmiş modeli (U-Net++, DeepLabV3+, PSPNet) çıkarım için dondurulmuş TorchScript'e aktarır.
+    - trace + freeze (BatchNorm katlama, sabit yayılımı) + optimize_for_inference
+    - Opsiyonel CPU int8: "dynamic" (yalnız Linear katmanları; hiç Linear yoksa hata) veya "static" (FX, val
+      kümesiyle kalibrasyon)
+    - Doğrulama kümesinde eager modele karşı doğruluk eşitliği kontrolü (başarısızsa artefakt yazılmaz)
+EN: Exports a trained model (U-Net++, DeepLabV3+, PSPNet) to a frozen TorchScript artifact for inference.
+    - trace + freeze (BatchNorm folding, constant propagation) + optimize_for_inference
+    - Optional CPU int8: "dynamic" (Linear layers only; an error if there are none) or "static" (FX,
+      calibrated on the val split)
+    - Accuracy parity check against the eager model on the validation split (no artifact on failure)
+
+Yükleme / Loading: models.load_exported(path)
+
+Örnek / Example:
+    python export_model.py --dataset spot67 --root data/SPOT67 --list_dir lists --model unet++ \\
+        --weights runs/spot67/best_unetplusplus_spot67.pth --out runs/spot67/unetplusplus_spot67.ts.pt
+"""
+from __future__ import annotations
+import argparse, json, logging, time
+from pathlib import Path
+from typing import Optional
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from common import setup_logging, ConfusionMeter
+from dataset import make_dataset
+from models import load_model, load_exported, logits_to_mask
+
+def quantize_model(model: nn.Module, mode: str, example: torch.Tensor,
+                   calib_loader: Optional[DataLoader]=None, calib_batches: int=8) -> nn.Module:
+    """
+    TR: CPU int8 niceleme. "dynamic" yalnız Linear katmanlarını etkiler; smp U-Net++/DeepLabV3+/PSPNet
+        başlıklarında Linear olmadığından model değişmeyecekse hata verir. "static" konvolüsyonları da
+        niceler ve kalibrasyon verisi ister.
+    EN: CPU int8 quantization. "dynamic" only affects Linear layers; the smp U-Net++/DeepLabV3+/PSPNet
+        heads have none, so it raises instead of returning an unchanged fp32 model labelled int8.
+        "static" also quantizes convolutions and needs calibration data.
+    """
+    if mode == "none":
+        return model
+    if mode == "dynamic":
+        n = sum(isinstance(m, nn.Linear) for m in model.modules())
+        if n == 0:
+            raise ValueError("dynamic quantization only covers nn.Linear and this model has none; "
+                             "use --quantize static (or none)")
+        logging.info("Dynamic int8: %d Linear layers", n)
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    if mode == "static":
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+        if calib_loader is None:
+            raise ValueError("static quantization needs a calibration loader")
+        prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), example_inputs=(example,))
+        with torch.no_grad():
+            for i, batch in enumerate(calib_loader):
+                if i >= calib_batches: break
+                prepared(batch["image"])
+        return convert_fx(prepared)
+    raise ValueError(f"Unknown quantization mode: {mode}")
+
+def export_model(model: nn.Module, example: torch.Tensor) -> torch.jit.ScriptModule:
+    """
+    TR: trace -> freeze -> optimize_for_inference (eval modunda).
+    EN: trace -> freeze -> optimize_for_inference (in eval mode).
+    """
+    model = model.eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        frozen = torch.jit.freeze(traced)
+        try:
+            frozen = torch.jit.optimize_for_inference(frozen)
+        except RuntimeError as e:  # some quantized graphs reject the fp32 passes
+            logging.warning("optimize_for_inference skipped: %s", e)
+    return frozen
+
+@torch.no_grad()
+def parity_check(eager: nn.Module, exported, loader: DataLoader, num_classes: int,
+                 max_batches: Optional[int]=None) -> dict:
+    """
+    TR: Eager ve dışa aktarılmış model çıktılarını karşılaştırır (piksel uyumu, logit farkı, mIoU, gecikme).
+    EN: Compares eager vs exported outputs (pixel agreement, logit diff, mIoU, latency).
+    """
+    m_eager, m_exp = ConfusionMeter(num_classes), ConfusionMeter(num_classes)
+    agree = total = 0; max_diff = 0.0; t_eager = t_exp = 0.0; n_img = 0
+    for i, batch in enumerate(loader):
+        if max_batches is not None and i >= max_batches: break
+        x, y = batch["image"], batch["mask"]
+        t0 = time.perf_counter(); le = eager(x); t1 = time.perf_counter()
+        lx = exported(x); t2 = time.perf_counter()
+        t_eager += t1 - t0; t_exp += t2 - t1; n_img += x.size(0)
+        pe, px = logits_to_mask(le), logits_to_mask(lx.float())
+        agree += int((pe == px).sum()); total += pe.numel()
+        max_diff = max(max_diff, float((le - lx.float()).abs().max()))
+        m_eager.update(pe, y); m_exp.update(px, y)
+    if n_img == 0:
+        raise ValueError("parity check needs at least one validation batch")
+    return {
+        "images": n_img,
+        "pixel_agreement": agree / max(1, total),
+        "max_abs_logit_diff": max_diff,
+        "miou_eager": m_eager.compute()["miou"],
+        "miou_exported": m_exp.compute()["miou"],
+        "latency_ms_per_tile_eager": 1000 * t_eager / n_img,
+        "latency_ms_per_tile_exported": 1000 * t_exp / n_img,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dataset", type=str, required=True, choices=["spot67","maxar_izmir"])
+    ap.add_argument("--root", type=str, required=True)
+    ap.add_argument("--list_dir", type=str, default=None)
+    ap.add_argument("--img_size", type=int, default=512)
+    ap.add_argument("--cache_dir", type=str, default=None)
+    ap.add_argument("--model", type=str, required=True, choices=["unet++","deeplabv3+","pspnet"])
+    ap.add_argument("--encoder", type=str, default="resnet34")
+    ap.add_argument("--num_classes", type=int, default=2)
+    ap.add_argument("--weights", type=str, required=True)
+    ap.add_argument("--quantize", type=str, default="none", choices=["none","dynamic","static"])
+    ap.add_argument("--calib_batches", type=int, default=8)
+    ap.add_argument("--batch_size", type=int, default=4)
+    ap.add_argument("--parity_batches", type=int, default=None,
+                    help="TR: Kontrol edilecek val batch sayısı (varsayılan: hepsi) | EN: Val batches to check (default: all)")
+    ap.add_argument("--min_agreement", type=float, default=None,
+                    help="TR: Asgari piksel uyumu | EN: Minimum pixel agreement (default 0.999 fp32, 0.98 int8)")
+    ap.add_argument("--max_miou_drop", type=float, default=None,
+                    help="TR: Kabul edilen mIoU düşüşü | EN: Allowed mIoU drop (default 0.001 fp32, 0.01 int8)")
+    ap.add_argument("--threads", type=int, default=0)
+    ap.add_argument("--out", type=str, required=True, help="TR: Artefakt yolu (.pt) | EN: Artifact path (.pt)")
+    args = ap.parse_args()
+
+    setup_logging()
+    if args.threads: torch.set_num_threads(args.threads)
+    int8 = args.quantize != "none"
+    min_agree = args.min_agreement if args.min_agreement is not None else (0.98 if int8 else 0.999)
+    max_drop = args.max_miou_drop if args.max_miou_drop is not None else (0.01 if int8 else 0.001)
+
+    val_ds = make_dataset(args.dataset, args.root, "val", args.img_size, args.list_dir, args.cache_dir)
+    val_loader = DataLoader(val_ds, batch_size=args.batch_size, shuffle=False, num_workers=2)
+
+    eager = load_model(args.model, args.weights, args.num_classes, args.encoder, "cpu")
+    example = torch.rand(1, 3, args.img_size, args.img_size)
+    to_export = quantize_model(load_model(args.model, args.weights, args.num_classes, args.encoder, "cpu"),
+                               args.quantize, example, val_loader, args.calib_batches)
+    exported = export_model(to_export, example)
+
+    parity = parity_check(eager, exported, val_loader, args.num_classes, args.parity_batches)
+    passed = (parity["pixel_agreement"] >= min_agree
+              and parity["miou_eager"] - parity["miou_exported"] <= max_drop)
+    parity.update(passed=passed, min_agreement=min_agree, max_miou_drop=max_drop)
+    logging.info("Parity: %s", json.dumps(parity))
+    if not passed:
+        raise SystemExit(f"Parity check failed (agreement={parity['pixel_agreement']:.5f}, "
+                         f"mIoU {parity['miou_eager']:.4f} -> {parity['miou_exported']:.4f}); artifact not written")
+
+    out = Path(args.out); out.parent.mkdir(parents=True, exist_ok=True)
+    torch.jit.save(exported, str(out))
+    load_exported(out)  # round-trip sanity check
+    out.with_suffix(".json").write_text(json.dumps({
+        "model": args.model, "encoder": args.encoder, "num_classes": args.num_classes,
+        "img_size": args.img_size, "quantize": args.quantize, "weights": args.weights,
+        "torch": torch.__version__, "parity": parity}, indent=2))
+    print("Saved:", out)
+
+if __name__ == "__main__":
+    main()
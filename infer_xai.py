@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Büyük sahneler için kayan pencereli (tiled) tahmin + opsiyonel XAI haritaları.
+    - Sahne satır bantları halinde pencere pencere okunur (örtüşmeli).
+    - Pencereler batch halinde modelden geçirilir, örtüşen logitler ağırlık penceresiyle harmanlanır.
+    - Tamamlanan satırlar çıktıya hemen yazılır; bellek sahne boyutuna değil batch/bant boyutuna bağlıdır.
+EN: Sliding-window (tiled) inference for large scenes + optional XAI maps.
+    - The scene is streamed window by window in row bands (with overlap).
+    - Windows are batched through the model; overlapping logits are blended with a weighting window.
+    - Finished rows are written out immediately; memory depends on batch/band size, not scene size.
+
+Girdi / Input : .npy (HxWx3 uint8, memmap), .tif/.tiff (rasterio varsa pencereli okuma) veya cv2 ile okunabilen görüntü
+Çıktı / Output: {out_dir}/{stem}_mask.{png|npy|tif} (sınıf id), opsiyonel _prob ve _{xai};
+               --polygons ile {stem}_buildings.geojson[l] (polygonize.py).
+"""
+from __future__ import annotations
+import argparse, json, logging, tempfile
+from pathlib import Path
+from typing import Optional, List
+import numpy as np
+import torch
+from common import setup_logging, ensure_dir
+from models import load_model, load_exported, logits_to_mask, foreground_fraction
+from xai_cache import AttributionCache, cached_xai_dispatch, file_digest
+
+RASTER_SUFFIXES = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".npy"}
+
+# ------------------------ Raster I/O ------------------------ #
+class RasterSource:
+    """
+    TR: Pencere okuma arayüzü (HxWx3 uint8 RGB; bands=1 ise HxW tek bant, örn. maske/olasılık rasterleri).
+    EN: Windowed reader (HxWx3 uint8 RGB; with bands=1 a single HxW band, e.g. mask/probability rasters).
+    """
+    def __init__(self, path: str | Path, bands: int=3):
+        self.path = Path(path)
+        self.bands = bands
+        self.profile = None
+        self._ds = None
+        suf = self.path.suffix.lower()
+        if suf == ".npy":
+            self._arr = np.load(self.path, mmap_mode="r")           # streamed from disk
+        elif suf in (".tif", ".tiff") and _has_rasterio():
+            import rasterio
+            self._ds = rasterio.open(self.path)
+            self.profile = self._ds.profile
+            self._arr = None
+        else:
+            # TR: PNG/JPEG pencereli çözülemez; tek seferde okunur.
+            # EN: PNG/JPEG cannot be window-decoded; read once.
+            from dataset import _read_rgb, _read_mask
+            self._arr = _read_mask(self.path) if bands == 1 else _read_rgb(self.path)
+        if self._ds is not None:
+            self.height, self.width = self._ds.height, self._ds.width
+        else:
+            self.height, self.width = self._arr.shape[:2]
+
+    def read(self, y0: int, y1: int, x0: int, x1: int) -> np.ndarray:
+        if self._ds is not None:
+            from rasterio.windows import Window
+            if self.bands == 1:
+                return self._ds.read(1, window=Window(x0, y0, x1-x0, y1-y0)).astype(np.uint8, copy=False)
+            win = self._ds.read(indexes=[1, 2, 3], window=Window(x0, y0, x1-x0, y1-y0))  # [3,h,w]
+            return np.ascontiguousarray(np.transpose(win, (1, 2, 0)).astype(np.uint8, copy=False))
+        if self.bands == 1:
+            a = self._arr[y0:y1, x0:x1]
+            return np.asarray(a if a.ndim == 2 else a[..., 0], dtype=np.uint8)
+        return np.asarray(self._arr[y0:y1, x0:x1, :3], dtype=np.uint8)
+
+    def close(self):
+        if self._ds is not None: self._ds.close()
+
+class RasterSink:
+    """
+    TR: Satır satır artımlı yazıcı (tek bantlı uint8).
+        close(keep_buffer=True): PNG'nin disk-destekli satır tamponu (.npy) self.buffer olarak saklanır
+        (pencereli okunabilir); discard_buffer() ile silinir.
+    EN: Incremental row writer (single-band uint8).
+        close(keep_buffer=True): PNG's disk-backed row buffer (.npy) is kept as self.buffer
+        (window-readable); discard_buffer() removes it.
+    """
+    def __init__(self, path: str | Path, height: int, width: int, profile: Optional[dict]=None):
+        self.path = Path(path); self.height, self.width = height, width
+        self._ds = None; self._png = False
+        self.buffer: Optional[Path] = None
+        suf = self.path.suffix.lower()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if suf in (".tif", ".tiff") and _has_rasterio():
+            import rasterio
+            prof = dict(profile or {}, driver="GTiff", count=1, dtype="uint8",
+                        height=height, width=width, compress="deflate")
+            prof.pop("nodata", None)
+            self._ds = rasterio.open(self.path, "w", **prof)
+        elif suf == ".npy":
+            self._arr = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.uint8, shape=(height, width))
+        else:
+            # TR: PNG tek seferde kodlanır; satırlar disk-destekli memmap'te birikir.
+            # EN: PNG is encoded in one go; rows accumulate in a disk-backed memmap.
+            self._png = True
+            self._tmp = tempfile.NamedTemporaryFile(suffix=".npy", delete=False); self._tmp.close()
+            self._arr = np.lib.format.open_memmap(self._tmp.name, mode="w+", dtype=np.uint8, shape=(height, width))
+
+    def write_rows(self, y0: int, rows: np.ndarray) -> None:
+        if self._ds is not None:
+            from rasterio.windows import Window
+            self._ds.write(rows[None], window=Window(0, y0, self.width, rows.shape[0]))
+        else:
+            self._arr[y0:y0+rows.shape[0]] = rows
+
+    def close(self, keep_buffer: bool=False) -> None:
+        if self._ds is not None:
+            self._ds.close(); return
+        self._arr.flush()
+        if self._png:
+            from common import save_gray_png
+            save_gray_png(self.path, np.asarray(self._arr))
+            del self._arr
+            if keep_buffer: self.buffer = Path(self._tmp.name)
+            else: Path(self._tmp.name).unlink(missing_ok=True)
+
+    def readable_path(self) -> Path:
+        """TR: Pencereli okunabilir çıktı | EN: Window-readable output (PNG: the kept row buffer)"""
+        return self.buffer or self.path
+
+    def discard_buffer(self) -> None:
+        if self.buffer is not None: self.buffer.unlink(missing_ok=True); self.buffer = None
+
+def _has_rasterio() -> bool:
+    try:
+        import rasterio  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+# ------------------------ Tiling helpers ------------------------ #
+def tile_starts(n: int, tile: int, stride: int) -> List[int]:
+    """TR: Pencere başlangıçları (son pencere kenara hizalı) | EN: Window starts (last one edge-aligned)"""
+    if n <= tile: return [0]
+    starts = list(range(0, n - tile, stride))
+    starts.append(n - tile)
+    return starts
+
+def blend_window(tile: int, kind: str="gaussian", floor: float=1e-3) -> np.ndarray:
+    """
+    TR: Örtüşme harmanlama ağırlıkları [tile,tile] (kenarlarda küçük, merkezde 1).
+    EN: Overlap blending weights [tile,tile] (small at borders, 1 at the centre).
+    """
+    if kind == "uniform":
+        return np.ones((tile, tile), np.float32)
+    if kind == "hann":
+        w1 = np.hanning(tile + 2)[1:-1]
+    elif kind == "gaussian":
+        r = np.arange(tile, dtype=np.float64) - (tile - 1) / 2.0
+        w1 = np.exp(-0.5 * (r / (tile / 4.0)) ** 2)
+    else:
+        raise ValueError(f"Unknown blend window: {kind}")
+    w = np.outer(w1, w1)
+    return np.maximum(w / w.max(), floor).astype(np.float32)
+
+def _band_buffer(shape, max_ram_mb: int) -> np.ndarray:
+    """TR: Büyükse disk-destekli bant tamponu | EN: Band accumulator, disk-backed when large"""
+    nbytes = int(np.prod(shape)) * 4
+    if nbytes <= max_ram_mb * 2**20:
+        return np.zeros(shape, np.float32)
+    f = tempfile.NamedTemporaryFile(suffix=".f32", delete=True)
+    arr = np.memmap(f, dtype=np.float32, mode="w+", shape=shape)
+    arr._tmpfile = f  # keep the file alive as long as the buffer
+    return arr
+
+# ------------------------ Engine ------------------------ #
+@torch.no_grad()
+def _forward_logits(model, xb: torch.Tensor) -> torch.Tensor:
+    return model(xb)
+
+def predict_scene(model: torch.nn.Module, src: RasterSource, mask_sink: RasterSink, *,
+                  num_classes: int=2, tile: int=512, overlap: int=64, batch_size: int=4,
+                  device: str="cpu", window: str="gaussian", prob_sink: Optional[RasterSink]=None,
+                  prob_class: int=1, xai_method: Optional[str]=None, xai_class: int=1,
+                  xai_sink: Optional[RasterSink]=None, xai_cache: Optional[AttributionCache]=None,
+                  weights_hash: str="", min_fg: float=0.0, max_band_mb: int=256) -> dict:
+    """
+    TR: Sahneyi satır bantları halinde işler; her bant bittiğinde kesinleşen satırları yazar.
+        min_fg > 0 ise tahmini ön-plan oranı (xai_class) bunun altında kalan karolarda XAI atlanır.
+    EN: Processes the scene in row bands; rows are written as soon as no later window touches them.
+        With min_fg > 0, XAI is skipped for tiles whose predicted xai_class fraction is below it.
+    Returns: summary dict (tiles, batches, scene shape, skipped tiles)
+    """
+    if not 0 <= overlap < tile:
+        raise ValueError(f"overlap must be in [0, tile): got {overlap} for tile={tile}")
+    H, W = src.height, src.width
+    ys = tile_starts(H, tile, tile - overlap)
+    xs = tile_starts(W, tile, tile - overlap)
+    band_h = min(tile, H)
+    win = torch.from_numpy(blend_window(tile, window))              # [tile,tile]
+    acc = _band_buffer((num_classes, band_h, W), max_band_mb)       # blended logits
+    wsum = np.zeros((band_h, W), np.float32)
+    att = _band_buffer((band_h, W), max_band_mb) if xai_method else None
+    n_tiles = n_batches = 0
+    skipped: List[dict] = []
+
+    def _flush(batch: List[tuple], y0: int):
+        nonlocal n_batches
+        arr = np.stack([t for _, _, t in batch])                       # [B,tile,tile,3]
+        xb = torch.from_numpy(arr).permute(0, 3, 1, 2).float().div_(255.0).to(device)
+        logits = _forward_logits(model, xb).float()
+        wl = (logits.cpu() * win).numpy()                              # [B,C,tile,tile]
+        maps = None
+        if xai_method:
+            maps = torch.zeros(len(batch), tile, tile)
+            keep = list(range(len(batch)))
+            if min_fg > 0:                                             # foreground gate
+                frac = foreground_fraction(logits, xai_class).tolist()
+                keep = [i for i, f in enumerate(frac) if f >= min_fg]
+                skipped.extend({"y": y0, "x": batch[i][0], "fg_fraction": frac[i]}
+                               for i in range(len(batch)) if frac[i] < min_fg)
+            if keep:
+                stems = [f"{src.path.stem}@{y0}_{batch[i][0]}" for i in keep]   # tile id for the cache
+                got = cached_xai_dispatch(xai_cache, weights_hash, stems, xai_method, model, xb[keep],
+                                          target_class=xai_class, as_float=True)
+                maps[keep] = got[:, 0].cpu()
+            maps = (maps * win).numpy()                                # [B,tile,tile]
+        for i, (x0, (h, w), _) in enumerate(batch):
+            acc[:, :h, x0:x0+w] += wl[i, :, :h, :w]
+            wsum[:h, x0:x0+w] += win[:h, :w].numpy()
+            if maps is not None: att[:h, x0:x0+w] += maps[i, :h, :w]
+        n_batches += 1
+
+    for yi, y0 in enumerate(ys):
+        y1 = min(y0 + tile, H)
+        batch = []
+        for x0 in xs:
+            x1 = min(x0 + tile, W)
+            t = src.read(y0, y1, x0, x1)
+            h, w = t.shape[:2]
+            if (h, w) != (tile, tile):                                 # scene smaller than a tile
+                mode = "reflect" if min(h, w) > tile // 2 else "edge"
+                t = np.pad(t, ((0, tile-h), (0, tile-w), (0, 0)), mode=mode)
+            batch.append((x0, (h, w), t)); n_tiles += 1
+            if len(batch) == batch_size:
+                _flush(batch, y0); batch = []
+        if batch: _flush(batch, y0)
+
+        # rows [y0, y_next) are final: no later window starts above y_next
+        y_next = ys[yi+1] if yi + 1 < len(ys) else H
+        k = y_next - y0
+        band = torch.from_numpy(np.ascontiguousarray(acc[:, :k]))[None]      # [1,C,k,W]
+        mask_sink.write_rows(y0, logits_to_mask(band)[0, 0].numpy().astype(np.uint8))
+        if prob_sink is not None:
+            prob = torch.softmax(band / torch.from_numpy(wsum[:k]), dim=1)[0, prob_class]
+            prob_sink.write_rows(y0, (prob * 255).round().clamp(0, 255).byte().numpy())
+        if att is not None:
+            a = att[:k] / wsum[:k]
+            xai_sink.write_rows(y0, np.clip(np.rint(a * 255), 0, 255).astype(np.uint8))
+        # shift the band buffer up by k rows
+        for buf in (acc, wsum) + ((att,) if att is not None else ()):
+            buf[..., :band_h-k, :] = buf[..., k:, :]
+            buf[..., band_h-k:, :] = 0
+    return {"height": H, "width": W, "tiles": n_tiles, "batches": n_batches,
+            "tile": tile, "min_fg": min_fg, "skipped_tiles": skipped}
+
+def _list_inputs(inp: Path) -> List[Path]:
+    if inp.is_dir():
+        return sorted(p for p in inp.iterdir() if p.suffix.lower() in RASTER_SUFFIXES)
+    return [inp]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", type=str, required=True, help="TR: Görüntü veya klasör | EN: Image or folder")
+    ap.add_argument("--out_dir", type=str, required=True)
+    ap.add_argument("--model", type=str, default=None, choices=["unet++","deeplabv3+","pspnet"],
+                    help="TR: --weights ile zorunlu | EN: Required with --weights (not with --exported)")
+    ap.add_argument("--encoder", type=str, default="resnet34")
+    ap.add_argument("--num_classes", type=int, default=2)
+    ap.add_argument("--weights", type=str, default=None)
+    ap.add_argument("--exported", type=str, default=None,
+                    help="TR: export_model.py çıktısı (yalnız tahmin) | EN: export_model.py artifact (prediction only)")
+    ap.add_argument("--tile", type=int, default=512)
+    ap.add_argument("--overlap", type=int, default=64)
+    ap.add_argument("--batch_size", type=int, default=4)
+    ap.add_argument("--window", type=str, default="gaussian", choices=["gaussian","hann","uniform"])
+    ap.add_argument("--out_format", type=str, default="png", choices=["png","npy","tif"])
+    ap.add_argument("--save_prob", action="store_true",
+                    help="TR: Ön-plan olasılık haritasını da yaz | EN: Also write the foreground probability map")
+    ap.add_argument("--fg_class", type=int, default=1)
+    ap.add_argument("--xai_method", type=str, default=None, choices=["saliency","ig","layer_ig","gradshap"])
+    ap.add_argument("--xai_class", type=int, default=1)
+    ap.add_argument("--xai_cache_dir", type=str, default=None,
+                    help="TR: Kalıcı atıf önbelleği | EN: Persistent attribution cache directory")
+    ap.add_argument("--xai_cache_gb", type=float, default=10.0)
+    ap.add_argument("--min_fg", type=float, default=0.0,
+                    help="TR: Bu ön-plan oranının altındaki karolarda XAI atlanır | "
+                         "EN: Skip XAI for tiles whose predicted foreground fraction is below this")
+    ap.add_argument("--polygons", type=str, default=None, choices=["geojson","geojsonseq"],
+                    help="TR: Maskeyi bina poligonlarına çevir (polygonize.py) | "
+                         "EN: Also vectorize the mask into building polygons (polygonize.py)")
+    ap.add_argument("--simplify", type=float, default=1.0,
+                    help="TR: Poligon sadeleştirme toleransı (piksel, 0 = kapalı) | "
+                         "EN: Polygon simplification tolerance (pixels, 0 = off)")
+    ap.add_argument("--min_area", type=int, default=4,
+                    help="TR: Bu alanın (piksel) altındaki binalar yazılmaz | "
+                         "EN: Buildings smaller than this many pixels are dropped")
+    ap.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = ap.parse_args()
+
+    setup_logging()
+    out = ensure_dir(args.out_dir)
+    if args.exported:
+        if args.xai_method:
+            ap.error("--exported is prediction-only; use --weights for XAI maps")
+        model = load_exported(args.exported, args.device)
+    elif args.weights:
+        if not args.model:
+            ap.error("--model is required with --weights")
+        model = load_model(args.model, args.weights, args.num_classes, args.encoder, args.device)
+    else:
+        ap.error("one of --weights or --exported is required")
+    cache = AttributionCache(args.xai_cache_dir, int(args.xai_cache_gb * 2**30)) \
+        if (args.xai_cache_dir and args.xai_method) else None
+    w_hash = file_digest(args.weights) if cache else ""
+
+    for p in _list_inputs(Path(args.input)):
+        src = RasterSource(p)
+        ext = args.out_format
+        mk = lambda tag: RasterSink(out/f"{p.stem}_{tag}.{ext}", src.height, src.width, src.profile)
+        mask_sink = mk("mask")
+        prob_sink = mk("prob") if args.save_prob else None
+        xai_sink = mk(args.xai_method) if args.xai_method else None
+        try:
+            info = predict_scene(model, src, mask_sink, num_classes=args.num_classes, tile=args.tile,
+                                 overlap=args.overlap, batch_size=args.batch_size, device=args.device,
+                                 window=args.window, prob_sink=prob_sink, prob_class=args.fg_class,
+                                 xai_method=args.xai_method, xai_class=args.xai_class, xai_sink=xai_sink,
+                                 xai_cache=cache, weights_hash=w_hash, min_fg=args.min_fg)
+        finally:
+            # PNG sinks keep their row buffer for polygonization: PNG cannot be window-decoded
+            for s in (mask_sink, prob_sink, xai_sink):
+                if s is not None: s.close(keep_buffer=bool(args.polygons))
+            src.close()
+        logging.info("%s: %dx%d, %d tiles in %d batches, %d tiles gated", p.name, info["width"], info["height"],
+                     info["tiles"], info["batches"], len(info["skipped_tiles"]))
+        if args.polygons:
+            from polygonize import polygonize_files
+            rd = lambda s: s.readable_path() if s is not None else None
+            try:
+                info["polygons"] = polygonize_files(
+                    rd(mask_sink), out/f"{p.stem}_buildings.{'geojson' if args.polygons == 'geojson' else 'geojsonl'}",
+                    prob_path=rd(prob_sink), xai_path=rd(xai_sink), profile=src.profile, fmt=args.polygons,
+                    fg_class=args.fg_class, simplify=args.simplify, min_area=args.min_area)
+            finally:
+                for s in (mask_sink, prob_sink, xai_sink):
+                    if s is not None: s.discard_buffer()
+        (out/f"{p.stem}_tiles.json").write_text(json.dumps(info, indent=2))
+    print("Saved:", out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Hafif enstrümantasyon: adlandırılmış süre aralıkları (span) ve sayaçlar.
+    Kapalıyken span() paylaşılan boş bir bağlam, count() tek bir bayrak kontrolüdür (≈sıfır ek yük).
+    Açmak için: common.setup_logging(instrument=True, trace=...) veya enable().
+    - Sayaçlar: images_decoded, model_calls, model_samples, backward_passes, bytes_to_device ...
+    - Çıktı: çalıştırma özeti (log + dict) ve opsiyonel iz dosyası: Chrome trace (chrome://tracing,
+      Perfetto; en çok MAX_EVENTS olay) veya torch.profiler izi (TORCH_SCHEDULE penceresi, step() ile).
+EN: Lightweight instrumentation: named spans and counters.
+    When disabled span() is a shared null context and count() a single flag check (≈zero overhead).
+    Turn it on with common.setup_logging(instrument=True, trace=...) or enable().
+    - Counters: images_decoded, model_calls, model_samples, backward_passes, bytes_to_device ...
+    - Output: per-run summary (log + dict) and an optional trace file: Chrome trace (chrome://tracing,
+      Perfetto; at most MAX_EVENTS events) or a torch.profiler trace (TORCH_SCHEDULE window, driven by step()).
+
+Not / Note: süreç havuzundaki işçilerin (DataLoader, metric_backend=process) olayları ana sürece
+    taşınmaz / events from pool workers (DataLoader, metric_backend=process) stay in those processes.
+"""
+from __future__ import annotations
+import os, json, time, logging, threading, contextlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+MAX_EVENTS = 1_000_000                    # Chrome trace cap (~150 MB of JSON); later events are dropped
+TORCH_SCHEDULE = (2, 1, 5)               # torch.profiler (wait, warmup, active) steps; one step = one batch
+
+_ENABLED = False
+_LOCK = threading.Lock()
+_SPANS: Dict[str, List[float]] = {}      # name -> [count, total seconds]
+_COUNTERS: Dict[str, float] = {}
+_EVENTS: Optional[List[dict]] = None     # Chrome trace events (only when tracing)
+_TRACE: Optional[dict] = None            # {"path", "kind", "profiler", "saved"}
+_DROPPED = 0
+_NULL = contextlib.nullcontext()
+_LOCAL = threading.local()
+
+def enabled() -> bool:
+    return _ENABLED
+
+def enable(trace: str | Path | None=None, kind: str="chrome", steps: tuple=TORCH_SCHEDULE) -> None:
+    """
+    TR: Toplamayı açar; trace verilirse kind="chrome" (kendi olaylarımız) veya "torch" (torch.profiler).
+        torch: yalnız steps=(wait, warmup, active) penceresi kaydedilir; döngüler batch başına step() çağırır.
+    EN: Turns collection on; with trace, kind="chrome" (our own events) or "torch" (torch.profiler).
+        torch: only the steps=(wait, warmup, active) window is recorded; loops call step() once per batch.
+    """
+    global _ENABLED, _EVENTS, _TRACE, _DROPPED
+    reset()
+    _ENABLED, _DROPPED = True, 0
+    _EVENTS = [] if trace and kind == "chrome" else None
+    _TRACE = None
+    if trace:
+        _TRACE = {"path": str(trace), "kind": kind, "profiler": None, "saved": False, "steps": steps}
+        if kind == "torch":
+            import torch
+            wait, warmup, active = steps
+            prof = torch.profiler.profile(record_shapes=False, with_stack=False, on_trace_ready=_save_torch_trace,
+                                          schedule=torch.profiler.schedule(wait=wait, warmup=warmup,
+                                                                           active=active, repeat=1))
+            prof.__enter__(); _TRACE["profiler"] = prof
+
+def _save_torch_trace(prof) -> None:
+    path = Path(_TRACE["path"]); path.parent.mkdir(parents=True, exist_ok=True)
+    prof.export_chrome_trace(str(path)); _TRACE["saved"] = True
+
+def step() -> None:
+    """TR: Batch sınırı (torch.profiler takvimini ilerletir) | EN: Batch boundary (advances the torch.profiler schedule)"""
+    if _TRACE is not None and _TRACE["profiler"] is not None: _TRACE["profiler"].step()
+
+def disable() -> None:
+    global _ENABLED
+    _ENABLED = False
+
+def reset() -> None:
+    with _LOCK:
+        _SPANS.clear(); _COUNTERS.clear()
+
+def count(name: str, n: float=1) -> None:
+    """TR: Sayaç artır | EN: Increment a counter"""
+    if not _ENABLED: return
+    with _LOCK: _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+def _record(name: str, t0: int, t1: int) -> None:
+    global _DROPPED
+    with _LOCK:
+        s = _SPANS.setdefault(name, [0, 0.0]); s[0] += 1; s[1] += (t1 - t0) / 1e9
+        if _EVENTS is not None and len(_EVENTS) >= MAX_EVENTS:
+            _DROPPED += 1
+        elif _EVENTS is not None:
+            _EVENTS.append({"name": name, "ph": "X", "ts": t0 / 1e3, "dur": (t1 - t0) / 1e3,
+                            "pid": os.getpid(), "tid": threading.get_ident()})
+
+class _Span:
+    __slots__ = ("name", "t0")
+    def __init__(self, name: str): self.name = name
+    def __enter__(self): self.t0 = time.perf_counter_ns(); return self
+    def __exit__(self, *exc): _record(self.name, self.t0, time.perf_counter_ns())
+
+def span(name: str):
+    """TR: `with span("xai.ig"): ...` süre aralığı | EN: `with span("xai.ig"): ...` timed span"""
+    return _Span(name) if _ENABLED else _NULL
+
+# ------------------------ Torch hooks ------------------------ #
+def tensor_bytes(t) -> int:
+    return t.numel() * t.element_size() if hasattr(t, "element_size") else 0
+
+def watch_model(model, tag: str="model") -> list:
+    """
+    TR: İleri geçiş sayısı/süresi ve çıktıya ulaşan geri geçişleri sayan kancalar (kapalıyken eklenmez).
+    EN: Hooks counting forward calls/time and backward passes reaching the output (none when disabled).
+    Returns: hook handles (call .remove() to detach)
+    """
+    if not _ENABLED: return []
+    def pre(_m, inp):
+        stack = getattr(_LOCAL, "fwd", None)
+        if stack is None: stack = _LOCAL.fwd = []
+        stack.append(time.perf_counter_ns())
+    def post(_m, inp, out):
+        t0 = _LOCAL.fwd.pop()
+        _record(f"{tag}.forward", t0, time.perf_counter_ns())
+        count(f"{tag}_calls"); count(f"{tag}_samples", int(inp[0].shape[0]) if inp else 0)
+        if getattr(out, "requires_grad", False):
+            out.register_hook(lambda g: count("backward_passes"))
+    return [model.register_forward_pre_hook(pre), model.register_forward_hook(post)]
+
+# ------------------------ Summary / export ------------------------ #
+def summary() -> dict:
+    """TR: Span ve sayaç özeti | EN: Summary of spans and counters"""
+    with _LOCK:
+        spans = {k: {"count": int(c), "total_s": t, "mean_ms": 1000 * t / max(c, 1)}
+                 for k, (c, t) in sorted(_SPANS.items(), key=lambda kv: -kv[1][1])}
+        return {"spans": spans, "counters": dict(_COUNTERS)}
+
+def log_summary(s: Optional[dict]=None) -> dict:
+    s = s or summary()
+    for k, v in s["spans"].items():
+        logging.info("[span] %-28s %9.2f s | %7d x | %9.2f ms", k, v["total_s"], v["count"], v["mean_ms"])
+    for k, v in s["counters"].items():
+        logging.info("[count] %-27s %14s", k, f"{v / 2**20:.1f} MB" if k.startswith("bytes") else f"{v:,.0f}")
+    return s
+
+def finish() -> dict:
+    """
+    TR: Özeti loglar, varsa iz dosyasını yazar ve toplamayı kapatır.
+    EN: Logs the summary, writes the trace file if any, and turns collection off.
+    """
+    global _EVENTS, _TRACE
+    s = log_summary() if _ENABLED else {"spans": {}, "counters": {}}
+    if _TRACE:
+        path = Path(_TRACE["path"]); path.parent.mkdir(parents=True, exist_ok=True)
+        if _TRACE["kind"] == "torch":
+            _TRACE["profiler"].__exit__(None, None, None)  # saves a partially recorded window too
+        else:
+            path.write_text(json.dumps({"traceEvents": _EVENTS or [], "displayTimeUnit": "ms"}))
+            _TRACE["saved"] = True
+            if _DROPPED:
+                logging.warning("Trace capped at %d events; %d later events dropped", MAX_EVENTS, _DROPPED)
+                s["trace_events_dropped"] = _DROPPED
+        if _TRACE["saved"]:
+            logging.info("Trace written: %s", path); s["trace"] = str(path)
+        else:
+            logging.warning("No trace written: the run ended before the profiler window (wait, warmup, active) = %s",
+                            _TRACE["steps"])
+    _EVENTS, _TRACE = None, None
+    disable()
+    return s
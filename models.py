@@ -4,6 +4,7 @@ TR: 3 model: U-Net++, DeepLabv3+, PSPNet (smp kullanımı önerildi).
 EN: 3 models: U-Net++, DeepLabv3+, PSPNet (using segmentation_models_pytorch).
 """
 from __future__ import annotations
+from pathlib import Path
 import torch
 import torch.nn as nn
 import segmentation_models_pytorch as smp
@@ -31,3 +32,28 @@ def build_model(model_name: str, num_classes: int=2, in_channels: int=3,
 def logits_to_mask(logits: torch.Tensor) -> torch.Tensor:
     """TR: [B,C,H,W] -> [B,1,H,W] sınıf id | EN: argmax to class id mask"""
     return torch.argmax(torch.softmax(logits, dim=1), dim=1, keepdim=True)
+
+def foreground_fraction(logits: torch.Tensor, fg_class: int=1) -> torch.Tensor:
+    """
+    TR: Tahmin edilen maskede ön-plan piksel oranı (örnek başına) -> [B]. Boş karo kapısı için.
+    EN: Predicted foreground pixel fraction per sample -> [B]. Used to gate empty tiles.
+    """
+    return (logits_to_mask(logits) == fg_class).float().mean(dim=(1, 2, 3))
+
+def load_model(model_name: str, weights: str | Path, num_classes: int=2, encoder_name: str="resnet34",
+               device: str="cpu") -> nn.Module:
+    """
+    TR: Eğitilmiş state_dict ile modeli kurar (eval modunda).
+    EN: Builds the model from a trained state_dict (eval mode).
+    """
+    model = build_model(model_name, num_classes=num_classes, encoder_name=encoder_name, encoder_weights=None)
+    model.load_state_dict(torch.load(weights, map_location="cpu"), strict=True)
+    return model.eval().to(device)
+
+def load_exported(path: str | Path, device: str="cpu") -> torch.jit.ScriptModule:
+    """
+    TR: export_model.py ile üretilen dondurulmuş TorchScript modelini yükler (kullanıma hazır).
+    EN: Loads a frozen TorchScript artifact produced by export_model.py (ready to use).
+    """
+    model = torch.jit.load(str(path), map_location=device)
+    return model.eval()
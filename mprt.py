@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Artımlı Model Parametre Rastgeleleştirme Testi (MPRT).
+    Quantus MPRT her batch için modeli kopyalayıp katman katman rastgeleleştirir. Burada:
+    - Rastgele katman ağırlıkları çalıştırma başına bir kez (sabit seed ile) üretilir; bellekte
+      tutulur, istenirse diske (.pt) yazılır ve sonraki çalıştırmalarda yeniden kullanılır.
+    - Her batch'te kaskad sırayla uygulanır (yalnız o aşamanın tensörleri kopyalanır), açıklama
+      projenin xai_dispatch yöntemiyle yeniden hesaplanır, sonra orijinal ağırlıklar geri yüklenir.
+    - Aşama başına Spearman benzerlik eğrisi raporlanır; örnek skoru = aşamaların ortalaması
+      (Quantus özetine denk, düşük = daha iyi).
+EN: Incremental Model Parameter Randomisation Test (MPRT).
+    Quantus MPRT deep-copies and randomises the model layer by layer for every batch. Here:
+    - Random layer weights are drawn once per run (fixed seed); kept in memory and optionally
+      written to disk (.pt) and reused by later runs.
+    - Per batch the cascade is applied in order (only that stage's tensors are copied in), the
+      explanation is recomputed with the project's xai_dispatch, then the original weights are restored.
+    - A per-stage Spearman similarity curve is reported; the sample score = mean over stages
+      (same as the Quantus summary, lower is better).
+
+Aşamalar / Stages: parametreli yaprak modüller, isim önekinin ilk `depth` parçasına göre gruplanır
+    (depth=2 -> "encoder.layer1", "decoder.blocks", ...; depth=0 -> her yaprak modül, Quantus ile aynı).
+    / parameterised leaf modules grouped by the first `depth` parts of their name
+    (depth=0 -> every leaf module, same granularity as Quantus).
+"""
+from __future__ import annotations
+import copy, os, logging, time
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Tuple
+import numpy as np
+import torch
+import instrument
+from xai import xai_dispatch
+from xai_metrics import spearman_per_sample
+
+MPRT_VERSION = 1
+
+def layer_stages(model: torch.nn.Module, depth: int=2,
+                 order: Literal["top_down","bottom_up"]="top_down") -> List[Tuple[str, List[str]]]:
+    """
+    TR: Rastgeleleştirme aşamaları: [(aşama adı, [modül adları])], kaskad sırasıyla.
+    EN: Randomisation stages: [(stage name, [module names])] in cascade order.
+    """
+    groups: Dict[str, List[str]] = {}
+    for name, m in model.named_modules():
+        if not hasattr(m, "reset_parameters") or not any(True for _ in m.parameters(recurse=False)):
+            continue
+        key = ".".join(name.split(".")[:depth]) if depth > 0 else name
+        groups.setdefault(key, []).append(name)
+    stages = list(groups.items())
+    return stages[::-1] if order == "top_down" else stages
+
+class IncrementalMPRT:
+    """
+    TR: Tüm değerlendirme boyunca aynı rastgele kaskadı kullanan MPRT.
+        score(x, a) örnek başına skor [B] döndürür; curves() aşama başına ortalama benzerliği verir.
+    EN: MPRT that reuses one random cascade for the whole evaluation.
+        score(x, a) returns per-sample scores [B]; curves() gives the mean similarity per stage.
+    """
+    def __init__(self, model: torch.nn.Module, method: str, xai_kw: Optional[dict]=None, target_class: int=1,
+                 depth: int=2, order: Literal["top_down","bottom_up"]="top_down", seed: int=42,
+                 cache_path: str | Path | None=None):
+        self.model, self.method, self.target_class = model, method, target_class
+        self.xai_kw = dict(xai_kw or {})
+        self.meta = {"version": MPRT_VERSION, "arch": type(model).__name__, "depth": depth,
+                     "order": order, "seed": seed}
+        self.stages = layer_stages(model, depth, order)
+        self._live = model.state_dict()                   # shares storage with the model's tensors
+        keys = [k for _, mods in self.stages for m in mods for k in self._live if k.rsplit(".", 1)[0] == m]
+        self._orig = {k: self._live[k].detach().clone() for k in keys}
+        self._random = self._load_or_build(Path(cache_path) if cache_path else None)
+        self._sum = np.zeros(len(self.stages)); self._n = 0
+        self.last: Optional[np.ndarray] = None          # [B,S] per-stage similarities of the last batch
+
+    # ---- random cascade (built once) ---- #
+    def _build(self) -> List[Dict[str, torch.Tensor]]:
+        ref = copy.deepcopy(self.model).cpu()
+        out = []
+        with torch.random.fork_rng(devices=[]):
+            for k, (_, mods) in enumerate(self.stages):
+                torch.manual_seed(self.meta["seed"] + k)
+                for m in mods: ref.get_submodule(m).reset_parameters()
+                sd = ref.state_dict()
+                out.append({key: sd[key].clone() for m in mods for key in sd if key.rsplit(".", 1)[0] == m})
+        return out
+
+    def _load_or_build(self, path: Optional[Path]) -> List[Dict[str, torch.Tensor]]:
+        dev = next(self.model.parameters()).device
+        random = None
+        if path is not None and path.exists():
+            blob = torch.load(path, map_location="cpu")
+            if blob.get("meta") == self.meta and blob.get("stages") == [s for s, _ in self.stages]:
+                random = blob["tensors"]; logging.info("MPRT: loaded random cascade from %s", path)
+            else:
+                logging.warning("MPRT: %s was built for another model/config, rebuilding", path)
+        if random is None:
+            t0 = time.perf_counter(); random = self._build()
+            logging.info("MPRT: built %d-stage random cascade in %.1f s", len(random), time.perf_counter() - t0)
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                torch.save({"meta": self.meta, "stages": [s for s, _ in self.stages], "tensors": random}, tmp)
+                os.replace(tmp, path)
+        return [{k: v.to(dev) for k, v in stage.items()} for stage in random]
+
+    @torch.no_grad()
+    def _apply(self, tensors: Dict[str, torch.Tensor]) -> None:
+        for k, v in tensors.items(): self._live[k].copy_(v)
+
+    # ---- evaluation ---- #
+    def score(self, x: torch.Tensor, a: torch.Tensor) -> Tuple[np.ndarray, Dict[str, float]]:
+        """
+        TR: x: [B,3,H,W], a: orijinal modelin atıfları [B,1,H,W].
+        EN: x: [B,3,H,W], a: the original model's attributions [B,1,H,W].
+        Returns: (per-sample scores [B], {seconds, model_calls, model_samples}) as xai_metrics._score_metric
+        """
+        calls = [0, 0]
+        def _count(_m, inp, _out):
+            calls[0] += 1; calls[1] += int(inp[0].shape[0])
+        a0 = (a.float() / 255.0 if a.dtype == torch.uint8 else a.float()).abs()
+        t0 = time.perf_counter()
+        hook = self.model.register_forward_hook(_count)
+        sims = []
+        try:
+            for stage in self._random:                    # cascade: stages accumulate
+                with instrument.span("metric.MPRT"):
+                    self._apply(stage)
+                    ar = xai_dispatch(self.method, self.model, x, target_class=self.target_class, **self.xai_kw)
+                    sims.append(spearman_per_sample(a0, ar.float().abs()))
+        finally:
+            self._apply(self._orig); hook.remove()
+        prof = {"seconds": time.perf_counter() - t0, "model_calls": calls[0], "model_samples": calls[1]}
+        sims = torch.stack(sims).cpu().numpy()            # [S,B]
+        self._sum += sims.sum(axis=1); self._n += sims.shape[1]; self.last = sims.T
+        return sims.mean(axis=0), prof
+
+    def layout(self) -> dict:
+        """TR: Kaskad tanımı (meta + aşama adları) | EN: Cascade description (meta + stage names)"""
+        return dict(self.meta, stages=[s for s, _ in self.stages])
+
+    def curves(self) -> dict:
+        """TR: Aşama başına ortalama Spearman | EN: Mean Spearman per stage (cascade order)"""
+        mean = (self._sum / max(self._n, 1)).tolist()
+        return dict(self.layout(), n=self._n, spearman_mean=mean)
+
+def curves_from_summary(layout: dict, summary: dict) -> Optional[dict]:
+    """
+    TR: result_sink.summarize çıktısındaki örnek eğrilerinden (satır "mprt_stages") curves() biçimi;
+        parçalardan ve devam ettirilen çalıştırmalardan gelen tüm kayıtlı stem'leri kapsar.
+    EN: curves() format from the per-sample curves (row "mprt_stages") in a result_sink.summarize
+        output; covers every recorded stem across shards and resumed runs.
+    """
+    if not summary.get("mprt_stages_n"): return None
+    return dict(layout, n=summary["mprt_stages_n"], spearman_mean=summary["mprt_stages_mean"])
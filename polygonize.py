@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Tahmin maskelerinden (infer_xai.py çıktısı, karolardan birleştirilmiş sahneler dahil) bina
+    poligonları; akış halinde GeoJSON / GeoJSONSeq çıktısı.
+    - Maske sabit yükseklikli satır bantları halinde bir kez okunur; her bantta
+      cv2.connectedComponentsWithStats (8-komşuluk).
+    - Bant sınırını kesen parçalar sınır satırları üzerinden union-find ile birleştirilir; bina
+      tek poligon olarak bir kez yazılır. Kutusu max_component_px'i aşan dev bileşenler parça
+      poligonlarından MultiPolygon olarak ("split": true) yazılır.
+    - Poligon: bileşen kutusunda cv2.findContours (delikler dahil) + cv2.approxPolyDP sadeleştirme.
+    - Poligon başına güven (ortalama _prob) ve ortalama atıf (_{xai}) np.bincount ile hesaplanır;
+      piksel başına Python döngüsü yoktur, döngü yalnız bileşenler üzerindedir.
+    - Bellek: bir bant + bir bileşen penceresi (max_component_px) + açık parçaların halkaları;
+      özellikler üretildikçe dosyaya yazılır.
+EN: Building polygons from predicted masks (infer_xai.py output, including scenes stitched from tiles);
+    streamed GeoJSON / GeoJSONSeq output.
+    - The mask is read once in fixed-height row strips; each strip runs
+      cv2.connectedComponentsWithStats (8-connectivity).
+    - Pieces crossing a strip seam are merged by union-find over the seam rows, so a building is
+      written once as a single polygon. Huge components whose box exceeds max_component_px are written
+      as a MultiPolygon of their pieces ("split": true).
+    - Polygon: cv2.findContours on the component's box (holes included) + cv2.approxPolyDP simplification.
+    - Per-polygon confidence (mean _prob) and mean attribution (_{xai}) via np.bincount;
+      no per-pixel Python loops, the only loop is over components.
+    - Memory: one strip + one component window (max_component_px) + the open pieces' rings;
+      features are written as they are produced.
+
+Koordinatlar / Coordinates: GeoTIFF maskede rasterio dönüşümü + CRS (geojson: WGS84'e dönüştürülür,
+    geojsonseq: doğal CRS), aksi halde piksel (sütun, satır).
+    / rasterio transform + CRS for GeoTIFF masks (geojson: reprojected to WGS84, geojsonseq: native CRS),
+    otherwise pixel (column, row).
+
+Örnek / Example:
+    python polygonize.py --mask out/scene_mask.tif --prob out/scene_prob.tif --xai out/scene_ig.tif \\
+        --out out/scene_buildings.geojsonl --simplify 1.0 --min_area 16
+"""
+from __future__ import annotations
+import argparse, json, logging, os, time
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import cv2
+import instrument
+from common import setup_logging
+from infer_xai import RasterSource
+
+FORMATS = {".geojson": "geojson", ".json": "geojson", ".geojsonl": "geojsonseq", ".geojsons": "geojsonseq",
+           ".jsonl": "geojsonseq", ".ndjson": "geojsonseq"}
+
+# ------------------------ Vector output ------------------------ #
+class FeatureWriter:
+    """
+    TR: Özellikleri akış halinde yazar: "geojson" (FeatureCollection, artımlı) veya "geojsonseq" (satır başına bir).
+        Yazım .tmp dosyasına yapılır, close() ile atomik olarak yerine taşınır.
+    EN: Streams features: "geojson" (FeatureCollection, written incrementally) or "geojsonseq" (one per line).
+        Writes go to a .tmp file that close() atomically moves into place.
+    CRS: "geojson" RFC 7946'ya uygun olarak WGS84'e (EPSG:4326, lon/lat) dönüştürülür / is reprojected to
+        WGS84 (EPSG:4326, lon/lat) as RFC 7946 requires; "geojsonseq" keeps the native CRS (self.crs,
+        also returned by polygonize_files) so metric coordinates survive for downstream tools.
+    """
+    def __init__(self, path: str | Path, fmt: Optional[str]=None, crs: Optional[str]=None, precision: int=3):
+        self.path = Path(path); self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fmt = fmt or FORMATS.get(self.path.suffix.lower(), "geojsonseq")
+        self.precision, self.n, self.crs = precision, 0, crs
+        self._to_wgs84 = None
+        if self.fmt == "geojson" and crs:
+            self.crs, self.precision = "EPSG:4326", max(precision, 7)    # degrees: ~1 cm
+            if crs not in ("EPSG:4326", "OGC:CRS84"):
+                from rasterio.warp import transform
+                self._to_wgs84 = lambda xy: np.stack(transform(crs, "EPSG:4326", xy[:, 0], xy[:, 1]), axis=1)
+        self._tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        self._f = open(self._tmp, "w", encoding="utf-8")
+        if self.fmt == "geojson":
+            self._f.write('{"type": "FeatureCollection", "features": [\n')
+
+    def write(self, polys: List[List[np.ndarray]], props: dict) -> None:
+        """TR: polys: [[dış, delikler...], ...] (birden çoksa MultiPolygon) | EN: polys: [[outer, holes...], ...] (MultiPolygon if several)"""
+        fix = self._to_wgs84 or (lambda xy: xy)
+        coords = [[np.round(fix(r), self.precision).tolist() for r in rings] for rings in polys]
+        geom = {"type": "Polygon", "coordinates": coords[0]} if len(coords) == 1 else \
+               {"type": "MultiPolygon", "coordinates": coords}
+        s = json.dumps({"type": "Feature", "id": props["id"], "geometry": geom, "properties": props},
+                       separators=(",", ":"))
+        if self.fmt == "geojson" and self.n: self._f.write(",\n")
+        self._f.write(s if self.fmt == "geojson" else s + "\n")
+        self.n += 1
+
+    def close(self) -> None:
+        if self.fmt == "geojson": self._f.write("\n]}\n")
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        self._f.close(); Path(self._tmp).unlink(missing_ok=True)
+
+# ------------------------ Geometry ------------------------ #
+def pixel_to_world(profile: Optional[dict]):
+    """
+    TR: (sütun, satır) piksel merkezi -> dünya koordinatı fonksiyonu ve piksel alanı (harita birimi²).
+    EN: (column, row) pixel-centre -> world coordinate function and pixel area (map units²).
+    """
+    t = (profile or {}).get("transform")
+    if t is None:
+        return (lambda c, r: np.stack([c, r], axis=-1)), 1.0
+    a, b, c0, d, e, f = t.a, t.b, t.c, t.d, t.e, t.f
+    def fn(c, r):
+        c, r = c + 0.5, r + 0.5
+        return np.stack([a * c + b * r + c0, d * c + e * r + f], axis=-1)
+    return fn, abs(a * e - b * d)
+
+def _ring(xy: np.ndarray, ccw: bool) -> np.ndarray:
+    """TR: Halkayı kapatır ve yönlendirir | EN: Closes and orients the ring (RFC 7946: outer CCW, holes CW)"""
+    x, y = xy[:, 0], xy[:, 1]
+    area2 = float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+    if (area2 > 0) != ccw: xy = xy[::-1]
+    return np.concatenate([xy, xy[:1]], axis=0)
+
+def component_rings(crop: np.ndarray, simplify: float=1.0) -> List[np.ndarray]:
+    """
+    TR: Tek bileşen maskesi (uint8 0/1) -> [dış halka, delikler...] piksel (sütun, satır) olarak, kapatılmamış.
+    EN: Single-component mask (uint8 0/1) -> [outer ring, holes...] as pixel (column, row), not closed.
+    """
+    contours, hier = cv2.findContours(crop, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    def simp(c):
+        s = cv2.approxPolyDP(c, simplify, True) if simplify > 0 else c
+        return (s if len(s) >= 3 else c).reshape(-1, 2).astype(np.float64)
+    outer = [k for k in range(len(contours)) if hier[0][k][3] < 0]
+    k0 = max(outer, key=lambda k: len(contours[k])) if outer else 0
+    ring = simp(contours[k0])
+    if len(ring) < 3:
+        # TR: 1-2 piksellik çizgiler: piksel kenarlarından kutu | EN: 1-2 pixel lines: box on pixel edges
+        h, w = crop.shape
+        ring = np.array([[-0.5, -0.5], [w - 0.5, -0.5], [w - 0.5, h - 0.5], [-0.5, h - 0.5]])
+    holes = [simp(contours[k]) for k in range(len(contours)) if hier[0][k][3] == k0]
+    return [ring] + [h for h in holes if len(h) >= 3]
+
+# ------------------------ Polygonization ------------------------ #
+def _seam_pairs(up: np.ndarray, down: np.ndarray) -> np.ndarray:
+    """
+    TR: Bant sınırında 8-komşu (üst satır, alt satır) etiket çiftleri, tekil [K,2].
+    EN: Unique 8-connected (upper row, lower row) label pairs across a strip seam, [K,2].
+    """
+    pairs = []
+    for u, v in ((up, down), (up[1:], down[:-1]), (up[:-1], down[1:])):
+        k = (u > 0) & (v > 0)
+        pairs.append(np.stack([u[k], v[k]], axis=1))
+    p = np.concatenate(pairs)
+    return np.unique(p, axis=0) if len(p) else p
+
+def _first_cols(row: np.ndarray, n: int) -> np.ndarray:
+    """TR: Satırda her etiketin ilk sütunu (yoksa -1) | EN: First column of every label in a row (-1 if absent)"""
+    cols = np.full(n, -1, dtype=np.int64)
+    nz = np.flatnonzero(row)
+    ids, first = np.unique(row[nz], return_index=True)
+    cols[ids] = nz[first]
+    return cols
+
+def polygonize_scene(mask: RasterSource, writer: FeatureWriter, *, fg_class: int=1,
+                     prob: Optional[RasterSource]=None, xai: Optional[RasterSource]=None,
+                     strip_rows: int=0, max_strip_px: int=16 * 2**20, max_component_px: int=0,
+                     simplify: float=1.0, min_area: int=4) -> Dict:
+    """
+    TR: Maskeyi sabit yükseklikli bantlar halinde poligonlaştırıp writer'a akıtır.
+        - Bant içinde kalan bileşenler hemen yazılır. Sınıra değen parçalar union-find ile komşu
+          bantlarınkilerle birleştirilir; yalnız istatistikleri (alan, toplamlar, kutu, tohum piksel)
+          ve sadeleştirilmiş halkaları tutulur.
+        - Tamamlanan birleşik bileşenin kutusu max_component_px'i aşmıyorsa kutu penceresi yeniden
+          okunup tek poligon çıkarılır; aşıyorsa parçaların poligonları "split": true ile MultiPolygon yazılır.
+        prob/xai: maske ile aynı boyutta tek bant uint8 rasterler (infer_xai.py --save_prob / --xai_method).
+        strip_rows=0 -> max_strip_px / genişlik; max_component_px=0 -> max_strip_px.
+    EN: Polygonizes the mask in fixed-height strips and streams to writer.
+        - Components inside a strip are written right away. Pieces touching a seam are merged with the
+          neighbouring strips' pieces by union-find; only their statistics (area, sums, box, seed pixel)
+          and simplified rings are kept.
+        - When a merged component is complete and its box fits max_component_px, that window is re-read
+          and a single polygon extracted; otherwise the pieces' polygons are written as a MultiPolygon
+          flagged "split": true.
+        prob/xai: single-band uint8 rasters with the mask's size (infer_xai.py --save_prob / --xai_method).
+        strip_rows=0 -> max_strip_px / width; max_component_px=0 -> max_strip_px.
+    Returns: {polygons, merged, split, strips, skipped_small, seconds}
+    """
+    H, W = mask.height, mask.width
+    for r in (prob, xai):
+        if r is not None and (r.height, r.width) != (H, W):
+            raise ValueError(f"{r.path} is {r.width}x{r.height}, mask is {W}x{H}")
+    to_world, px_area = pixel_to_world(mask.profile)
+    strip = strip_rows or max(64, max_strip_px // max(W, 1))
+    cap = max_component_px or max_strip_px
+    info = {"polygons": 0, "merged": 0, "split": 0, "strips": 0, "skipped_small": 0}
+
+    def emit(polys: List[List[np.ndarray]], area: int, sp: float, sx: float, box, split: bool=False) -> None:
+        if area < min_area:
+            info["skipped_small"] += 1; return
+        info["polygons"] += 1
+        geo = [[_ring(to_world(r[:, 0], r[:, 1]), ccw=(k == 0)) for k, r in enumerate(rings)] for rings in polys]
+        t, l, b, r = box
+        props = {"id": info["polygons"], "area_px": int(area), "area": float(area) * px_area,
+                 "bbox_px": [int(l), int(t), int(r - l + 1), int(b - t + 1)]}
+        if prob is not None: props["confidence"] = round(sp / (255.0 * area), 4)
+        if xai is not None: props["attribution"] = round(sx / (255.0 * area), 4)
+        if split: props["split"] = True
+        writer.write(geo, props)
+
+    def finish(acc: dict) -> None:
+        t, l, b, r = acc["box"]
+        info["merged"] += 1
+        if acc["area"] >= min_area and (b - t + 1) * (r - l + 1) <= cap:
+            crop = (mask.read(t, b + 1, l, r + 1) == fg_class).astype(np.uint8)
+            _, labc = cv2.connectedComponents(crop, connectivity=8, ltype=cv2.CV_32S)
+            sr, sc = acc["seed"]
+            comp = (labc == labc[sr - t, sc - l]).astype(np.uint8)
+            polys = [[ring + (l, t) for ring in component_rings(comp, simplify)]]
+            emit(polys, acc["area"], acc["sp"], acc["sx"], acc["box"])
+        else:
+            info["split"] += acc["area"] >= min_area
+            emit(acc["parts"], acc["area"], acc["sp"], acc["sx"], acc["box"], split=True)
+
+    parent: Dict[int, int] = {}
+    pend: Dict[int, dict] = {}                                          # root -> merged statistics
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]; i = parent[i]
+        return i
+
+    t0 = time.perf_counter()
+    y0, off, prev_last = 0, 0, None
+    while y0 < H:
+        y1 = min(H, y0 + strip)
+        with instrument.span("polygonize.components"):
+            m = (mask.read(y0, y1, 0, W) == fg_class).astype(np.uint8)
+            n, lab, stats, _ = cv2.connectedComponentsWithStats(m, connectivity=8, ltype=cv2.CV_32S)
+            del m
+        top, left = stats[:, cv2.CC_STAT_TOP], stats[:, cv2.CC_STAT_LEFT]
+        hgt, wid, area = stats[:, cv2.CC_STAT_HEIGHT], stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_AREA]
+        sp = np.bincount(lab.ravel(), weights=prob.read(y0, y1, 0, W).ravel(), minlength=n) \
+            if prob is not None else np.zeros(n)
+        sx = np.bincount(lab.ravel(), weights=xai.read(y0, y1, 0, W).ravel(), minlength=n) \
+            if xai is not None else np.zeros(n)
+        first = np.where(lab[0] > 0, lab[0].astype(np.int64) + off, 0)
+        pairs = _seam_pairs(prev_last, first) if prev_last is not None else np.zeros((0, 2), np.int64)
+        at_bottom = (top + hgt == y1 - y0) & (y1 < H); at_bottom[0] = False
+        seam = at_bottom.copy(); seam[pairs[:, 1] - off] = True
+
+        with instrument.span("polygonize.vectorize"):
+            for i in np.flatnonzero(~seam):                              # complete inside this strip
+                if i == 0: continue
+                t, l = int(top[i]), int(left[i])
+                if area[i] < min_area:
+                    info["skipped_small"] += 1; continue
+                crop = (lab[t:t+hgt[i], l:l+wid[i]] == i).astype(np.uint8)
+                emit([[ring + (l, y0 + t) for ring in component_rings(crop, simplify)]], int(area[i]),
+                     float(sp[i]), float(sx[i]), (y0 + t, l, y0 + t + hgt[i] - 1, l + wid[i] - 1))
+            # seam pieces: statistics + rings, merged across the seam
+            c_top, c_bot = _first_cols(lab[0], n), _first_cols(lab[-1], n)
+            for i in np.flatnonzero(seam):
+                t, l = int(top[i]), int(left[i])
+                crop = (lab[t:t+hgt[i], l:l+wid[i]] == i).astype(np.uint8)
+                seed = (y0, int(c_top[i])) if c_top[i] >= 0 else (y1 - 1, int(c_bot[i]))
+                g = off + int(i); parent[g] = g
+                pend[g] = {"area": int(area[i]), "sp": float(sp[i]), "sx": float(sx[i]), "seed": seed,
+                           "box": [y0 + t, l, y0 + t + int(hgt[i]) - 1, l + int(wid[i]) - 1],
+                           "parts": [[ring + (l, y0 + t) for ring in component_rings(crop, simplify)]]}
+            for u, v in pairs.tolist():
+                ru, rv = find(u), find(v)
+                if ru == rv: continue
+                a, b = pend[ru], pend.pop(rv); parent[rv] = ru
+                a["area"] += b["area"]; a["sp"] += b["sp"]; a["sx"] += b["sx"]; a["parts"] += b["parts"]
+                a["box"] = [min(a["box"][0], b["box"][0]), min(a["box"][1], b["box"][1]),
+                            max(a["box"][2], b["box"][2]), max(a["box"][3], b["box"][3])]
+            # components with no piece on this strip's bottom row are complete
+            bottom_ids = [off + int(i) for i in np.flatnonzero(at_bottom)]
+            active = {find(g) for g in bottom_ids}
+            for root in [root for root in pend if root not in active]:
+                finish(pend.pop(root))
+            parent = {g: find(g) for g in bottom_ids}; parent.update((root, root) for root in active)
+
+        prev_last = np.where(lab[-1] > 0, lab[-1].astype(np.int64) + off, 0) if y1 < H else None
+        instrument.count("polygonize_strips")
+        info["strips"] += 1; off += n; y0 = y1
+    for acc in pend.values(): finish(acc)                              # defensive: nothing open at the end
+    info["seconds"] = time.perf_counter() - t0
+    return info
+
+def polygonize_files(mask_path: str | Path, out_path: str | Path, *, prob_path=None, xai_path=None,
+                     profile: Optional[dict]=None, fmt: Optional[str]=None, precision: int=3, **kw) -> Dict:
+    """
+    TR: Dosya yollarıyla polygonize_scene. profile: maskenin yerine kullanılacak rasterio profili
+        (örn. .npy/PNG çıktılarda kaynak GeoTIFF'in dönüşümü ve CRS'i).
+    EN: polygonize_scene on file paths. profile: rasterio profile to use instead of the mask's
+        (e.g. the source GeoTIFF's transform and CRS for .npy/PNG outputs).
+    """
+    mask = RasterSource(mask_path, bands=1)
+    if profile is not None: mask.profile = profile
+    prob = RasterSource(prob_path, bands=1) if prob_path else None
+    xai = RasterSource(xai_path, bands=1) if xai_path else None
+    crs = (mask.profile or {}).get("crs")
+    writer = FeatureWriter(out_path, fmt, crs.to_string() if crs is not None else None, precision)
+    try:
+        info = polygonize_scene(mask, writer, prob=prob, xai=xai, **kw)
+        writer.close()
+    except BaseException:
+        writer.abort(); raise
+    finally:
+        for r in (mask, prob, xai):
+            if r is not None: r.close()
+    logging.info("%s: %d polygons from %d strips (%d merged across seams, %d split, %d below min_area) in %.1f s",
+                 Path(mask_path).name, info["polygons"], info["strips"], info["merged"], info["split"],
+                 info["skipped_small"], info["seconds"])
+    return dict(info, out=str(out_path), format=writer.fmt, crs=writer.crs)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mask", type=str, required=True, help="TR: Sınıf id maskesi | EN: Class-id mask (infer_xai _mask)")
+    ap.add_argument("--prob", type=str, default=None, help="TR: Olasılık rasteri (_prob) | EN: Probability raster (_prob)")
+    ap.add_argument("--xai", type=str, default=None, help="TR: Atıf rasteri (_{xai}) | EN: Attribution raster (_{xai})")
+    ap.add_argument("--out", type=str, required=True)
+    ap.add_argument("--format", type=str, default=None, choices=["geojson","geojsonseq"],
+                    help="TR: Boşsa uzantıdan | EN: Inferred from the suffix when empty")
+    ap.add_argument("--fg_class", type=int, default=1)
+    ap.add_argument("--simplify", type=float, default=1.0,
+                    help="TR: Douglas-Peucker toleransı (piksel, 0 = kapalı) | EN: Douglas-Peucker tolerance (pixels, 0 = off)")
+    ap.add_argument("--min_area", type=int, default=4, help="TR: En küçük alan (piksel) | EN: Minimum area (pixels)")
+    ap.add_argument("--strip_rows", type=int, default=0,
+                    help="TR: Bant yüksekliği (0 = otomatik) | EN: Strip height (0 = from --max_strip_mpx)")
+    ap.add_argument("--max_strip_mpx", type=float, default=16.0,
+                    help="TR: Bant başına en çok megapiksel | EN: Max megapixels per strip (bounds memory)")
+    ap.add_argument("--max_component_mpx", type=float, default=0.0,
+                    help="TR: Birleşik bileşen penceresi sınırı (0 = --max_strip_mpx) | "
+                         "EN: Window cap for merged components (0 = --max_strip_mpx); larger ones are split")
+    ap.add_argument("--precision", type=int, default=3, help="TR: Koordinat ondalığı | EN: Coordinate decimals")
+    args = ap.parse_args()
+
+    setup_logging()
+    info = polygonize_files(args.mask, args.out, prob_path=args.prob, xai_path=args.xai, fmt=args.format,
+                            precision=args.precision, fg_class=args.fg_class, strip_rows=args.strip_rows,
+                            max_strip_px=int(args.max_strip_mpx * 2**20),
+                            max_component_px=int(args.max_component_mpx * 2**20), simplify=args.simplify,
+                            min_area=args.min_area)
+    print("Saved:", info["out"])
+
+if __name__ == "__main__":
+    main()
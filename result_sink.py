@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Artımlı, devam ettirilebilir değerlendirme sonuçları (satır-ayrımlı JSON, .jsonl).
+    Her batch bittiğinde örnek başına bir satır eklenir ve diske zorlanır (fsync);
+    yeniden başlatmada kayıtlı stem'ler atlanır. Özetler (ortalama, std, yüzdelikler) dosyadan hesaplanır.
+EN: Incremental, resumable evaluation results (line-delimited JSON, .jsonl).
+    One row per sample is appended and fsync'ed as each batch finishes;
+    on restart recorded stems are skipped. Summaries (mean, std, percentiles) are computed from the file.
+
+Satır / Row: {"stem", "method", "model", "dataset", "class", "metrics": {...}, "seconds": {...}}
+             artımlı MPRT ile / with incremental MPRT: + "mprt_stages": [aşama başına / per stage Spearman]
+             kapıdan geçemeyen / gated: {"stem", ..., "skipped": true, "fg_fraction": f, "min_fg": t}
+"""
+from __future__ import annotations
+import os, json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set
+import numpy as np
+
+KEY_FIELDS = ("method", "model", "dataset", "class")
+PERCENTILES = (5, 25, 50, 75, 95)
+
+def read_rows(path: str | Path, key: Optional[dict]=None) -> Iterator[dict]:
+    """
+    TR: Satırları okur (yarım kalmış son satır atlanır); key verilirse yalnız eşleşenler.
+    EN: Reads rows (a torn last line is skipped); with key, only matching rows.
+    """
+    p = Path(path)
+    if not p.exists(): return
+    with open(p, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if key and any(row.get(k) != v for k, v in key.items()): continue
+            yield row
+
+class ResultSink:
+    """
+    TR: Tek bir (yöntem, model, veri seti, sınıf) hücresi için ekleme-yalnız sonuç dosyası.
+        Kapıdan geçemeyen bir stem yalnız min_fg, kaydedildiği eşikten küçük değilse tamamlanmış sayılır
+        (eşik düşürülünce yeniden değerlendirilir).
+    EN: Append-only result file for one (method, model, dataset, class) cell.
+        A gated stem only counts as done if min_fg is not below the threshold it was recorded with
+        (lowering the threshold re-evaluates it).
+    """
+    def __init__(self, path: str | Path, key: dict, min_fg: float=0.0):
+        self.path = Path(path); self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.key = {k: key[k] for k in KEY_FIELDS}
+        latest: Dict[str, dict] = {}
+        for r in read_rows(self.path, self.key): latest[r["stem"]] = r
+        self.done: Set[str] = {s for s, r in latest.items()
+                               if not r.get("skipped") or min_fg >= r.get("min_fg", float("inf"))}
+
+    def write(self, rows: Iterable[dict]) -> None:
+        lines = [json.dumps(dict(self.key, **r), default=float) for r in rows]
+        if not lines: return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush(); os.fsync(f.fileno())
+        self.done.update(json.loads(l)["stem"] for l in lines)
+
+def batch_rows(stems: Sequence[str], scores: Dict[str, np.ndarray], profile: Dict[str, dict],
+               xai_seconds: float, extra: Optional[dict]=None) -> List[dict]:
+    """
+    TR: Batch sonuçlarını örnek satırlarına böler (süreler örnek başına paylaştırılır).
+    EN: Splits batch results into per-sample rows (timings are amortised per sample).
+    """
+    b = len(stems)
+    sec = {k: v["seconds"] / b for k, v in profile.items()}
+    sec["xai"] = xai_seconds / b
+    return [dict({"stem": s, "metrics": {k: float(v[i]) for k, v in scores.items()}, "seconds": sec},
+                 **(extra or {})) for i, s in enumerate(stems)]
+
+def summarize(path: str | Path | Sequence[str | Path], key: Optional[dict]=None,
+              percentiles: Sequence[int]=PERCENTILES) -> dict:
+    """
+    TR: Dosya(lar)dan metrik başına ortalama, std ve yüzdelikler (aynı stem birden çok kez varsa sonuncusu).
+    EN: Per-metric mean, std and percentiles from the file(s) (last row wins for duplicate stems).
+    """
+    paths = [path] if isinstance(path, (str, Path)) else list(path)
+    latest: Dict[str, dict] = {}
+    for p in paths:
+        for r in read_rows(p, key):
+            latest[r["stem"]] = r
+    rows = [r for r in latest.values() if r.get("metrics")]
+    skipped = sorted(s for s, r in latest.items() if r.get("skipped"))
+    names = list(dict.fromkeys(k for r in rows for k in r["metrics"]))
+    vals = {k: np.array([r["metrics"][k] for r in rows if k in r["metrics"]], dtype=np.float64) for k in names}
+    curves = [r["mprt_stages"] for r in rows if r.get("mprt_stages")]
+    out = {
+        "n": len(rows),
+        "skipped": skipped,
+        "metrics_mean": {k: float(np.nanmean(v)) for k, v in vals.items()},
+        "metrics_std": {k: float(np.nanstd(v)) for k, v in vals.items()},
+        "metrics_percentiles": {k: {f"p{q}": float(np.nanpercentile(v, q)) for q in percentiles}
+                                for k, v in vals.items()},
+        "seconds_total": {k: float(sum(r["seconds"].get(k, 0.0) for r in rows))
+                          for k in dict.fromkeys(k for r in rows for k in r.get("seconds", {}))},
+    }
+    if curves and len({len(c) for c in curves}) == 1:   # one cascade per cell
+        out.update(mprt_stages_n=len(curves), mprt_stages_mean=np.nanmean(np.array(curves, dtype=np.float64), axis=0).tolist())
+    return out
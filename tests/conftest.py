@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""TR: Depo kökündeki modüller için import yolu | EN: Import path for the top-level modules"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -1,88 +1,92 @@
 # -*- coding: utf-8 -*-
 """
 TR: Genel eğitim script'i (SPOT6/7 & MAXAR_İzmir; U-Net++, DeepLabv3+, PSPNet).
-    - Kayıp: CrossEntropy + (opsiyonel) Dice Loss
-    - Metrikler (val): mIoU, Dice, Recall, Precision, Accuracy (+ sınıf-1 IoU/Dice/Rec/Prec)
+    - Kayıp: CrossEntropy + (opsiyonel) Dice Loss (tek log-softmax ile birleşik, CEDiceLoss)
+    - Performans modu (--perf): autocast (CPU'da bf16), gradyan biriktirme, channels_last, img/s raporu
+    - Veri hattı: işçilerden uint8, ana süreçte batch halinde float + artırma (--augment), aşama süreleri
+    - Tam eğitim durumu kontrol noktaları (--ckpt_every, --resume), erken durdurma (--patience), LR zamanlayıcı
+    - Metrikler (val): mIoU, Dice, Recall, Precision, Accuracy (+ sınıf-1 IoU/Dice/Rec/Prec),
+      hepsi epoch boyunca cihazda biriken tek bir karışıklık matrisinden
 EN: Generic training script (SPOT6/7 & MAXAR_İzmir; U-Net++, DeepLabv3+, PSPNet).
-    - Loss: CrossEntropy + (optional) Dice Loss
-    - Metrics (val): mIoU, Dice, Recall, Precision, Accuracy (+ class-1 IoU/Dice/Rec/Prec)
+    - Loss: CrossEntropy + (optional) Dice Loss (fused on a single log-softmax, CEDiceLoss)
+    - Performance mode (--perf): autocast (bf16 on CPU), gradient accumulation, channels_last, img/s report
+    - Data pipeline: uint8 from workers, batched float + augmentation (--augment) in the main process, stage timing
+    - Full training-state checkpoints (--ckpt_every, --resume), early stopping (--patience), LR scheduler
+    - Metrics (val): mIoU, Dice, Recall, Precision, Accuracy (+ class-1 IoU/Dice/Rec/Prec),
+      all from one confusion matrix accumulated on device over the epoch
 """
 from __future__ import annotations
-import argparse, json
+import argparse, json, logging, time, contextlib
 from pathlib import Path
 import torch, torch.nn as nn
-from torch.utils.data import DataLoader
 
-from common import setup_logging, set_seed, ensure_dir, to_device, one_hot
+from common import (setup_logging, set_seed, ensure_dir, ConfusionMeter,
+                    get_rng_state, set_rng_state, save_checkpoint, load_checkpoint)
 from dataset import make_dataset
+from data_pipeline import make_loader, BatchPipeline, StageTimer, timed_batches
+import instrument
 from models import build_model, logits_to_mask
 
-# ------------------------ Dice Loss ------------------------ #
-class DiceLoss(nn.Module):
+# ------------------------ Loss ------------------------ #
+class CEDiceLoss(nn.Module):
     """
-    TR: Çok sınıflı dice loss (softmax olasılıkları + one-hot hedef).
-    EN: Multi-class Dice loss (softmax probs + one-hot targets).
+    TR: Birleşik CrossEntropy + Dice kaybı. log-softmax bir kez hesaplanır; Dice kesişimi hedef
+        indekslerinde gather ile, sınıf piksel sayıları index_add ile bulunur (one-hot yok).
+        Değer olarak CrossEntropyLoss() + dice_weight * (1 - ortalama sınıf Dice'ı) ile aynıdır.
+        Birleşim terimi için tek bir [B,C,H,W] olasılık tensörü kalır (exp'in geri yayılımı ona ihtiyaç duyar).
+    EN: Fused CrossEntropy + Dice loss. log-softmax is computed once; the Dice intersection is
+        gathered at the target indices and class pixel counts come from index_add (no one-hot).
+        Numerically equal to CrossEntropyLoss() + dice_weight * (1 - mean per-class Dice).
+        One [B,C,H,W] probability tensor remains for the union term (exp's backward needs it anyway).
     """
-    def __init__(self, eps: float = 1e-6):
+    def __init__(self, dice_weight: float = 0.5, eps: float = 1e-6):
         super().__init__()
-        self.eps = eps
+        self.dice_weight, self.eps = dice_weight, eps
 
     def forward(self, logits: torch.Tensor, target_ids: torch.Tensor) -> torch.Tensor:
         # logits: [B,C,H,W], target_ids: [B,H,W]
-        probs = torch.softmax(logits, dim=1)                               # [B,C,H,W]
-        target_oh = nn.functional.one_hot(target_ids, probs.size(1))       # [B,H,W,C]
-        target_oh = target_oh.permute(0, 3, 1, 2).float()                  # [B,C,H,W]
-        inter = (probs * target_oh).sum(dim=(0,2,3))                       # [C]
-        union = probs.sum(dim=(0,2,3)) + target_oh.sum(dim=(0,2,3))        # [C]
-        dice_c = (2*inter + self.eps) / (union + self.eps)                 # [C]
-        dice = dice_c.mean()
-        return 1.0 - dice
-
-# ---------------------- Metric helpers --------------------- #
-def mean_iou(pred: torch.Tensor, target: torch.Tensor, num_classes: int=2, eps: float=1e-7):
-    """
-    TR: Sınıf-ortalamalı IoU (argmax sonrası).
-    EN: Mean IoU across classes (after argmax).
-    """
-    pred = pred.squeeze(1)   # [B,H,W]
-    target = target.squeeze(1)
-    ious = []
-    for c in range(num_classes):
-        p = (pred==c); t=(target==c)
-        inter = (p & t).sum().float()
-        union = (p | t).sum().float()
-        iou = (inter + eps)/(union + eps)
-        ious.append(iou)
-    return torch.stack(ious).mean().item()
-
-def binary_confusion(pred: torch.Tensor, target: torch.Tensor, fg_class: int=1):
+        c = logits.size(1)
+        logp = torch.log_softmax(logits.float(), dim=1)                    # [B,C,H,W]
+        logp_t = logp.gather(1, target_ids.unsqueeze(1)).squeeze(1)        # [B,H,W]
+        ce = -logp_t.mean()
+        if self.dice_weight <= 0:
+            return ce
+        t = target_ids.reshape(-1)
+        zeros = torch.zeros(c, device=logits.device, dtype=logp.dtype)
+        inter = zeros.index_add(0, t, logp_t.exp().reshape(-1))            # [C] sum of p at targets
+        count = zeros.index_add(0, t, torch.ones_like(logp_t).reshape(-1)) # [C] target pixels
+        union = logp.exp().sum(dim=(0,2,3)) + count                        # [C] (the one full-size temporary)
+        dice = ((2*inter + self.eps) / (union + self.eps)).mean()
+        return ce + self.dice_weight * (1.0 - dice)
+
+# ---------------------- Performance ----------------------- #
+def resolve_amp(amp: str, device: str) -> torch.dtype | None:
     """
-    TR: İkili karışıklık matrisi (hedef sınıf=fg_class) -> TP, FP, TN, FN.
-    EN: Binary confusion for a given foreground class -> TP, FP, TN, FN.
+    TR: Karma hassasiyet tipi: "auto" -> CUDA'da fp16, CPU'da bf16.
+    EN: Mixed-precision dtype: "auto" -> fp16 on CUDA, bf16 on CPU.
     """
-    pred = pred.squeeze(1)
-    target = target.squeeze(1)
-    p = (pred==fg_class)
-    t = (target==fg_class)
-    tp = (p & t).sum().item()
-    fp = (p & ~t).sum().item()
-    fn = (~p & t).sum().item()
-    tn = (~p & ~t).sum().item()
-    return tp, fp, tn, fn
-
-def binary_metrics_from_conf(tp, fp, tn, fn, eps: float=1e-7):
+    if amp == "off": return None
+    if amp == "auto": amp = "fp16" if str(device).startswith("cuda") else "bf16"
+    return {"fp16": torch.float16, "bf16": torch.bfloat16}[amp]
+
+def autocast_ctx(device: str, dtype: torch.dtype | None):
+    """TR: autocast bağlamı (kapalıysa boş) | EN: autocast context (no-op when disabled)"""
+    if dtype is None: return contextlib.nullcontext()
+    return torch.autocast(device_type=torch.device(device).type, dtype=dtype)
+
+# --------------------------- Main -------------------------- #
+def make_scheduler(opt: torch.optim.Optimizer, kind: str, epochs: int, min_lr: float=0.0, patience: int=2):
     """
-    TR: Recall, Precision, Accuracy, Dice ve IoU hesapla.
-    EN: Compute Recall, Precision, Accuracy, Dice and IoU.
+    TR: Epoch başına LR zamanlayıcı: "cosine" (epochs boyunca min_lr'ye) veya "plateau" (val mIoU'ya göre yarılama).
+    EN: Per-epoch LR scheduler: "cosine" (down to min_lr over epochs) or "plateau" (halve on val mIoU plateau).
     """
-    recall = tp / (tp + fn + eps)
-    precision = tp / (tp + fp + eps)
-    accuracy = (tp + tn) / (tp + tn + fp + fn + eps)
-    dice = (2*tp) / (2*tp + fp + fn + eps)
-    iou = tp / (tp + fp + fn + eps)
-    return dict(recall=recall, precision=precision, accuracy=accuracy, dice=dice, iou=iou)
+    if kind == "none": return None
+    if kind == "cosine":
+        return torch.optim.lr_scheduler.CosineAnnealingLR(opt, T_max=max(1, epochs), eta_min=min_lr)
+    if kind == "plateau":
+        return torch.optim.lr_scheduler.ReduceLROnPlateau(opt, mode="max", factor=0.5, patience=patience, min_lr=min_lr)
+    raise ValueError(f"Unknown lr scheduler: {kind}")
 
-# --------------------------- Main -------------------------- #
 def main():
     ap = argparse.ArgumentParser()
     # Data
@@ -90,6 +94,8 @@ def main():
     ap.add_argument("--root", type=str, required=True)
     ap.add_argument("--list_dir", type=str, default=None)
     ap.add_argument("--img_size", type=int, default=512)
+    ap.add_argument("--cache_dir", type=str, default=None,
+                    help="TR: Çözülmüş uint8 önbellek klasörü | EN: Decode-once uint8 cache directory")
     # Model
     ap.add_argument("--model", type=str, required=True, choices=["unet++","deeplabv3+","pspnet"])
     ap.add_argument("--encoder", type=str, default="resnet34")
@@ -101,85 +107,171 @@ def main():
     ap.add_argument("--out_dir", type=str, required=True)
     ap.add_argument("--seed", type=int, default=42)
     ap.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    # Performance
+    ap.add_argument("--perf", action="store_true",
+                    help="TR: --amp auto --channels_last kısayolu | EN: Shortcut for --amp auto --channels_last")
+    ap.add_argument("--amp", type=str, default="off", choices=["off","auto","fp16","bf16"],
+                    help="TR: Karma hassasiyet | EN: Mixed precision (auto: fp16 on CUDA, bf16 on CPU)")
+    ap.add_argument("--accum_steps", type=int, default=1,
+                    help="TR: Gradyan biriktirme adımı (etkin batch = batch_size*accum_steps) | "
+                         "EN: Gradient accumulation steps (effective batch = batch_size*accum_steps)")
+    ap.add_argument("--channels_last", action="store_true")
+    # Input pipeline
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--prefetch", type=int, default=2,
+                    help="TR: İşçi başına önceden yüklenen batch | EN: Batches prefetched per worker")
+    ap.add_argument("--no_persistent_workers", action="store_true")
+    ap.add_argument("--augment", action="store_true",
+                    help="TR: Batch üzerinde rastgele çevirme/90° döndürme | EN: Random flips/90° rotations on the batch")
+    ap.add_argument("--sync_timing", action="store_true",
+                    help="TR: Aşama sürelerinde CUDA senkronizasyonu | EN: Synchronize CUDA for exact stage timing")
     # Loss mix
     ap.add_argument("--dice_weight", type=float, default=0.5,
                     help="TR: Toplam kayıpta Dice katsayısı | EN: Weight of Dice in total loss")
     ap.add_argument("--fg_class", type=int, default=1,
                     help="TR: İstatistikler için ön-plan sınıf id | EN: Foreground class id for stats")
+    # Checkpoints / stopping / schedule
+    ap.add_argument("--ckpt_every", type=int, default=1,
+                    help="TR: Kaç epoch'ta bir tam durum kaydı (0=kapalı) | EN: Full-state checkpoint every N epochs (0=off)")
+    ap.add_argument("--resume", type=str, default=None,
+                    help="TR: Kontrol noktası yolu veya 'auto' (out_dir/last_*.ckpt) | EN: Checkpoint path or 'auto' (out_dir/last_*.ckpt)")
+    ap.add_argument("--patience", type=int, default=0,
+                    help="TR: İyileşmeyen epoch sınırı (0=kapalı) | EN: Epochs without val mIoU gain before stopping (0=off)")
+    ap.add_argument("--min_delta", type=float, default=0.0,
+                    help="TR: İyileşme sayılacak en küçük mIoU artışı | EN: Smallest mIoU gain counted as improvement")
+    ap.add_argument("--lr_scheduler", type=str, default="none", choices=["none","cosine","plateau"])
+    ap.add_argument("--min_lr", type=float, default=0.0)
+    ap.add_argument("--lr_patience", type=int, default=2,
+                    help="TR: plateau için bekleme | EN: Epochs without gain before plateau halves the LR")
+    # Instrumentation
+    ap.add_argument("--profile", action="store_true",
+                    help="TR: Span/sayaç enstrümantasyonu | EN: Span/counter instrumentation (summary logged + JSON)")
+    ap.add_argument("--trace", type=str, default=None,
+                    help="TR: İz dosyası (.json) | EN: Trace file (.json, open in chrome://tracing or Perfetto)")
+    ap.add_argument("--trace_kind", type=str, default="chrome", choices=["chrome","torch"],
+                    help="TR: chrome = kendi span'lerimiz, torch = torch.profiler | EN: chrome = our spans, torch = torch.profiler")
     args = ap.parse_args()
 
-    setup_logging(); set_seed(args.seed)
+    setup_logging(instrument=args.profile, trace=args.trace, trace_kind=args.trace_kind); set_seed(args.seed)
     out = ensure_dir(args.out_dir)
+    if args.perf:
+        args.channels_last = True
+        if args.amp == "off": args.amp = "auto"
+    amp_dtype = resolve_amp(args.amp, args.device)
+    mem_fmt = torch.channels_last if args.channels_last else torch.contiguous_format
+    use_scaler = amp_dtype == torch.float16 and str(args.device).startswith("cuda")
+    scaler = torch.cuda.amp.GradScaler(enabled=use_scaler)
+    accum = max(1, args.accum_steps)
+    logging.info("Precision=%s | channels_last=%s | accum_steps=%d (effective batch %d)",
+                 amp_dtype or "fp32", args.channels_last, accum, args.batch_size * accum)
 
     # Datasets & loaders
-    train_ds = make_dataset(args.dataset, args.root, "train", args.img_size, args.list_dir)
-    val_ds   = make_dataset(args.dataset, args.root, "val",   args.img_size, args.list_dir)
-    train_loader = DataLoader(train_ds, batch_size=args.batch_size, shuffle=True,  num_workers=4, pin_memory=True)
-    val_loader   = DataLoader(val_ds,   batch_size=args.batch_size, shuffle=False, num_workers=4, pin_memory=True)
+    train_ds = make_dataset(args.dataset, args.root, "train", args.img_size, args.list_dir, args.cache_dir, as_uint8=True)
+    val_ds   = make_dataset(args.dataset, args.root, "val",   args.img_size, args.list_dir, args.cache_dir, as_uint8=True)
+    pin = str(args.device).startswith("cuda")
+    loader_kw = dict(workers=args.workers, prefetch=args.prefetch, persistent=not args.no_persistent_workers, pin_memory=pin)
+    train_loader = make_loader(train_ds, args.batch_size, shuffle=True,  **loader_kw)
+    val_loader   = make_loader(val_ds,   args.batch_size, shuffle=False, **loader_kw)
+    train_pipe = BatchPipeline(args.device, augment=args.augment, channels_last=args.channels_last, seed=args.seed)
+    val_pipe   = BatchPipeline(args.device, channels_last=args.channels_last)
+    timer = StageTimer(args.device, sync=args.sync_timing)
 
     # Model & losses
-    model = build_model(args.model, num_classes=args.num_classes, encoder_name=args.encoder).to(args.device)
+    model = build_model(args.model, num_classes=args.num_classes, encoder_name=args.encoder)
+    model = model.to(args.device, memory_format=mem_fmt)
+    instrument.watch_model(model)
     opt = torch.optim.AdamW(model.parameters(), lr=args.lr)
-    ce_loss = nn.CrossEntropyLoss()
-    dice_loss = DiceLoss()
+    sched = make_scheduler(opt, args.lr_scheduler, args.epochs, args.min_lr, args.lr_patience)
+    criterion = CEDiceLoss(dice_weight=args.dice_weight)
 
+    meter = ConfusionMeter(args.num_classes, args.device)
     best_miou, best_path = -1.0, None
+    tag = f"{args.model.replace('+','plus')}_{args.dataset}"
+    ckpt_path = Path(out)/f"last_{tag}.ckpt"
+    start_epoch, bad_epochs, stopped_early, tr_ips, resumed_from = 1, 0, False, 0.0, None
+    resume = ckpt_path if args.resume == "auto" else (Path(args.resume) if args.resume else None)
+    if resume is not None and resume.exists():
+        ck = load_checkpoint(resume)
+        model.load_state_dict(ck["model"]); opt.load_state_dict(ck["optimizer"])
+        if sched is not None and ck.get("scheduler"):
+            sched.load_state_dict(ck["scheduler"])
+            if args.lr_scheduler == "cosine" and sched.T_max != max(1, args.epochs):
+                logging.warning("Cosine T_max %d -> %d (--epochs changed); LR continues towards the new horizon",
+                                sched.T_max, max(1, args.epochs))
+                sched.T_max = max(1, args.epochs)
+        if ck.get("scaler"): scaler.load_state_dict(ck["scaler"])
+        set_rng_state(ck["rng"]); train_pipe.gen.set_state(ck["aug_rng"])
+        best_miou, bad_epochs = ck["best_miou"], ck["bad_epochs"]
+        best_path = Path(ck["best_path"]) if ck.get("best_path") else None
+        start_epoch, resumed_from = ck["epoch"] + 1, str(resume)
+        logging.info("Resumed from %s (epoch %d, best mIoU %.4f)", resume, ck["epoch"], best_miou)
+        # a finished or early-stopped run (under the current --patience) has nothing left to do
+        if start_epoch > args.epochs or (ck.get("stopped_early") and 0 < args.patience <= bad_epochs):
+            logging.info("Run already %s at epoch %d; nothing to resume",
+                         "stopped early" if ck.get("stopped_early") else "finished", ck["epoch"])
+            return
+    elif args.resume and args.resume != "auto":
+        raise FileNotFoundError(f"--resume checkpoint not found: {resume}")
+
+    def checkpoint(epoch: int) -> None:
+        save_checkpoint(ckpt_path, {
+            "version": 1, "epoch": epoch, "model": model.state_dict(), "optimizer": opt.state_dict(),
+            "scheduler": sched.state_dict() if sched is not None else None,
+            "scaler": scaler.state_dict() if use_scaler else None,
+            "best_miou": best_miou, "best_path": str(best_path) if best_path else None, "bad_epochs": bad_epochs,
+            "stopped_early": stopped_early,
+            "rng": get_rng_state(), "aug_rng": train_pipe.gen.get_state(), "args": vars(args)})
 
-    for epoch in range(1, args.epochs+1):
+    for epoch in range(start_epoch, args.epochs+1):
         # ====================== TRAIN ====================== #
         model.train()
-        tr_loss_sum, n_tr = 0.0, 0
-        for batch in train_loader:
-            batch = to_device(batch, args.device)
-            x = batch["image"]                                 # [B,3,H,W]
-            y_ids = batch["mask"].squeeze(1).long()            # [B,H,W]
-            opt.zero_grad(set_to_none=True)
-            logits = model(x)                                   # [B,C,H,W]
-            loss_ce = ce_loss(logits, y_ids)
-            loss_dice = dice_loss(logits, y_ids) if args.dice_weight>0 else 0.0
-            loss = loss_ce + args.dice_weight*loss_dice
-            loss.backward()
-            opt.step()
+        tr_loss_sum = torch.zeros((), device=args.device); n_tr = 0
+        n_steps = len(train_loader)
+        opt.zero_grad(set_to_none=True)
+        timer.reset()
+        t0 = time.perf_counter()
+        for step, batch in enumerate(timed_batches(train_loader, train_pipe, timer), 1):
+            x = batch["image"]                                  # [B,3,H,W] float, on device
+            y_ids = batch["mask"].squeeze(1)                    # [B,H,W] long
+            with autocast_ctx(args.device, amp_dtype):
+                logits = model(x)                               # [B,C,H,W]
+                loss = criterion(logits, y_ids)                 # CE + dice_weight*Dice
+            group = min(accum, n_steps - (step - 1) // accum * accum)  # last group may be shorter
+            with instrument.span("train.backward"):
+                scaler.scale(loss / group).backward()
+            if step % accum == 0 or step == n_steps:
+                with instrument.span("train.optimizer"):
+                    scaler.step(opt); scaler.update()
+                    opt.zero_grad(set_to_none=True)
             bs = x.size(0)
-            tr_loss_sum += float(loss.item()) * bs
+            tr_loss_sum += loss.detach().float() * bs
             n_tr += bs
-        tr_loss = tr_loss_sum / max(1, n_tr)
+        tr_loss = tr_loss_sum.item() / max(1, n_tr)                # .item() syncs the device
+        tr_ips = n_tr / max(1e-9, time.perf_counter() - t0)
 
         # ======================= VAL ======================= #
         model.eval()
-        vl_loss_sum, n_vl = 0.0, 0
-        # accumulators for metrics
-        tp_tot = fp_tot = tn_tot = fn_tot = 0
-        miou_sum, dice_sum = 0.0, 0.0
+        vl_loss_sum = torch.zeros((), device=args.device); n_vl = 0
+        meter.reset()
 
         with torch.no_grad():
-            for batch in val_loader:
-                batch = to_device(batch, args.device)
+            for batch in timed_batches(val_loader, val_pipe):
                 x = batch["image"]                               # [B,3,H,W]
                 y = batch["mask"]                                # [B,1,H,W]
                 y_ids = y.squeeze(1).long()                      # [B,H,W]
-                logits = model(x)
-                # loss
-                loss_ce = ce_loss(logits, y_ids)
-                loss_dice = dice_loss(logits, y_ids) if args.dice_weight>0 else 0.0
-                loss = loss_ce + args.dice_weight*loss_dice
+                with autocast_ctx(args.device, amp_dtype):
+                    logits = model(x)
+                    loss = criterion(logits, y_ids)
                 bs = x.size(0)
-                vl_loss_sum += float(loss.item()) * bs
+                vl_loss_sum += loss.detach().float() * bs        # stays on device
                 n_vl += bs
-                # predictions
-                pred = logits_to_mask(logits)                    # [B,1,H,W]
-                # mIoU (macro)
-                miou_sum += mean_iou(pred, y, args.num_classes)
-                # Dice (binary, fg_class)
-                # convert to confusion and from it compute dice also (keeps consistency)
-                tp, fp, tn, fn = binary_confusion(pred, y, fg_class=args.fg_class)
-                tp_tot += tp; fp_tot += fp; tn_tot += tn; fn_tot += fn
-
-        vl_loss = vl_loss_sum / max(1, n_vl)
-        # aggregate binary metrics
-        bin_stats = binary_metrics_from_conf(tp_tot, fp_tot, tn_tot, fn_tot)
-        # report also macro mIoU; for "Dice (macro)" approximate via class-1 Dice from confusion
-        miou = miou_sum / max(1, len(val_loader))
+                # predictions -> confusion matrix (no host sync)
+                meter.update(logits_to_mask(logits), y)         # [B,1,H,W]
+
+        vl_loss = vl_loss_sum.item() / max(1, n_vl)
+        # dataset-level metrics from the single confusion matrix
+        bin_stats = meter.compute(fg_class=args.fg_class)
+        miou = bin_stats["miou"]
 
         # Pretty print
         print(
@@ -188,15 +280,26 @@ def main():
             f"val_mIoU={miou:.4f} | "
             f"val_fg(IoU/Dice/Rec/Prec/Acc)="
             f"{bin_stats['iou']:.4f}/{bin_stats['dice']:.4f}/{bin_stats['recall']:.4f}/"
-            f"{bin_stats['precision']:.4f}/{bin_stats['accuracy']:.4f}"
+            f"{bin_stats['precision']:.4f}/{bin_stats['accuracy']:.4f} | "
+            f"train {tr_ips:.1f} img/s"
         )
+        logging.info("Train input pipeline: %s (%s-bound)", timer, timer.summary()["bound"])
 
-        # Save best (by mIoU)
+        # Early-stopping bookkeeping, then save best (by mIoU)
+        bad_epochs = 0 if miou > best_miou + args.min_delta else bad_epochs + 1
         if miou > best_miou:
             best_miou = miou
-            tag = f"{args.model.replace('+','plus')}_{args.dataset}"
             best_path = Path(out)/f"best_{tag}.pth"
             torch.save(model.state_dict(), best_path)
+        if args.lr_scheduler == "plateau": sched.step(miou)
+        elif sched is not None: sched.step()
+        stopped_early = args.patience > 0 and bad_epochs >= args.patience
+        if (args.ckpt_every and epoch % args.ckpt_every == 0) or stopped_early or epoch == args.epochs:
+            checkpoint(epoch)
+        if stopped_early:
+            logging.info("Early stopping: no val mIoU gain > %.4g for %d epochs (best %.4f)",
+                         args.min_delta, bad_epochs, best_miou)
+            break
 
     # Save summary JSON
     if best_path:
@@ -206,11 +309,23 @@ def main():
                     "best_mIoU": best_miou,
                     "weights": str(best_path),
                     "dice_weight": args.dice_weight,
-                    "fg_class": args.fg_class
+                    "fg_class": args.fg_class,
+                    "precision": str(amp_dtype or "fp32"),
+                    "channels_last": args.channels_last,
+                    "effective_batch": args.batch_size * accum,
+                    "train_img_per_s": tr_ips,
+                    "train_stages": timer.summary(),
+                    "epochs_run": epoch,
+                    "stopped_early": stopped_early,
+                    "lr_scheduler": args.lr_scheduler,
+                    "resumed_from": resumed_from
                 },
                 indent=2
             )
         )
 
+    if instrument.enabled():
+        Path(out/"instrument.json").write_text(json.dumps(instrument.finish(), indent=2))
+
 if __name__ == "__main__":
     main()
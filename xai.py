@@ -1,63 +1,226 @@
 # -*- coding: utf-8 -*-
 """
 TR: 3 XAI yöntemi: Saliency (grad), IntegratedGradients, GradientShap (Captum).
+    (+ hızlı varyant: katman tabanlı IG, "layer_ig")
+    GradientShap, Captum ile aynı tahminciyi vektörize ve seed'li olarak burada uygular.
 EN: 3 XAI methods: Saliency (grad), IntegratedGradients, GradientShap (Captum).
+    (+ fast variant: layer-based IG, "layer_ig")
+    GradientShap implements Captum's estimator here, vectorized and seeded.
 """
 from __future__ import annotations
-from typing import Literal
+import os
+from pathlib import Path
+from typing import Dict, Literal, Tuple
+import numpy as np
 import torch
-from captum.attr import IntegratedGradients, GradientShap
+import torch.nn.functional as F
+import instrument
+from captum.attr import IntegratedGradients, LayerIntegratedGradients
 
-def saliency_map(model: torch.nn.Module, x: torch.Tensor, target_class: int) -> torch.Tensor:
+NormMode = Literal["minmax", "percentile", "batch"]
+
+def normalize_attributions(sal: torch.Tensor, mode: NormMode="minmax",
+                           q: Tuple[float, float]=(1.0, 99.0), as_float: bool=False) -> torch.Tensor:
+    """
+    TR: Örnek bazlı (vektörize) normalizasyon; batch boyutundan bağımsızdır.
+        mode="minmax": örnek başına min/max, "percentile": örnek başına q yüzdelik kırpma,
+        "batch": eski davranış (tüm batch için tek min/max).
+    EN: Per-sample (vectorized) normalization, independent of batch size.
+        mode="minmax": per-sample min/max, "percentile": per-sample q-percentile clipping,
+        "batch": legacy behaviour (one min/max over the whole batch).
+    Returns: [B,1,H,W] float32 in [0,1] if as_float else uint8 (0..255)
+    """
+    b = sal.size(0)
+    flat = sal.detach().float().reshape(b, -1)                        # [B,N]
+    if mode == "minmax":
+        lo, hi = flat.amin(dim=1), flat.amax(dim=1)
+    elif mode == "percentile":
+        n = flat.size(1)
+        k_lo = min(n, max(1, int(round(q[0] / 100.0 * (n - 1))) + 1))
+        k_hi = min(n, max(1, int(round(q[1] / 100.0 * (n - 1))) + 1))
+        lo = flat.kthvalue(k_lo, dim=1).values
+        hi = flat.kthvalue(k_hi, dim=1).values
+    elif mode == "batch":
+        lo, hi = flat.min().expand(b), flat.max().expand(b)
+    else:
+        raise ValueError(f"Unknown normalization mode: {mode}")
+    lo, hi = lo.view(b, 1), hi.view(b, 1)
+    out = ((flat - lo) / (hi - lo + 1e-8)).clamp_(0, 1).view_as(sal)
+    if as_float:
+        return out
+    return out.mul_(255).round_().byte()
+
+def _postprocess(attributions: torch.Tensor, normalize: NormMode, as_float: bool) -> torch.Tensor:
+    """TR: |attr| kanal ortalaması + normalizasyon | EN: channel-mean |attr| + normalization"""
+    return normalize_attributions(attributions.detach().abs().mean(dim=1, keepdim=True), normalize, as_float=as_float)
+
+def saliency_map(model: torch.nn.Module, x: torch.Tensor, target_class: int,
+                 normalize: NormMode="minmax", as_float: bool=False) -> torch.Tensor:
     """
     TR: Basit gradyan tabanlı saliency (giriş gradyanlarının |.|).
     EN: Simple gradient-based saliency (|input gradients|).
-    Returns: [B,1,H,W] uint8 (0..255 scaled)
+    Returns: [B,1,H,W] uint8 (0..255 scaled), or float32 0..1 if as_float
     """
     x = x.clone().detach().requires_grad_(True)
     model.zero_grad(set_to_none=True)
     logits = model(x)  # [B,C,H,W]
     target = logits[:, target_class:target_class+1].sum()
     target.backward()
-    sal = x.grad.detach().abs().mean(dim=1, keepdim=True)  # [B,1,H,W]
-    sal = (255*(sal - sal.min())/(sal.max()-sal.min()+1e-8)).clamp(0,255).byte()
-    return sal
+    return _postprocess(x.grad, normalize, as_float)  # [B,1,H,W]
 
-def integrated_gradients_map(model: torch.nn.Module, x: torch.Tensor, target_class: int, steps: int=50) -> torch.Tensor:
+def _class_score(model: torch.nn.Module, target_class: int):
     """
-    TR: Integrated Gradients (Captum).
-    EN: Integrated Gradients via Captum.
+    TR: Segmentasyon çıktısını örnek başına skaler skora indirger ([B,C,H,W] -> [B]).
+    EN: Reduces the segmentation output to one scalar per sample ([B,C,H,W] -> [B]).
     """
     def fwd(inp):
-        return model(inp)[:, target_class]
-    ig = IntegratedGradients(fwd)
+        return model(inp)[:, target_class].sum(dim=(1, 2))
+    return fwd
+
+def _ig_batch_size(x: torch.Tensor, steps: int, chunk_steps: int | None) -> int:
+    """TR: Tek geçişte işlenecek satır (örnek x adım) | EN: Rows (samples x steps) per pass"""
+    chunk = steps if chunk_steps is None else max(1, min(int(chunk_steps), steps))
+    return x.size(0) * chunk
+
+def integrated_gradients_map(model: torch.nn.Module, x: torch.Tensor, target_class: int, steps: int=50,
+                             chunk_steps: int | None=1, normalize: NormMode="minmax",
+                             as_float: bool=False) -> torch.Tensor:
+    """
+    TR: Integrated Gradients (Captum). chunk_steps: bir ileri/geri geçişte kaç interpolasyon adımı
+        işleneceği (None = tüm adımlar tek geçişte; bellek izin verdiği kadar büyük seçin).
+    EN: Integrated Gradients via Captum. chunk_steps: interpolation steps per forward/backward pass
+        (None = all steps in one pass; pick as large as memory allows).
+    """
+    ig = IntegratedGradients(_class_score(model, target_class))
     baseline = torch.zeros_like(x)
-    attributions = ig.attribute(x, baseline, target=None, n_steps=steps, internal_batch_size=x.size(0))
-    sal = attributions.abs().mean(dim=1, keepdim=True)
-    sal = (255*(sal - sal.min())/(sal.max()-sal.min()+1e-8)).clamp(0,255).byte()
-    return sal
+    attributions = ig.attribute(x, baseline, target=None, n_steps=steps,
+                                internal_batch_size=_ig_batch_size(x, steps, chunk_steps))
+    return _postprocess(attributions, normalize, as_float)
 
-def gradient_shap_map(model: torch.nn.Module, x: torch.Tensor, target_class: int, stdevs: float=0.09, nsamples: int=20) -> torch.Tensor:
+def layer_integrated_gradients_map(model: torch.nn.Module, x: torch.Tensor, target_class: int, steps: int=50,
+                                   layer: str="encoder.layer1", chunk_steps: int | None=None,
+                                   normalize: NormMode="minmax", as_float: bool=False) -> torch.Tensor:
     """
-    TR: GradientShap (Captum) – stokastik entegre gradyan varyantı.
-    EN: GradientShap – stochastic integrated gradient variant.
+    TR: Ara katman (varsayılan smp ResNet encoder.layer1) üzerinde Layer Integrated Gradients.
+        İnterpolasyon katman aktivasyonunda yapılır; geri yayılım girişe (stem) kadar inmez.
+        Katman atıfları |.| kanal ortalaması alınıp giriş çözünürlüğüne (bilinear) büyütülür.
+    EN: Layer Integrated Gradients on an intermediate layer (default: smp ResNet encoder.layer1).
+        Steps interpolate the layer activation, so backward passes stop at that layer (the input
+        stem is skipped). Layer attributions are channel-averaged |.| and upsampled (bilinear).
     """
-    def fwd(inp):
-        return model(inp)[:, target_class]
-    gs = GradientShap(fwd)
-    baseline_dist = torch.stack([torch.zeros_like(x), torch.ones_like(x)*x.mean()])  # two baselines
-    attributions = gs.attribute(x, baselines=baseline_dist, stdevs=stdevs, n_samples=nsamples)
-    sal = attributions.abs().mean(dim=1, keepdim=True)
-    sal = (255*(sal - sal.min())/(sal.max()-sal.min()+1e-8)).clamp(0,255).byte()
-    return sal
+    lig = LayerIntegratedGradients(_class_score(model, target_class), model.get_submodule(layer))
+    baseline = torch.zeros_like(x)
+    attributions = lig.attribute(x, baseline, target=None, n_steps=steps,
+                                 internal_batch_size=_ig_batch_size(x, steps, chunk_steps))
+    sal = attributions.detach().abs().mean(dim=1, keepdim=True)                  # [B,1,h,w]
+    sal = F.interpolate(sal, size=x.shape[-2:], mode="bilinear", align_corners=False)
+    return normalize_attributions(sal, normalize, as_float=as_float)
 
-def xai_dispatch(method: Literal["saliency","ig","gradshap"], model, x, target_class: int):
+# ------------------------ GradientShap ------------------------ #
+_BASELINES: Dict[str, torch.Tensor] = {}
+
+def dataset_baselines(ds, groups: int=4, include_zero: bool=True) -> torch.Tensor:
+    """
+    TR: Veri kümesinden baseline dağılımı: ardışık `groups` alt kümenin ortalama karosu (+ siyah karo).
+        uint8 önbellekli SegDataset'te doğrudan bellek eşlemli dizilerden hesaplanır.
+    EN: Baseline distribution from a dataset: the mean tile of `groups` contiguous subsets (+ a black tile).
+        With a cached SegDataset it is computed straight from the memory-mapped arrays.
+    Returns: [K,3,H,W] float32 in 0..1
     """
-    TR: XAI yöntem seçici.
-    EN: XAI method dispatcher.
+    n = len(ds)
+    if n == 0: raise ValueError("empty dataset")
+    bounds = [round(i * n / groups) for i in range(groups + 1)]
+    means = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if hi <= lo: continue
+        if getattr(ds, "store", None) is not None:
+            imgs, _ = ds._cached()                                 # [N,H,W,3] uint8
+            m = torch.from_numpy(imgs[lo:hi].mean(axis=0, dtype=np.float64)).permute(2, 0, 1) / 255.0
+        else:
+            acc = None
+            for i in range(lo, hi):
+                img = ds[i]["image"]
+                img = img.double() / 255.0 if img.dtype == torch.uint8 else img.double()
+                acc = img if acc is None else acc + img
+            m = acc / (hi - lo)
+        means.append(m.float())
+    dist = torch.stack(means)
+    return torch.cat([torch.zeros_like(dist[:1]), dist]) if include_zero else dist
+
+def ensure_dataset_baselines(path: str | Path, ds, groups: int=4) -> Path:
+    """TR: Yoksa dataset_baselines'ı hesaplayıp .pt olarak yazar (atomik) | EN: Computes and saves dataset_baselines once (atomic)"""
+    path = Path(path)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        torch.save(dataset_baselines(ds, groups), tmp)
+        os.replace(tmp, path)
+    return path
+
+def load_baselines(path: str | Path) -> torch.Tensor:
+    """TR: Kayıtlı baseline dağılımı (süreç içinde önbellekli) | EN: Saved baseline distribution (memoized per process)"""
+    key = str(Path(path).resolve())
+    if key not in _BASELINES:
+        _BASELINES[key] = torch.load(key, map_location="cpu")
+    return _BASELINES[key]
+
+def _baseline_dist(x: torch.Tensor, baselines: torch.Tensor | str | Path | None) -> torch.Tensor:
+    """TR: [K,3,H,W] baseline dağılımı (x cihazında) | EN: [K,3,H,W] baseline distribution (on x's device)"""
+    if baselines is None:   # legacy distribution: black tile + batch-mean tile
+        return torch.stack([torch.zeros_like(x[0]), torch.full_like(x[0], float(x.mean()))])
+    bl = load_baselines(baselines) if isinstance(baselines, (str, Path)) else baselines
+    bl = bl.to(x.device, x.dtype)
+    if bl.shape[-2:] != x.shape[-2:]:
+        bl = F.interpolate(bl, size=x.shape[-2:], mode="bilinear", align_corners=False)
+    return bl
+
+def gradient_shap_map(model: torch.nn.Module, x: torch.Tensor, target_class: int, stdevs: float=0.09, nsamples: int=20,
+                      chunk_samples: int | None=None, seed: int | None=None,
+                      baselines: torch.Tensor | str | Path | None=None,
+                      normalize: NormMode="minmax", as_float: bool=False) -> torch.Tensor:
+    """
+    TR: GradientShap – stokastik entegre gradyan varyantı. Tüm gürültülü interpolasyon örnekleri
+        (baseline seçimi, gürültü, alfa) tek seferde `seed`li üreteçle çekilir; model bunları
+        chunk_samples örneklik parçalar halinde işler (geçiş başına B*chunk_samples satır; None = hepsi).
+        baselines: [K,3,H,W] tensör veya .pt yolu (örn. dataset_baselines); None = siyah + batch ortalaması.
+    EN: GradientShap – stochastic integrated gradient variant. All noisy interpolation samples
+        (baseline pick, noise, alpha) are drawn at once from a `seed`ed generator; the model processes
+        them in chunks of chunk_samples (B*chunk_samples rows per pass; None = all at once).
+        baselines: [K,3,H,W] tensor or .pt path (e.g. dataset_baselines); None = black + batch-mean tile.
+    """
+    b, s = x.size(0), int(nsamples)
+    x = x.detach()
+    bl = _baseline_dist(x, baselines)                                            # [K,3,H,W]
+    gen = torch.Generator(device=x.device)
+    if seed is not None: gen.manual_seed(int(seed))
+    else: gen.seed()
+    pick = torch.randint(bl.size(0), (s, b), generator=gen, device=x.device)     # baseline per sample
+    noise = torch.randn((s,) + tuple(x.shape), generator=gen, device=x.device, dtype=x.dtype).mul_(stdevs)
+    alpha = torch.rand(s, b, 1, 1, 1, generator=gen, device=x.device, dtype=x.dtype)
+    fwd = _class_score(model, target_class)
+    chunk = s if chunk_samples is None else max(1, min(int(chunk_samples), s))
+    total = torch.zeros_like(x)
+    for c0 in range(0, s, chunk):
+        c1 = min(s, c0 + chunk)
+        base = bl[pick[c0:c1]]                                                   # [c,B,3,H,W]
+        delta = x.unsqueeze(0) + noise[c0:c1] - base                             # noisy input - baseline
+        pts = (base + alpha[c0:c1] * delta).flatten(0, 1).detach().requires_grad_(True)
+        grads, = torch.autograd.grad(fwd(pts).sum(), pts)
+        total += (grads.view_as(delta) * delta).sum(dim=0)
+    return _postprocess(total / s, normalize, as_float)
+
+def xai_dispatch(method: Literal["saliency","ig","layer_ig","gradshap"], model, x, target_class: int, **kwargs):
+    """
+    TR: XAI yöntem seçici (ek argümanlar yönteme iletilir, örn. normalize, as_float).
+    EN: XAI method dispatcher (extra kwargs are forwarded, e.g. normalize, as_float).
     """
     m = method.lower()
-    if m == "saliency":  return saliency_map(model, x, target_class)
-    if m == "ig":        return integrated_gradients_map(model, x, target_class)
-    if m == "gradshap":  return gradient_shap_map(model, x, target_class)
-    raise ValueError(f"Unknown XAI method: {method}")
+    with instrument.span(f"xai.{m}"):
+        return _dispatch(m, model, x, target_class, **kwargs)
+
+def _dispatch(m: str, model, x, target_class: int, **kwargs):
+    if m == "saliency":  return saliency_map(model, x, target_class, **kwargs)
+    if m == "ig":        return integrated_gradients_map(model, x, target_class, **kwargs)
+    if m == "layer_ig":  return layer_integrated_gradients_map(model, x, target_class, **kwargs)
+    if m == "gradshap":  return gradient_shap_map(model, x, target_class, **kwargs)
+    raise ValueError(f"Unknown XAI method: {m}")
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+TR: Kalıcı XAI atıf önbelleği (içerik adresli, sıkıştırılmış .npz, LRU boyut sınırı).
+    Anahtar = ağırlık dosyası hash'i + görüntü stem + yöntem + hedef sınıf + yöntem parametreleri.
+EN: Persistent XAI attribution store (content-addressed, compressed .npz, LRU size bound).
+    Key = weights-file hash + image stem + method + target class + method parameters.
+
+Yerleşim / Layout: {root}/{key[:2]}/{key}.npz  (LRU sırası dosya mtime ile tutulur / LRU order via mtime)
+"""
+from __future__ import annotations
+import os, json, hashlib, logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import torch
+import instrument
+from xai import xai_dispatch
+
+_DIGESTS: Dict[Tuple[str, int, int], str] = {}
+
+def file_digest(path: str | Path, chunk: int = 1 << 20) -> str:
+    """
+    TR: Dosyanın sha256 özeti ((yol, mtime, boyut) ile bellekte önbelleklenir).
+    EN: sha256 of a file (memoized on (path, mtime, size)).
+    """
+    p = Path(path); st = p.stat()
+    memo = (str(p.resolve()), st.st_mtime_ns, st.st_size)
+    if memo not in _DIGESTS:
+        h = hashlib.sha256()
+        with open(p, "rb") as f:
+            for block in iter(lambda: f.read(chunk), b""):
+                h.update(block)
+        _DIGESTS[memo] = h.hexdigest()
+    return _DIGESTS[memo]
+
+class AttributionCache:
+    """
+    TR: Sıkıştırılmış atıf dizileri için içerik adresli, boyut sınırlı (LRU) depo.
+    EN: Content-addressed, size-bounded (LRU) store of compressed attribution arrays.
+    """
+    def __init__(self, root: str | Path, max_bytes: int = 10 * 2**30):
+        self.root = Path(root); self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.hits = self.misses = 0
+        self._size = sum(p.stat().st_size for p in self.root.glob("*/*.npz"))
+
+    @staticmethod
+    def key(weights_hash: str, stem: str, method: str, target_class: int, params: dict) -> str:
+        raw = json.dumps({"w": weights_hash, "s": stem, "m": method.lower(), "c": int(target_class),
+                          "p": params}, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root/key[:2]/f"{key}.npz"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        p = self._path(key)
+        try:
+            with np.load(p) as z:
+                arr = z["a"]
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            self.misses += 1; instrument.count("xai_cache_misses")
+            return None
+        try: os.utime(p)                      # mark as recently used
+        except OSError: pass
+        self.hits += 1; instrument.count("xai_cache_hits")
+        return arr
+
+    def put(self, key: str, arr: np.ndarray) -> None:
+        p = self._path(key); p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(f"{p.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, a=arr)
+        try: old = p.stat().st_size           # overwritten entry no longer counts
+        except FileNotFoundError: old = 0
+        os.replace(tmp, p)
+        self._size += p.stat().st_size - old
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self) -> None:
+        """TR: En eski kullanılanları sil (%90'a in) | EN: Drop least-recently used entries down to 90%"""
+        entries = []
+        for p in self.root.glob("*/*.npz"):
+            try:
+                st = p.stat(); entries.append((st.st_mtime, st.st_size, p))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        target = int(0.9 * self.max_bytes)
+        removed = 0
+        for _, size, p in entries:
+            if total <= target: break
+            try: p.unlink(); total -= size; removed += 1
+            except FileNotFoundError: pass
+        self._size = total
+        if removed: logging.info("Attribution cache: evicted %d entries (%.1f MB kept)", removed, total / 2**20)
+
+def cached_xai_dispatch(cache: Optional[AttributionCache], weights_hash: str, stems: Sequence[str],
+                        method: str, model, x: torch.Tensor, target_class: int, **kwargs) -> torch.Tensor:
+    """
+    TR: xai_dispatch'in önbellekli hali: yalnız önbellekte olmayan örnekler hesaplanır.
+        Batch-global normalizasyon (normalize="batch") örneği batch'e bağladığı için önbelleklenmez.
+        GradientShap'in rastgele çekilişleri batch'e bağlıdır: yalnız sabit seed ve veri seti baseline
+        dosyasıyla önbelleklenir; anahtar baseline özeti + batch bağlamını (stem'ler) içerir ve bir eksik
+        olduğunda tüm batch yeniden hesaplanır.
+    EN: Cached xai_dispatch: only samples missing from the store are computed.
+        Batch-global normalization (normalize="batch") couples samples, so it bypasses the cache.
+        GradientShap's random draws depend on the batch: it is cached only with a fixed seed and a
+        dataset-baseline file; the key holds the baseline digest + batch context (stems) and any miss
+        recomputes the whole batch.
+    """
+    m = method.lower()
+    gs = m == "gradshap"
+    if cache is None or kwargs.get("normalize") == "batch" or \
+            (gs and (kwargs.get("seed") is None or not isinstance(kwargs.get("baselines"), (str, Path)))):
+        return xai_dispatch(method, model, x, target_class=target_class, **kwargs)
+    params = dict(kwargs, shape=list(x.shape[1:]))
+    if gs:
+        params["baselines"] = file_digest(kwargs["baselines"])
+        params["batch"] = hashlib.sha256("\n".join(stems).encode("utf-8")).hexdigest()
+    keys = [cache.key(weights_hash, s, method, target_class, dict(params, pos=i) if gs else params)
+            for i, s in enumerate(stems)]
+    found: List[Optional[np.ndarray]] = [cache.get(k) for k in keys]
+    miss = [i for i, a in enumerate(found) if a is None]
+    if miss and gs:
+        miss = list(range(len(stems)))    # per-sample draws depend on the full batch
+    if miss:
+        fresh = xai_dispatch(method, model, x[miss], target_class=target_class, **kwargs)
+        fresh_np = fresh.detach().cpu().numpy()
+        for j, i in enumerate(miss):
+            found[i] = fresh_np[j]
+            cache.put(keys[i], fresh_np[j])
+    return torch.from_numpy(np.stack(found)).to(x.device)
@@ -3,6 +3,8 @@
 TR: 10 XAI metriği (quantus tabanlı). Her metrik için tek arayüz.
 EN: 10 XAI metrics (quantus-based). Single interface per metric.
 
+Metrik seçimi / Metric selection: resolve_metrics("cheap"), resolve_metrics("faithfulness,MPRT") ...
+
 Metrix list:
 1) Continuity
 2) FaithfulnessEstimate
@@ -16,59 +18,450 @@ Metrix list:
 10) Model Parameter Randomisation Test (MPRT) – summary score (lower is better)
 """
 from __future__ import annotations
-from typing import Dict, Any, List
+import copy, os, time, threading, itertools, logging, queue
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from multiprocessing import get_context, shared_memory
+from typing import Dict, Any, List, NamedTuple, Optional, Sequence, Tuple
 import numpy as np
 import torch
+import instrument
 from quantus import (
     Continuity, FaithfulnessEstimate, AUC, Sparseness, Complexity,
     RelevanceRankAccuracy, RelevanceMassAccuracy, FaithfulnessCorrelation,
-    Infidelity, ModelParameterRandomisation
+    Infidelity, ModelParameterRandomisation, correlation_spearman, translation_x_direction
+)
+
+def _translate_x_px(arr: np.ndarray, perturb_dx: int, **kwargs) -> np.ndarray:
+    """
+    TR: Continuity adımı: Quantus adımı H*W//nr_steps piksel alır (2B görüntüde genişliği aşar, her adım
+        boş taban olur); H'ye bölünerek adım W//nr_steps piksele indirilir.
+    EN: Continuity step: Quantus derives the step as H*W//nr_steps pixels (wider than a 2-D image, so every
+        step is the blank baseline); dividing by H brings it to W//nr_steps pixels.
+    """
+    return translation_x_direction(arr, perturb_dx=perturb_dx // arr.shape[1], **kwargs)
+
+class MetricSpec(NamedTuple):
+    cls: type            # quantus metric class
+    group: str           # robustness | faithfulness | complexity | localisation | randomisation
+    needs_model: bool    # False -> computed from (a, y) only, no model calls
+    writable: bool       # perturbs its input arrays in place -> gets a private copy (shared arrays are read-only)
+    params: Dict[str, Any] = {}   # metric-specific constructor kwargs (sampling budget, patch size, ...)
+    explains: bool = False        # re-explains perturbed inputs / the randomised model -> needs explain_func
+
+# Registry: name -> spec (order = report order)
+METRICS: Dict[str, MetricSpec] = {
+    # Continuity: 8 divides the 2^k tile sizes (7 does not); curves compared with Spearman (its default,
+    # lipschitz_constant, takes four arrays and cannot compare two curves); pixel-sized translation steps
+    "Continuity":           MetricSpec(Continuity, "robustness", True, True,
+                                       dict(nr_steps=10, patch_size=8, similarity_func=correlation_spearman,
+                                            perturb_func=_translate_x_px), True),
+    "FaithfulnessEstimate": MetricSpec(FaithfulnessEstimate, "faithfulness", True, True),
+    "AUC":                  MetricSpec(AUC, "localisation", False, False),
+    "Sparseness":           MetricSpec(Sparseness, "complexity", False, False),
+    "Complexity":           MetricSpec(Complexity, "complexity", False, False),
+    "RRA":                  MetricSpec(RelevanceRankAccuracy, "localisation", False, False),
+    "RMA":                  MetricSpec(RelevanceMassAccuracy, "localisation", False, False),
+    "FaithfulnessCorr":     MetricSpec(FaithfulnessCorrelation, "faithfulness", True, True, dict(nr_runs=10)),
+    "Infidelity":           MetricSpec(Infidelity, "faithfulness", True, True, dict(n_perturb_samples=10)),
+    "MPRT":                 MetricSpec(ModelParameterRandomisation, "randomisation", True, True, {}, True),
+}
+
+# Presets: "cheap" = no model calls (run on every tile); perturbation metrics are for samples.
+PRESETS: Dict[str, List[str]] = {
+    "all": list(METRICS),
+    "cheap": [n for n, m in METRICS.items() if not m.needs_model],
+    "faithfulness": [n for n, m in METRICS.items() if m.group == "faithfulness"],
+    "localisation": [n for n, m in METRICS.items() if m.group == "localisation"],
+    "complexity": [n for n, m in METRICS.items() if m.group == "complexity"],
+}
+
+def resolve_metrics(spec: str | Sequence[str] | None) -> List[str]:
+    """
+    TR: "cheap,MPRT" gibi isim/preset listesini metrik adlarına çevirir (büyük/küçük harf duyarsız).
+    EN: Resolves names/presets such as "cheap,MPRT" into metric names (case-insensitive).
+    """
+    if spec is None: return list(METRICS)
+    items = spec.split(",") if isinstance(spec, str) else list(spec)
+    lookup = {n.lower(): n for n in METRICS}
+    out: List[str] = []
+    for it in (i.strip() for i in items):
+        if not it: continue
+        if it.lower() in PRESETS: names = PRESETS[it.lower()]
+        elif it.lower() in lookup: names = [lookup[it.lower()]]
+        else: raise ValueError(f"Unknown metric or preset: {it} (metrics: {list(METRICS)}, presets: {list(PRESETS)})")
+        out += [n for n in names if n not in out]
+    return out
+
+# Common kwargs for quantus (every metric accepts these); sampling budgets live in MetricSpec.params
+COMMON = dict(
+    abs=True,
+    normalise=True
 )
 
 def _to_numpy(x: torch.Tensor | np.ndarray) -> np.ndarray:
     if isinstance(x, torch.Tensor): return x.detach().cpu().numpy()
     return x
 
+def _prepare(inputs: torch.Tensor, masks: torch.Tensor, atts: torch.Tensor, target_class: int,
+             adapter: bool=True) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    TR: Quantus girdileri (x, y, a, s). Adaptörle y = hedef sınıf etiketi [B] (model [B,C] döner),
+        s = sınıfın ikili maskesi (lokalizasyon metrikleri için).
+    EN: Quantus inputs (x, y, a, s). With the adapter y = target class label [B] (the model returns
+        [B,C]); s = binary class mask (for localisation metrics).
+    """
+    x = inputs.detach()
+    s = (masks==target_class).float()  # binary map for class
+    a = atts.float()/255.0 if atts.dtype == torch.uint8 else atts.float()
+    y = np.full(x.size(0), target_class, dtype=np.int64) if adapter else _to_numpy(s)
+    return _to_numpy(x), y, _to_numpy(a), _to_numpy(s)
+
+# ------------------------ Model adapter ------------------------ #
+class BatchCoalescer:
+    """
+    TR: Eşzamanlı metriklerin küçük model çağrılarını büyük batch'lerde birleştiren sunucu iş parçacığı.
+        İlk istekten sonra en çok max_wait_ms beklenir veya max_batch satıra ulaşılır; aynı şekilli
+        girdiler birleştirilip tek ileri geçişte hesaplanır ve sonuçlar çağıranlara bölünür.
+    EN: Server thread that coalesces small model calls from concurrent metrics into large batches.
+        After the first request it waits up to max_wait_ms or until max_batch rows; same-shaped
+        inputs are concatenated, run in one forward pass and split back to the callers.
+    """
+    def __init__(self, fn, max_batch: int=64, max_wait_ms: float=2.0):
+        self.fn, self.max_batch, self.max_wait = fn, int(max_batch), max_wait_ms / 1000.0
+        self.calls = self.forwards = 0
+        self._q: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="metric-coalescer", daemon=True)
+        self._thread.start()
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        fut: Future = Future()
+        self._q.put((x, fut))
+        return fut.result()
+
+    def _loop(self) -> None:
+        while True:
+            item = self._q.get()
+            if item is None: return
+            items, rows, stop = [item], item[0].shape[0], False
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_batch:
+                try:
+                    nxt = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if nxt is None: stop = True; break
+                items.append(nxt); rows += nxt[0].shape[0]
+            groups: Dict[tuple, list] = {}
+            for x, fut in items:
+                groups.setdefault((tuple(x.shape[1:]), x.dtype, x.device), []).append((x, fut))
+            for group in groups.values():
+                try:
+                    # grad mode is per thread (enabled here); only no-grad callers are routed to us
+                    with torch.inference_mode():
+                        out = self.fn(torch.cat([x for x, _ in group]))
+                    for o, (_, fut) in zip(out.split([x.shape[0] for x, _ in group]), group):
+                        fut.set_result(o)
+                except Exception as e:  # propagate to every waiting metric
+                    for _, fut in group:
+                        if not fut.done(): fut.set_exception(e)
+                self.forwards += 1
+            self.calls += len(items)
+            if stop: return
+
+    def close(self) -> None:
+        self._q.put(None); self._thread.join()
+
+class ClassScoreAdapter(torch.nn.Module):
+    """
+    TR: Segmentasyon modelini Quantus'un beklediği sınıf skoruna indirger: [B,C,H,W] -> [B,C]
+        (sınıf logitlerinin uzamsal ortalaması). Gradyan gerekmiyorsa inference_mode altında çalışır;
+        coalescer verilirse çağrılar paylaşılan büyük batch'lerde birleştirilir.
+    EN: Reduces the segmentation model to the per-class score Quantus expects: [B,C,H,W] -> [B,C]
+        (spatial mean of class logits). Runs under inference_mode when no gradient is needed;
+        with a coalescer, calls are merged into shared large batches.
+        Not / Note: yalnız gradyansız çağrılar birleştirilir ve sunucu iş parçacığında inference_mode
+        altında çalışır / only no-grad calls are coalesced; they run under inference_mode on the server thread.
+    """
+    def __init__(self, model: torch.nn.Module, coalescer: Optional[BatchCoalescer]=None):
+        super().__init__()
+        self.model = model
+        self.coalescer = coalescer
+        self.training = model.training      # Quantus refuses wrappers left in (default) train mode
+
+    def scores(self, x: torch.Tensor) -> torch.Tensor:
+        dev = next(self.model.parameters()).device
+        with torch.inference_mode(not torch.is_grad_enabled()):
+            return self.model(x.to(dev)).mean(dim=(2, 3))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.coalescer is not None and not torch.is_grad_enabled():
+            return self.coalescer(x)
+        return self.scores(x)
+
+    def __deepcopy__(self, memo):
+        # copies (e.g. MPRT's randomised model) must not route through the shared coalescer
+        return ClassScoreAdapter(copy.deepcopy(self.model, memo))
+
+def _per_sample(scores, b: int, metric=None) -> np.ndarray:
+    """TR: Metrik çıktısını örnek başına skora indirger [B] | EN: Reduce a metric output to per-sample scores [B]"""
+    # MPRT returns several values across layers (dict in recent quantus); we summarise with mean.
+    if isinstance(scores, list) and scores and isinstance(scores[0], dict):
+        # Continuity: per sample {patch: attribution sums, nr_patches: outputs} over the perturbation steps;
+        # same reduction as Quantus' aggregated_score, kept per sample
+        k = metric.nr_patches
+        arr = np.array([np.mean([metric.similarity_func(d[k], d[i]) for i in range(k)]) for d in scores])
+    elif isinstance(scores, dict):
+        arr = np.stack([np.asarray(v, dtype=np.float64).reshape(-1) for v in scores.values()]).mean(axis=0)
+    else:
+        arr = np.asarray(scores, dtype=np.float64).reshape(-1)
+    if arr.size != b:  # metric summarised the batch itself
+        arr = np.full(b, float(np.mean(arr)))
+    return arr
+
+def _avg_ranks(v: torch.Tensor) -> torch.Tensor:
+    """TR: 1B vektörün ortalama sıraları (eşitlikler paylaşılır) | EN: Average ranks of a 1-D vector (ties shared)"""
+    vals, order = v.sort()
+    _, inv, counts = torch.unique_consecutive(vals, return_inverse=True, return_counts=True)
+    ends = counts.cumsum(0).to(torch.float64)
+    ranks = torch.empty_like(ends[inv])
+    ranks[order] = (ends - (counts - 1) / 2.0)[inv]
+    return ranks
+
+def spearman_per_sample(a: torch.Tensor, b: torch.Tensor) -> torch.Tensor:
+    """
+    TR: İki [B,...] harita arasında örnek başına Spearman sıra korelasyonu (cihazda, eşitlikler ortalama sıra).
+    EN: Per-sample Spearman rank correlation between two [B,...] maps (on device, ties get average ranks).
+    Returns: [B] float64
+    """
+    ra = torch.stack([_avg_ranks(v) for v in a.detach().flatten(1)])
+    rb = torch.stack([_avg_ranks(v) for v in b.detach().flatten(1)])
+    ra = ra - ra.mean(dim=1, keepdim=True); rb = rb - rb.mean(dim=1, keepdim=True)
+    return (ra * rb).sum(dim=1) / (ra.norm(dim=1) * rb.norm(dim=1)).clamp_min(1e-12)
+
+def topk_iou_per_sample(a: torch.Tensor, b: torch.Tensor, frac: float=0.05) -> torch.Tensor:
+    """
+    TR: İki haritanın en yüksek frac oranındaki piksellerinin örnek başına IoU'su.
+    EN: Per-sample IoU of the top-`frac` pixels of two maps.
+    Returns: [B] float64
+    """
+    fa, fb = a.detach().float().flatten(1), b.detach().float().flatten(1)
+    k = max(1, int(round(frac * fa.size(1))))
+    ma = torch.zeros_like(fa, dtype=torch.bool).scatter_(1, fa.topk(k, dim=1).indices, True)
+    mb = torch.zeros_like(fb, dtype=torch.bool).scatter_(1, fb.topk(k, dim=1).indices, True)
+    inter = (ma & mb).sum(dim=1).double()
+    return inter / (2 * k - inter)
+
+# ------------------------ Cost profiling ------------------------ #
+_CALLS: Dict[str, List[int]] = {}
+_CALLS_LOCK = threading.Lock()
+_TAGS = itertools.count()
+
+class CountingModel(torch.nn.Module):
+    """
+    TR: Model çağrılarını sayan ince sarmalayıcı. Sayaçlar etikete göre modül düzeyinde tutulur,
+        böylece metriklerin yaptığı deepcopy'ler (örn. MPRT) de aynı sayaca yazar.
+    EN: Thin wrapper counting model calls. Counters live at module level keyed by tag,
+        so deep copies made inside metrics (e.g. MPRT) still report to the same counter.
+    """
+    def __init__(self, model: torch.nn.Module, tag: str):
+        super().__init__()
+        self.model, self.tag = model, tag
+        self.training = model.training
+        with _CALLS_LOCK: _CALLS[tag] = [0, 0]
+
+    def forward(self, x):
+        with _CALLS_LOCK:
+            c = _CALLS[self.tag]; c[0] += 1; c[1] += int(x.shape[0])
+        return self.model(x)
+
+# ------------------------ Re-explanation ------------------------ #
+def _segmentation_model(model: torch.nn.Module) -> torch.nn.Module:
+    """TR: Sayaç/adaptör sarmalayıcılarını soyar | EN: Strips the counting/adapter wrappers"""
+    while isinstance(model, (CountingModel, ClassScoreAdapter)): model = model.model
+    return model
+
+def explain_xai(model: torch.nn.Module, inputs: np.ndarray, targets: np.ndarray, *, method: str,
+                target_class: int, **xai_kw) -> np.ndarray:
+    """
+    TR: Quantus explain_func: pertürbe girdileri (Continuity) veya rastgeleleştirilmiş modeli (MPRT) etkin
+        yöntemle xai_dispatch üzerinden yeniden açıklar. model, Quantus'a verilen sarmalayıcı (veya MPRT'nin
+        kopyası) olabilir; yöntem altındaki segmentasyon modeline uygulanır.
+    EN: Quantus explain_func: re-explains perturbed inputs (Continuity) or the randomised model (MPRT) with
+        the active method through xai_dispatch. model may be the wrapper handed to Quantus (or MPRT's copy
+        of it); the method runs on the segmentation model underneath.
+    Returns: [B,1,H,W] float32 0..1
+    """
+    from xai import xai_dispatch
+    net = _segmentation_model(model)
+    x = torch.from_numpy(np.array(inputs, dtype=np.float32)).to(next(net.parameters()).device)
+    xai_kw.pop("device", None)       # added by Quantus when a device is given; we use the model's
+    with torch.enable_grad():
+        a = xai_dispatch(method, net, x, target_class, **dict(xai_kw, as_float=True))
+    return _to_numpy(a)
+
+def _score_metric(name: str, model, x_np: np.ndarray, y_np: np.ndarray, a_np: np.ndarray,
+                  s_np: np.ndarray, explain: Optional[dict]=None) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    TR: Tek metrik -> (örnek skorları [B], {saniye, model çağrısı, model örneği}).
+        explain: explain_xai argümanları (method, target_class, XAI kwargs); yeniden açıklayan metrikler için zorunlu.
+    EN: One metric -> (per-sample scores [B], {seconds, model calls, model samples}).
+        explain: explain_xai kwargs (method, target_class, XAI kwargs); required by re-explaining metrics.
+    """
+    spec = METRICS[name]
+    call_kw: Dict[str, Any] = {}
+    if spec.explains:
+        if explain is None:
+            raise ValueError(f"{name} re-explains its inputs: give MetricEngine/compute_all_metrics an XAI method")
+        call_kw = dict(explain_func=explain_xai, explain_func_kwargs=dict(explain))
+    if spec.writable:  # inputs are shared by concurrent metrics: perturb a private copy
+        x_np, y_np, a_np, s_np = (np.array(v) for v in (x_np, y_np, a_np, s_np))
+    tag = f"{name}:{os.getpid()}:{next(_TAGS)}"
+    counted = CountingModel(model, tag)
+    t0 = time.perf_counter()
+    try:
+        with instrument.span(f"metric.{name}"):
+            metric = spec.cls(**COMMON, **spec.params)
+            scores = metric(model=counted, x_batch=x_np, y_batch=y_np, a_batch=a_np, s_batch=s_np, **call_kw)
+    finally:
+        with _CALLS_LOCK: calls, samples = _CALLS.pop(tag)
+    prof = {"seconds": time.perf_counter() - t0, "model_calls": calls, "model_samples": samples}
+    return _per_sample(scores, x_np.shape[0], metric), prof
+
+# ------------------------ Parallel engine ------------------------ #
+_WORKER_MODEL = None
+
+def _init_worker(model: torch.nn.Module, threads: int, adapter: bool) -> None:
+    """TR: Süreç başına bir kez: model + iş parçacığı sayısı | EN: Once per process: model + thread count"""
+    global _WORKER_MODEL
+    torch.set_num_threads(threads)
+    _WORKER_MODEL = ClassScoreAdapter(model.eval()) if adapter else model.eval()
+
+def _attach(desc) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    name, shape, dtype = desc
+    shm = shared_memory.SharedMemory(name=name)   # spawn workers share the parent's tracker; the parent unlinks
+    arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    arr.setflags(write=False)  # shared by all metrics: read-only
+    return shm, arr
+
+def _process_task(name: str, descs, explain: Optional[dict]) -> Tuple[str, np.ndarray, Dict[str, float]]:
+    shms, arrs = zip(*(_attach(d) for d in descs))
+    try:
+        score, prof = _score_metric(name, _WORKER_MODEL, *arrs, explain)
+    finally:
+        del arrs
+        for shm in shms: shm.close()
+    return name, score, prof
+
+class MetricEngine:
+    """
+    TR: Bağımsız metrikleri iş parçacığı veya süreç havuzunda eşzamanlı çalıştırır.
+        - "thread": diziler doğrudan paylaşılır (torch/numpy GIL'i bırakır).
+        - "process": model her sürece bir kez gönderilir; x/y/a her batch'te paylaşımlı belleğe
+          bir kez kopyalanır (pickle edilmez).
+        adapter=True: Quantus'a ClassScoreAdapter verilir; thread havuzunda (workers>1) metriklerin
+        model çağrıları BatchCoalescer ile büyük batch'lerde birleştirilir.
+        method/xai_kw: etkin XAI yöntemi; Continuity ve MPRT açıklamaları explain_xai ile yeniden üretir.
+    EN: Runs independent metrics concurrently on a thread or process pool.
+        - "thread": arrays are shared directly (torch/numpy release the GIL).
+        - "process": the model is sent once per worker; x/y/a are copied once per batch into
+          shared memory (never pickled).
+        adapter=True: Quantus gets a ClassScoreAdapter; on a thread pool (workers>1) the metrics'
+        model calls are merged into large batches by a BatchCoalescer.
+        method/xai_kw: the active XAI method; Continuity and MPRT regenerate explanations with explain_xai.
+    """
+    def __init__(self, model: torch.nn.Module, workers: int=0, backend: str="thread",
+                 metrics: str | Sequence[str] | None=None, adapter: bool=True,
+                 coalesce_batch: int=64, coalesce_wait_ms: float=2.0, method: Optional[str]=None,
+                 xai_kw: Optional[dict]=None):
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Unknown metric backend: {backend}")
+        self.model, self.workers, self.backend = model, int(workers), backend
+        self.metrics = resolve_metrics(metrics)
+        self.adapter = adapter
+        self.method, self.xai_kw = method, dict(xai_kw or {})
+        self._pool = None
+        self.coalescer: Optional[BatchCoalescer] = None
+        self._qmodel = model
+        if adapter:
+            base = ClassScoreAdapter(model)
+            if backend == "thread" and self.workers > 1:
+                self.coalescer = BatchCoalescer(base.scores, coalesce_batch, coalesce_wait_ms)
+            self._qmodel = ClassScoreAdapter(model, self.coalescer)
+        if self.workers > 0 and backend == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        elif self.workers > 0:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            cpu_model = copy.deepcopy(model).cpu()
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"),
+                                             initializer=_init_worker, initargs=(cpu_model, threads, adapter))
+
+    def run(self, inputs: torch.Tensor, masks: torch.Tensor, atts: torch.Tensor, target_class: int=1,
+            names: Optional[Sequence[str]]=None, per_sample: bool=False):
+        """
+        TR: Seçili metrikleri hesaplar -> (skorlar, profil {saniye, model_calls, model_samples}).
+            per_sample=True ise skorlar batch ortalaması yerine [B] dizileridir.
+        EN: Computes the selected metrics -> (scores, profile {seconds, model_calls, model_samples}).
+            With per_sample=True scores are [B] arrays instead of batch means.
+        """
+        names = resolve_metrics(names) if names is not None else self.metrics
+        arrays = _prepare(inputs, masks, atts, target_class, self.adapter)   # x, y, a, s
+        explain = dict(self.xai_kw, method=self.method, target_class=target_class) if self.method else None
+        out: Dict[str, Tuple[np.ndarray, Dict[str, float]]] = {}
+        if self._pool is None:
+            for n in names: out[n] = _score_metric(n, self._qmodel, *arrays, explain)
+        elif self.backend == "thread":
+            futs = {self._pool.submit(_score_metric, n, self._qmodel, *arrays, explain): n for n in names}
+            for f in as_completed(futs): out[futs[f]] = f.result()
+        else:
+            shms, descs = [], []
+            try:
+                for arr in arrays:
+                    arr = np.ascontiguousarray(arr)
+                    shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+                    np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[...] = arr
+                    shms.append(shm); descs.append((shm.name, arr.shape, arr.dtype.str))
+                futs = [self._pool.submit(_process_task, n, descs, explain) for n in names]
+                for f in as_completed(futs):
+                    n, score, prof = f.result(); out[n] = (score, prof)
+            finally:
+                for shm in shms: shm.close(); shm.unlink()
+        results = {n: (out[n][0] if per_sample else float(np.mean(out[n][0]))) for n in names}
+        profile = {n: out[n][1] for n in names}
+        return results, profile
+
+    def close(self) -> None:
+        if self._pool is not None: self._pool.shutdown(); self._pool = None
+        if self.coalescer is not None:
+            c = self.coalescer; c.close(); self.coalescer = None
+            logging.info("Metric model calls: %d coalesced into %d forward passes", c.calls, c.forwards)
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
 def compute_all_metrics(
     model: torch.nn.Module,
     inputs: torch.Tensor,           # [B,3,H,W], 0..1
     masks: torch.Tensor,            # [B,1,H,W], class id (0/1)
-    atts: torch.Tensor,             # [B,1,H,W], 0..255 (will be normalized)
-    target_class: int = 1
-) -> Dict[str, float]:
+    atts: torch.Tensor,             # [B,1,H,W], uint8 0..255 or float 0..1
+    target_class: int = 1,
+    engine: Optional[MetricEngine] = None,
+    metrics: str | Sequence[str] | None = None,
+    return_profile: bool = False,
+    per_sample: bool = False,
+    method: Optional[str] = None,
+    xai_kw: Optional[dict] = None
+):
     """
-    TR: 10 metriği bir arada hesaplar, ortalama döndürür.
-    EN: Computes all 10 metrics, returns mean per metric.
+    TR: Metrikleri (varsayılan: 10'u da) hesaplar, ortalama döndürür (engine verilirse paralel).
+        metrics: isim/preset listesi, örn. "cheap" veya "faithfulness,MPRT".
+        method/xai_kw: atıfları üreten XAI yöntemi (Continuity/MPRT yeniden açıklar; engine verilirse onunki).
+    EN: Computes the metrics (default: all 10), returns mean per metric (in parallel if an engine is given).
+        metrics: names/presets, e.g. "cheap" or "faithfulness,MPRT".
+        method/xai_kw: the XAI method that produced atts (Continuity/MPRT re-explain; the engine's if given).
+    Returns: {metric: score}, or ({metric: score}, {metric: {seconds, model_calls, model_samples}});
+             score is a [B] array instead of the mean if per_sample
     """
-    x = inputs.detach()
-    y = (masks==target_class).float()  # binary map for class
-    a = atts.float()/255.0
-
-    x_np = _to_numpy(x)
-    y_np = _to_numpy(y)
-    a_np = _to_numpy(a)
-
-    # Common kwargs for quantus
-    common = dict(
-        nr_samples=10,    # some metrics use sampling
-        abs=True,
-        normalise=True
-    )
-
-    results = {}
-
-    results["Continuity"] = np.mean( Continuity(**common)(model=model, x=x_np, y=y_np, a=a_np) )
-    results["FaithfulnessEstimate"] = np.mean( FaithfulnessEstimate(**common)(model=model, x=x_np, y=y_np, a=a_np) )
-    results["AUC"] = np.mean( AUC(**common)(model=model, x=x_np, y=y_np, a=a_np) )
-    results["Sparseness"] = np.mean( Sparseness(**common)(model=model, x=x_np, y=y_np, a=a_np) )
-    results["Complexity"] = np.mean( Complexity(**common)(model=model, x=x_np, y=y_np, a=a_np) )
-    results["RRA"] = np.mean( RelevanceRankAccuracy(**common)(model=model, x=x_np, y=y_np, a=a_np) )
-    results["RMA"] = np.mean( RelevanceMassAccuracy(**common)(model=model, x=x_np, y=y_np, a=a_np) )
-    results["FaithfulnessCorr"] = np.mean( FaithfulnessCorrelation(**common)(model=model, x=x_np, y=y_np, a=a_np) )
-    results["Infidelity"] = np.mean( Infidelity(**common)(model=model, x=x_np, y=y_np, a=a_np) )
-
-    # MPRT returns several values across layers; we summarise with mean.
-    mprt_scores = ModelParameterRandomisation(**common)(model=model, x=x_np, y=y_np, a=a_np)
-    results["MPRT"] = float(np.mean(mprt_scores))
-
-    return results
+    engine = engine or MetricEngine(model, metrics=metrics, method=method, xai_kw=xai_kw)
+    results, profile = engine.run(inputs, masks, atts, target_class,
+                                  names=metrics if metrics is not None else None, per_sample=per_sample)
+    return (results, profile) if return_profile else results